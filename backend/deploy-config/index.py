@@ -1,7 +1,107 @@
 import json
 import os
+import time
+import threading
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from decimal import Decimal
+
+
+# JSON-ответы: orjson, если пакет установлен, иначе стандартный json с тем же результатом.
+# Строки RealDictCursor сериализуются как обычные dict, даты — в ISO 8601, Decimal — строкой
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    """Значения вне типов JSON: Decimal строкой без потери точности, даты через isoformat()"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def json_dumps(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
 
 
 def handler(event: dict, context) -> dict:
@@ -24,7 +124,7 @@ def handler(event: dict, context) -> dict:
         dsn = os.environ['DATABASE_URL']
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
         
-        conn = psycopg2.connect(dsn)
+        conn = db_connect(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # GET - получить все конфиги или один по имени
@@ -67,7 +167,7 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Конфиг не найден'}),
+                        'body': json_dumps({'error': 'Конфиг не найден'}),
                         'isBase64Encoded': False
                     }
                 
@@ -81,7 +181,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(config_dict, default=str),
+                    'body': json_dumps(config_dict),
                     'isBase64Encoded': False
                 }
             else:
@@ -102,7 +202,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(configs_list, default=str),
+                    'body': json_dumps(configs_list),
                     'isBase64Encoded': False
                 }
         
@@ -117,7 +217,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': f'Обязательные поля: {", ".join(missing)}'}),
+                    'body': json_dumps({'error': f'Обязательные поля: {", ".join(missing)}'}),
                     'isBase64Encoded': False
                 }
             
@@ -197,7 +297,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(config_dict, default=str),
+                'body': json_dumps(config_dict),
                 'isBase64Encoded': False
             }
         
@@ -211,7 +311,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Укажи old_name конфига'}),
+                    'body': json_dumps({'error': 'Укажи old_name конфига'}),
                     'isBase64Encoded': False
                 }
             
@@ -257,7 +357,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Нет полей для обновления'}),
+                    'body': json_dumps({'error': 'Нет полей для обновления'}),
                     'isBase64Encoded': False
                 }
             
@@ -291,7 +391,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Конфиг не найден'}),
+                    'body': json_dumps({'error': 'Конфиг не найден'}),
                     'isBase64Encoded': False
                 }
             
@@ -304,7 +404,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(config_dict, default=str),
+                'body': json_dumps(config_dict),
                 'isBase64Encoded': False
             }
         
@@ -317,7 +417,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Укажи name конфига'}),
+                    'body': json_dumps({'error': 'Укажи name конфига'}),
                     'isBase64Encoded': False
                 }
             
@@ -333,14 +433,14 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Конфиг не найден'}),
+                    'body': json_dumps({'error': 'Конфиг не найден'}),
                     'isBase64Encoded': False
                 }
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'message': f'Конфиг {name} удалён'}),
+                'body': json_dumps({'success': True, 'message': f'Конфиг {name} удалён'}),
                 'isBase64Encoded': False
             }
         
@@ -348,7 +448,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Метод не поддерживается'}),
+                'body': json_dumps({'error': 'Метод не поддерживается'}),
                 'isBase64Encoded': False
             }
         
@@ -356,18 +456,18 @@ def handler(event: dict, context) -> dict:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Секрет не найден: {str(e)}'}),
+            'body': json_dumps({'error': f'Секрет не найден: {str(e)}'}),
             'isBase64Encoded': False
         }
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            db_release(conn)
\ No newline at end of file
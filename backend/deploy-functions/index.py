@@ -2,8 +2,116 @@ import json
 import os
 import requests
 import base64
+import gzip
 import time
 from pathlib import Path
+from decimal import Decimal
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# JSON-ответы: orjson, если пакет установлен, иначе стандартный json с тем же результатом.
+# Строки RealDictCursor сериализуются как обычные dict, даты — в ISO 8601, Decimal — строкой
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    """Значения вне типов JSON: Decimal строкой без потери точности, даты через isoformat()"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def json_dumps(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+# Сжатие ответов: тело от RESPONSE_COMPRESS_MIN_BYTES сжимается brotli или gzip, если клиент
+# принимает кодировку (Accept-Encoding), и отдаётся base64 с заголовком Content-Encoding.
+# RESPONSE_COMPRESSION — допустимые кодировки в порядке предпочтения, пустое значение выключает сжатие
+RESPONSE_COMPRESSION = [
+    encoding.strip() for encoding in os.environ.get('RESPONSE_COMPRESSION', 'br,gzip').split(',') if encoding.strip()
+]
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+
+
+def get_request_header(event: dict, name: str) -> str:
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return ''
+
+
+def accepted_encoding(accept_encoding: str) -> str:
+    """Первая кодировка из RESPONSE_COMPRESSION, которую клиент принимает с q > 0"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+    for encoding in RESPONSE_COMPRESSION:
+        if encoding == 'br' and brotli is None:
+            continue
+        if encoding in ('br', 'gzip') and weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return ''
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response: dict, accept_encoding: str) -> dict:
+    """Сжать тело ответа, если оно достаточно большое и клиент принимает сжатие"""
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if response.get('isBase64Encoded') or not isinstance(body, str) or 'Content-Encoding' in headers:
+        return response
+    raw = body.encode('utf-8')
+    if len(raw) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**headers, 'Vary': 'Accept-Encoding'}
+    encoding = accepted_encoding(accept_encoding)
+    if not encoding:
+        return {**response, 'headers': headers}
+    compressed = compress_body(raw, encoding)
+
+    headers['Content-Encoding'] = encoding
+    # Сжатое представление побайтно отличается от исходного — ETag становится слабым
+    if headers.get('ETag') and not headers['ETag'].startswith('W/'):
+        headers['ETag'] = 'W/' + headers['ETag']
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
 
 
 def handler(event: dict, context) -> dict:
@@ -342,10 +450,10 @@ def handler(event: dict, context) -> dict:
             except Exception as gh_error:
                 logs.append(f"⚠️ Ошибка обновления GitHub: {str(gh_error)}")
         
-        return {
+        return compress_response({
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
+            'body': json_dumps({
                 'success': True,
                 'deployed': deployed_functions,
                 'function_urls': function_urls,
@@ -356,12 +464,12 @@ def handler(event: dict, context) -> dict:
                 'deployed_count': offset + len(deployed_functions)
             }),
             'isBase64Encoded': False
-        }
+        }, get_request_header(event, 'Accept-Encoding'))
         
     except Exception as e:
-        return {
+        return compress_response({
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e), 'logs': logs if 'logs' in locals() else []}),
+            'body': json_dumps({'error': str(e), 'logs': logs if 'logs' in locals() else []}),
             'isBase64Encoded': False
-        }
\ No newline at end of file
+        }, get_request_header(event, 'Accept-Encoding'))
\ No newline at end of file
@@ -1,9 +1,461 @@
 import json
+import base64
 import os
+import re
+import gzip
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import paramiko
 import time
+import threading
+from decimal import Decimal
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# JSON-ответы: orjson, если пакет установлен, иначе стандартный json с тем же результатом.
+# Строки RealDictCursor сериализуются как обычные dict, даты — в ISO 8601, Decimal — строкой
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    """Значения вне типов JSON: Decimal строкой без потери точности, даты через isoformat()"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def json_dumps(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+# Снапшоты квизов: дерево квиза из quiz_snapshots в том же виде, что отдаёт quiz-api
+# (action=get), выгружается в /var/www/<domain>/shared/quiz и отдаётся nginx как статика.
+# Каталог общий для всех релизов: переключение и откат релиза снапшоты не трогают
+QUIZ_SLUG_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+QUIZ_VERSIONS_SQL = '''
+    SELECT slug, version
+    FROM {schema}.quiz_snapshots
+'''
+
+QUIZ_SNAPSHOTS_SQL = '''
+    SELECT slug, version, payload::text AS quiz
+    FROM {schema}.quiz_snapshots
+    WHERE slug = ANY(%s)
+'''
+
+
+def quiz_snapshot_files(slug: str, body: bytes) -> list:
+    """Файлы снапшота: исходный JSON и заранее сжатые варианты для gzip_static/brotli_static"""
+    files = [
+        (f'{slug}.json', body),
+        (f'{slug}.json.gz', gzip.compress(body, compresslevel=9, mtime=0)),
+    ]
+    if brotli:
+        files.append((f'{slug}.json.br', brotli.compress(body, quality=11)))
+    return files
+
+
+def export_quiz_snapshots(ssh, domain: str, dsn: str, schema: str, logs: list, force: bool = False) -> dict:
+    """Выгрузить снапшоты активных квизов в /var/www/<domain>/shared/quiz.
+    Перезаписываются только квизы, чья версия отличается от manifest.json прошлой выгрузки,
+    файлы выключенных и удалённых квизов убираются"""
+    quiz_dir = f"/var/www/{domain}/shared/quiz"
+    staging_dir = f"/tmp/quiz_export_{domain.replace('.', '_')}"
+
+    manifest = {}
+    if not force:
+        stdin, stdout, stderr = ssh.exec_command(f"cat {quiz_dir}/manifest.json 2>/dev/null", timeout=30)
+        try:
+            manifest = json.loads(stdout.read().decode('utf-8') or '{}')
+        except ValueError:
+            manifest = {}
+
+    conn = db_connect(dsn)
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(QUIZ_VERSIONS_SQL.format(schema=schema))
+        versions = {}
+        for row in cur.fetchall():
+            if QUIZ_SLUG_RE.match(row['slug']):
+                versions[row['slug']] = row['version']
+            else:
+                logs.append(f"⚠️ Квиз '{row['slug']}' пропущен: slug не подходит для имени файла")
+        changed = [slug for slug, version in versions.items() if manifest.get(slug) != version]
+        snapshots = []
+        if changed:
+            cur.execute(QUIZ_SNAPSHOTS_SQL.format(schema=schema), (changed,))
+            snapshots = cur.fetchall()
+        cur.close()
+    finally:
+        db_release(conn)
+
+    # Версия берётся из того же запроса, что и дерево: квиз мог измениться между запросами
+    for row in snapshots:
+        versions[row['slug']] = row['version']
+    removed = [slug for slug in manifest if slug not in versions]
+
+    if not snapshots and not removed:
+        logs.append(f"✅ Снапшоты квизов актуальны ({len(versions)} шт.)")
+        return {'exported': 0, 'removed': 0, 'total': len(versions)}
+
+    stdin, stdout, stderr = ssh.exec_command(f"rm -rf {staging_dir} && mkdir -p {staging_dir}", timeout=30)
+    stdout.channel.recv_exit_status()
+
+    sftp = ssh.open_sftp()
+    for row in snapshots:
+        for name, data in quiz_snapshot_files(row['slug'], row['quiz'].encode('utf-8')):
+            with sftp.file(f"{staging_dir}/{name}", 'wb') as f:
+                f.write(data)
+    with sftp.file(f"{staging_dir}/manifest.json", 'w') as f:
+        f.write(json_dumps(versions))
+    sftp.close()
+
+    # Старый .br без brotli на этой выгрузке отдавал бы прежнюю версию квиза
+    stale_files = [f"{quiz_dir}/{slug}.json{ext}" for slug in removed for ext in ('', '.gz', '.br')]
+    if not brotli:
+        stale_files += [f"{quiz_dir}/{row['slug']}.json.br" for row in snapshots]
+
+    publish_cmd = f"sudo mkdir -p {quiz_dir} && sudo cp {staging_dir}/* {quiz_dir}/"
+    if stale_files:
+        publish_cmd += f" && sudo rm -f {' '.join(stale_files)}"
+    publish_cmd += f" && sudo chown -R www-data:www-data {quiz_dir} && rm -rf {staging_dir}"
+    stdin, stdout, stderr = ssh.exec_command(publish_cmd, timeout=60)
+    if stdout.channel.recv_exit_status() != 0:
+        raise RuntimeError(f"Не удалось опубликовать снапшоты квизов: {stderr.read().decode('utf-8')}")
+
+    logs.append(f"✅ Снапшоты квизов: обновлено {len(snapshots)}, удалено {len(removed)}, всего {len(versions)}")
+    if not brotli:
+        logs.append("⚠️ Модуль brotli недоступен — выгружены только .json и .json.gz")
+    return {'exported': len(snapshots), 'removed': len(removed), 'total': len(versions)}
+
+
+# Удалённый план деплоя: шаги собираются в один bash-скрипт и выполняются через один
+# exec_command вместо отдельного SSH-канала и round trip на каждую команду.
+# По каждому шагу скрипт печатает строку: маркер, имя, код выхода (или skip),
+# длительность в мс и хвост вывода в base64 — handler разбирает их обратно в logs
+DEPLOY_STEP_MARKER = '@@deploy-step'
+DEPLOY_STEP_TAIL_BYTES = int(os.environ.get('DEPLOY_STEP_TAIL_BYTES', '4000'))
+DEPLOY_PLAN_TIMEOUT = int(os.environ.get('DEPLOY_PLAN_TIMEOUT', '600'))
+
+# Общий стор пакетов на VM для всех доменов: повторяющиеся зависимости второго и следующих
+# проектов ставятся с локального диска. npm — общий content-addressable кэш npm (--cache,
+# --prefer-offline), pnpm — общий стор pnpm с плоским node_modules из жёстких ссылок
+DEPLOY_PACKAGE_STORE = os.environ.get('DEPLOY_PACKAGE_STORE', 'npm')  # 'npm' | 'pnpm'
+DEPLOY_STORE_DIR = os.environ.get('DEPLOY_STORE_DIR', '/var/cache/deploy-store')
+DEPLOY_PNPM_VERSION = os.environ.get('DEPLOY_PNPM_VERSION', '9')
+
+
+def dependency_install_script(store_dir: str, mode: str = DEPLOY_PACKAGE_STORE) -> str:
+    """Bash-блок установки зависимостей для скрипта сборки (использует step из него)"""
+    if mode == 'pnpm':
+        flags = (f"--prefer-offline --store-dir {store_dir}/pnpm "
+                 "--config.node-linker=hoisted --config.package-import-method=auto")
+        return f"""command -v pnpm > /dev/null || step "Установка pnpm" sudo npm install -g pnpm@{DEPLOY_PNPM_VERSION} --no-audit --no-fund
+    if [ ! -f pnpm-lock.yaml ] && [ -f package-lock.json ]; then
+        step "pnpm import" pnpm import
+    fi
+    if [ -f pnpm-lock.yaml ]; then
+        step "pnpm install" pnpm install --frozen-lockfile {flags}
+    else
+        step "pnpm install" pnpm install {flags}
+    fi"""
+    flags = f"--no-audit --no-fund --prefer-offline --cache {store_dir}/npm"
+    return f"""if [ -f package-lock.json ] || [ -f npm-shrinkwrap.json ]; then
+        step "npm ci" npm ci {flags}
+    else
+        step "npm install" npm install {flags}
+    fi"""
+
+
+# Релизы: каждая сборка кладётся в свой каталог /var/www/<domain>/releases/<sha>-<unix-время>,
+# nginx смотрит в симлинк current, который переключается атомарно (новый симлинк + rename
+# поверх старого) только на уже готовый каталог. Каталоги релизов после публикации
+# не перемещаются и не перезаписываются, даже при повторной сборке того же коммита.
+# Хранятся DEPLOY_KEEP_RELEASES последних релизов, action=rollback возвращает current
+# на предыдущий (или указанный) релиз без пересборки
+DEPLOY_KEEP_RELEASES = max(1, int(os.environ.get('DEPLOY_KEEP_RELEASES', '5')))
+RELEASE_RE = re.compile(r'^[0-9a-f]{4,40}(-[0-9]+)?$')
+
+
+def release_sha(release: str):
+    """SHA коммита из имени релиза или ссылки current (releases/<sha>-<время>), иначе None"""
+    sha = release.rstrip('/').rsplit('/', 1)[-1].split('-', 1)[0]
+    return sha if re.match(r'^[0-9a-f]{40}$', sha) else None
+
+
+def release_label(release: str) -> str:
+    """Короткое имя релиза для логов: SHA до 7 символов и время сборки (UTC)"""
+    sha, _, built_at = release.partition('-')
+    if not built_at.isdigit():
+        return sha[:7]
+    return f"{sha[:7]} ({time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(built_at)))})"
+
+
+def activate_release_script(www_dir: str, release: str) -> str:
+    """Bash: атомарно направить current на releases/<release> (release может быть переменной shell)"""
+    return (f'sudo ln -sfn "releases/{release}" {www_dir}/current.tmp && '
+            f'sudo mv -T {www_dir}/current.tmp {www_dir}/current')
+
+
+def rollback_script(www_dir: str, release: str = None) -> str:
+    """Bash-шаг отката: current -> указанный релиз (по префиксу SHA или полному имени, из
+    нескольких сборок одного коммита берётся самая свежая) или релиз, собранный перед текущим, —
+    повторные откаты идут дальше в прошлое. Код 3 — релиз не найден.
+    Вывод: строки "release <имя>" (от новых к старым) и последняя строка: rollback <было> <стало>"""
+    if release:
+        choose = f"""TARGET=$(printf '%s\\n' "$RELEASES" | grep '^{release}' || true)
+if [ -z "$TARGET" ] || [ "$(printf '%s\\n' "$TARGET" | cut -d- -f1 | sort -u | wc -l)" != 1 ]; then
+    echo "Релиз {release} не найден или префикс неоднозначен"
+    exit 3
+fi
+TARGET=$(printf '%s\\n' "$TARGET" | head -n 1)"""
+    else:
+        # Каталоги релизов при откате не меняются, поэтому порядок ls -t — порядок сборок
+        choose = """if ! printf '%s\\n' "$RELEASES" | grep -q -x -F "$CURRENT"; then
+    echo "current ($CURRENT) не указывает на релиз — откатываться не от чего"
+    exit 3
+fi
+TARGET=$(printf '%s\\n' "$RELEASES" | awk -v current="$CURRENT" 'found {print; exit} $0 == current {found = 1}')
+if [ -z "$TARGET" ]; then
+    echo "Нет релиза старше $CURRENT для отката"
+    exit 3
+fi"""
+    return f"""if [ ! -d {www_dir}/releases ]; then
+    echo "Релизов нет: сначала выполни деплой"
+    exit 3
+fi
+cd {www_dir}/releases
+CURRENT=$(basename "$(readlink {www_dir}/current)")
+RELEASES=$(ls -1t | grep -v '\\.tmp$' || true)
+{choose}
+{activate_release_script(www_dir, '$TARGET')}
+printf 'release %s\\n' $RELEASES
+echo "rollback $CURRENT $TARGET"
+"""
+
+
+# Ветка или тег для деплоя (body.ref) — подставляется в shell-скрипт, поэтому строго по шаблону
+GIT_REF_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._/-]{0,254}$')
+
+# Коммит, который сейчас собирается (pending_*), и коммит, на который смотрит current (deployed_*).
+# deployed_sha пишется только по симлинку current — то есть после успешной публикации релиза:
+# при следующем деплое, откате или проверке статуса (deploy-status)
+PENDING_SHA_SQL = '''
+    UPDATE {schema}.deploy_configs
+    SET pending_sha = %(sha)s, pending_ref = %(ref)s
+    WHERE id = %(id)s
+'''
+
+DEPLOYED_SHA_SQL = '''
+    UPDATE {schema}.deploy_configs
+    SET deployed_sha = %(sha)s,
+        deployed_ref = CASE WHEN pending_sha = %(sha)s THEN pending_ref ELSE deployed_ref END,
+        deployed_at = CURRENT_TIMESTAMP
+    WHERE id = %(id)s AND deployed_sha IS DISTINCT FROM %(sha)s
+'''
+
+
+def update_deploy_config_sha(dsn: str, schema: str, sql: str, params: dict, logs: list):
+    """Записать SHA в deploy_configs; без миграций V0018/V0019 деплой не падает, а пишет предупреждение"""
+    conn = db_connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(sql.format(schema=schema), params)
+        conn.commit()
+        cur.close()
+    except psycopg2.Error as sha_error:
+        conn.rollback()
+        logs.append(f"⚠️ SHA деплоя не записан (нужны миграции V0018 и V0019): {str(sha_error).strip()}")
+    finally:
+        db_release(conn)
+
+
+def record_deployed_sha(dsn: str, schema: str, config_id: int, sha: str, logs: list):
+    """Запомнить коммит, на который смотрит current (ветка берётся из pending_ref, если это он)"""
+    update_deploy_config_sha(dsn, schema, DEPLOYED_SHA_SQL, {'sha': sha, 'id': config_id}, logs)
+
+
+def record_pending_sha(dsn: str, schema: str, config_id: int, sha: str, ref: str, logs: list):
+    """Запомнить коммит, выгруженный на VM и отправленный в сборку"""
+    update_deploy_config_sha(dsn, schema, PENDING_SHA_SQL, {'sha': sha, 'ref': ref, 'id': config_id}, logs)
+
+REMOTE_PLAN_PRELUDE = r'''
+STEP_MARKER='{marker}'
+STEP_TAIL={tail}
+declare -A STEP_STATUS
+
+# run_step <имя> <таймаут, с> <fatal 0|1> <требуемый шаг|-> <функция>
+run_step() {{
+    local name="$1" limit="$2" fatal="$3" requires="$4" fn="$5" out started code
+    if [ "$requires" != "-" ] && [ "${{STEP_STATUS[$requires]:-}}" != "0" ]; then
+        STEP_STATUS[$name]=skip
+        printf '%s\t%s\tskip\t0\t\n' "$STEP_MARKER" "$name"
+        return 0
+    fi
+    out=$(mktemp)
+    started=$(date +%s%3N)
+    timeout "$limit" bash -c "$fn" > "$out" 2>&1 < /dev/null
+    code=$?
+    printf '%s\t%s\t%s\t%s\t%s\n' "$STEP_MARKER" "$name" "$code" "$(( $(date +%s%3N) - started ))" \
+        "$(tail -c "$STEP_TAIL" "$out" | base64 -w0)"
+    rm -f "$out"
+    STEP_STATUS[$name]=$code
+    if [ "$code" != "0" ] && [ "$fatal" = "1" ]; then
+        exit "$code"
+    fi
+}}
+'''
+
+
+def remote_step(name: str, script: str, timeout: int = 60, fatal: bool = False, requires: str = None) -> dict:
+    """Шаг удалённого плана. fatal — при ошибке план прерывается,
+    requires — шаг пропускается, если указанный шаг не завершился успешно"""
+    return {'name': name, 'script': script, 'timeout': timeout, 'fatal': fatal, 'requires': requires}
+
+
+def compile_remote_plan(steps: list) -> str:
+    """Собрать шаги в один bash-скрипт. Каждый шаг — экспортируемая функция, которая
+    выполняется в отдельном bash под timeout с set -e, вывод шага не смешивается с маркерами"""
+    parts = ['#!/bin/bash', REMOTE_PLAN_PRELUDE.format(marker=DEPLOY_STEP_MARKER, tail=DEPLOY_STEP_TAIL_BYTES)]
+    for i, step in enumerate(steps):
+        fn = f"step_{i}"
+        parts.append(f"{fn}() {{\nset -e\n{step['script']}\n}}\nexport -f {fn}")
+    for i, step in enumerate(steps):
+        parts.append(
+            f"run_step {step['name']} {step['timeout']} {int(step['fatal'])} {step['requires'] or '-'} step_{i}"
+        )
+    return '\n'.join(parts) + '\n'
+
+
+def parse_remote_plan_output(output: str) -> dict:
+    """Строки-маркеры вывода плана -> {имя шага: результат} в порядке выполнения"""
+    results = {}
+    for line in output.splitlines():
+        if not line.startswith(DEPLOY_STEP_MARKER + '\t'):
+            continue
+        fields = line.split('\t')
+        if len(fields) < 5:
+            continue
+        _, name, exit_code, duration_ms, tail = fields[:5]
+        results[name] = {
+            'step': name,
+            'exit_code': None if exit_code == 'skip' else int(exit_code),
+            'skipped': exit_code == 'skip',
+            'duration_ms': int(duration_ms),
+            'output': base64.b64decode(tail).decode('utf-8', 'replace') if tail else ''
+        }
+    return results
+
+
+def run_remote_plan(ssh, steps: list, timeout: int = DEPLOY_PLAN_TIMEOUT) -> tuple:
+    """Выполнить план через один канал: скрипт передаётся в stdin `bash -s`
+    (шаги читают stdin из /dev/null). Возвращает (результаты шагов, код выхода, мс)"""
+    started = time.monotonic()
+    stdin, stdout, stderr = ssh.exec_command('bash -s', timeout=timeout)
+    stdin.write(compile_remote_plan(steps))
+    stdin.channel.shutdown_write()
+    output = stdout.read().decode('utf-8', 'replace')
+    exit_code = stdout.channel.recv_exit_status()
+    return parse_remote_plan_output(output), exit_code, int((time.monotonic() - started) * 1000)
+
+
+def step_succeeded(results: dict, name: str) -> bool:
+    return results.get(name, {}).get('exit_code') == 0
+
+
+def step_tail(result: dict, lines: int = 10) -> list:
+    """Последние строки вывода шага для логов"""
+    return [line for line in result.get('output', '').strip().split('\n')[-lines:] if line]
+
+
+def format_duration(duration_ms: int) -> str:
+    return f"{duration_ms} мс" if duration_ms < 1000 else f"{round(duration_ms / 1000, 1)} с"
 
 
 def handler(event: dict, context) -> dict:
@@ -29,13 +481,31 @@ def handler(event: dict, context) -> dict:
         body = json.loads(body_str) if isinstance(body_str, str) else body_str
         
         config_name = body.get('config_name')
-        action = body.get('action', 'deploy')  # 'deploy' | 'setup_ssl'
+        action = body.get('action', 'deploy')  # 'deploy' | 'setup_ssl' | 'export_quizzes' | 'rollback'
+        git_ref = body.get('ref') or None  # ветка или тег, по умолчанию — ветка репозитория по умолчанию
+        release = body.get('release') or None  # для rollback: SHA или его префикс, по умолчанию предыдущий
         
         if not config_name:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Укажи config_name'}),
+                'body': json_dumps({'error': 'Укажи config_name'}),
+                'isBase64Encoded': False
+            }
+        
+        if git_ref is not None and (not isinstance(git_ref, str) or not GIT_REF_RE.match(git_ref) or '..' in git_ref):
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json_dumps({'error': 'ref должен быть именем ветки или тега'}),
+                'isBase64Encoded': False
+            }
+        
+        if release is not None and (not isinstance(release, str) or not RELEASE_RE.match(release)):
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json_dumps({'error': 'release должен быть SHA коммита или его префиксом (от 4 символов)'}),
                 'isBase64Encoded': False
             }
         
@@ -43,7 +513,7 @@ def handler(event: dict, context) -> dict:
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
         github_token = os.environ.get('GITHUB_TOKEN', '')
         
-        conn = psycopg2.connect(dsn)
+        conn = db_connect(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         cur.execute(
@@ -58,13 +528,13 @@ def handler(event: dict, context) -> dict:
         
         config = cur.fetchone()
         cur.close()
-        conn.close()
+        db_release(conn)
         
         if not config:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': f'Конфиг {config_name} не найден'}),
+                'body': json_dumps({'error': f'Конфиг {config_name} не найден'}),
                 'isBase64Encoded': False
             }
         
@@ -79,7 +549,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'VM не привязана', 'logs': logs}),
+                'body': json_dumps({'error': 'VM не привязана', 'logs': logs}),
                 'isBase64Encoded': False
             }
         
@@ -94,7 +564,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'SSH key missing', 'logs': logs}),
+                'body': json_dumps({'error': 'SSH key missing', 'logs': logs}),
                 'isBase64Encoded': False
             }
         
@@ -115,7 +585,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid SSH key format', 'logs': logs}),
+                'body': json_dumps({'error': 'Invalid SSH key format', 'logs': logs}),
                 'isBase64Encoded': False
             }
         
@@ -135,19 +605,27 @@ def handler(event: dict, context) -> dict:
         if action == 'setup_ssl':
             logs.append("🔒 Режим: только установка SSL")
             logs.append("")
-            # Устанавливаем certbot если нет
-            stdin, stdout, stderr = ssh.exec_command("which certbot 2>/dev/null || echo ''")
-            certbot_path = stdout.read().decode('utf-8').strip()
-            if not certbot_path:
-                logs.append("📦 Устанавливаю certbot...")
-                stdin, stdout, stderr = ssh.exec_command("sudo apt-get update && sudo apt-get install -y certbot python3-certbot-nginx", timeout=120)
-                stdout.channel.recv_exit_status()
-                logs.append("✅ Certbot установлен")
-            logs.append("🔒 Запускаю certbot...")
-            certbot_cmd = f"sudo certbot --nginx -d {domain} --non-interactive --agree-tos --email admin@{domain} 2>&1"
-            stdin, stdout, stderr = ssh.exec_command(certbot_cmd, timeout=120)
-            certbot_out = stdout.read().decode('utf-8')
+            # Установка certbot (если нет) и выпуск сертификата — один удалённый план
+            logs.append("🔒 Запускаю certbot (установлю, если нет)...")
+            results, _, plan_ms = run_remote_plan(ssh, [
+                remote_step(
+                    'certbot_install',
+                    "command -v certbot || { sudo apt-get update && sudo apt-get install -y certbot python3-certbot-nginx; }",
+                    timeout=300
+                ),
+                remote_step(
+                    'certbot',
+                    f"sudo certbot --nginx -d {domain} --non-interactive --agree-tos --email admin@{domain}",
+                    timeout=180, requires='certbot_install'
+                ),
+            ])
             ssh.close()
+            if not step_succeeded(results, 'certbot_install'):
+                logs.append("❌ Не удалось установить certbot:")
+                for line in step_tail(results.get('certbot_install', {})):
+                    logs.append(f"   {line}")
+            certbot_out = results.get('certbot', {}).get('output', '')
+            logs.append(f"⏱ certbot: {format_duration(plan_ms)}")
             logs.append("")
             if 'Successfully received certificate' in certbot_out or 'Certificate not yet due for renewal' in certbot_out:
                 logs.append("✅ SSL сертификат установлен!")
@@ -162,43 +640,73 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'logs': logs, 'url': f"https://{domain}"}),
+                'body': json_dumps({'success': True, 'logs': logs, 'url': f"https://{domain}"}),
+                'isBase64Encoded': False
+            }
+        
+        # Режим "только снапшоты квизов" — вызывается из quiz-api при изменении квизов
+        if action == 'export_quizzes':
+            logs.append("🧩 Режим: только выгрузка снапшотов квизов")
+            try:
+                result = export_quiz_snapshots(ssh, domain, dsn, schema, logs, force=bool(body.get('force')))
+            finally:
+                ssh.close()
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json_dumps({'success': True, 'logs': logs, **result}),
                 'isBase64Encoded': False
             }
         
         project_dir = f"/var/www/{domain}"
         
-        # Проверяем и устанавливаем git если нужно
-        logs.append("🔍 Проверяю git...")
-        stdin, stdout, stderr = ssh.exec_command("which git", timeout=10)
-        git_path = stdout.read().decode('utf-8').strip()
-        
-        if not git_path:
-            logs.append("📦 Устанавливаю git...")
-            stdin, stdout, stderr = ssh.exec_command("sudo apt-get update && sudo apt-get install -y git", timeout=120)
-            exit_code = stdout.channel.recv_exit_status()
-            if exit_code != 0:
-                logs.append(f"❌ Не удалось установить git: {stderr.read().decode('utf-8')}")
+        # Режим "откат" — current переключается на уже собранный релиз, без сборки и git
+        if action == 'rollback':
+            logs.append(f"⏪ Режим: откат на {'релиз ' + release if release else 'предыдущий релиз'}")
+            try:
+                results, _, plan_ms = run_remote_plan(ssh, [
+                    remote_step('rollback', rollback_script(project_dir, release), timeout=30)
+                ])
+            finally:
                 ssh.close()
+            result = results.get('rollback', {})
+            lines = step_tail(result, DEPLOY_KEEP_RELEASES + 20)
+            if result.get('exit_code') != 0:
+                logs.append("❌ Откат не выполнен:")
+                for line in lines:
+                    logs.append(f"   {line}")
                 return {
-                    'statusCode': 500,
+                    'statusCode': 404 if result.get('exit_code') == 3 else 500,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'git installation failed', 'logs': logs}),
+                    'body': json_dumps({'error': lines[-1] if lines else 'rollback failed', 'logs': logs}),
                     'isBase64Encoded': False
                 }
-            logs.append("✅ Git установлен")
-        else:
-            logs.append(f"✅ Git найден: {git_path}")
-        
-        logs.append("")
-        
-        # Клонируем репо
-        logs.append("📥 Клонирую репозиторий...")
+            _, previous_release, current_release = lines[-1].split(' ', 2)
+            releases = [line.split(' ', 1)[1] for line in lines if line.startswith('release ')]
+            logs.append(f"✅ current: {release_label(previous_release)} → {release_label(current_release)} "
+                        f"за {format_duration(plan_ms)}")
+            logs.append("📦 Релизы на сервере (от новых к старым):")
+            for name in releases:
+                logs.append(f"   {release_label(name)}" + (" ← current" if name == current_release else ""))
+            current_sha = release_sha(current_release)
+            if current_sha:
+                record_deployed_sha(dsn, schema, config['id'], current_sha, logs)
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json_dumps({
+                    'success': True,
+                    'logs': logs,
+                    'release': current_release,
+                    'previous_release': previous_release,
+                    'releases': releases
+                }),
+                'isBase64Encoded': False
+            }
         
         # Нормализуем github_repo (может быть полный URL или owner/repo)
         if github_repo.startswith('http://') or github_repo.startswith('https://'):
             # Извлекаем owner/repo из полного URL
-            import re
             match = re.search(r'github\.com[/:]([^/]+/[^/]+?)(?:\.git)?/?$', github_repo)
             if match:
                 github_repo = match.group(1)
@@ -209,82 +717,94 @@ def handler(event: dict, context) -> dict:
         github_repo = github_repo.rstrip('/').rstrip('.git')
         
         clone_url = f"https://{github_token}@github.com/{github_repo}.git" if github_token else f"https://github.com/{github_repo}.git"
-        logs.append(f"   Репозиторий: {github_repo}")
-        
-        commands = [
-            f"sudo rm -rf {project_dir}",
-            f"sudo mkdir -p {project_dir}",
-            f"sudo chown -R {ssh_user}:{ssh_user} {project_dir}",
-            f"git clone {clone_url} {project_dir}",
-        ]
-        
-        for cmd in commands:
-            stdin, stdout, stderr = ssh.exec_command(cmd, timeout=30)
-            exit_code = stdout.channel.recv_exit_status()
-            if exit_code != 0:
-                error = stderr.read().decode('utf-8')
-                logs.append(f"❌ Ошибка: {cmd}")
-                logs.append(f"   {error}")
-                ssh.close()
-                return {
-                    'statusCode': 500,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': error, 'logs': logs}),
-                    'isBase64Encoded': False
-                }
-        
-        logs.append("✅ Репозиторий склонирован")
-        logs.append("")
         
-        # Создаём скрипт деплоя на сервере (запустим в фоне)
+        # Скрипт сборки на сервере (запускается в фоне последним шагом плана).
+        # node_modules переживает деплои: зависимости ставятся заново (npm ci) только когда
+        # меняется хэш lock-файлов, package.json, версии node и режима стора; пакеты берутся
+        # из общего для всех доменов VM стора DEPLOY_STORE_DIR; время каждого шага пишется в лог
+        package_store = DEPLOY_PACKAGE_STORE if DEPLOY_PACKAGE_STORE in ('npm', 'pnpm') else 'npm'
         deploy_script = f"""#!/bin/bash
 set -e
 cd {project_dir}
-echo "📦 npm install..." >> /tmp/deploy_{domain}.log
-npm install >> /tmp/deploy_{domain}.log 2>&1
-echo "✅ Зависимости установлены" >> /tmp/deploy_{domain}.log
-echo "🔨 npm run build..." >> /tmp/deploy_{domain}.log  
-npm run build >> /tmp/deploy_{domain}.log 2>&1
-echo "✅ Проект собран" >> /tmp/deploy_{domain}.log
-echo "📋 Копирую файлы в nginx..." >> /tmp/deploy_{domain}.log
-sudo mkdir -p /var/www/{domain}/html
-sudo cp -r {project_dir}/dist/* /var/www/{domain}/html/
-sudo chown -R www-data:www-data /var/www/{domain}/html
-echo "✅ Файлы скопированы" >> /tmp/deploy_{domain}.log
-echo "✅ Деплой завершён $(date)" >> /tmp/deploy_{domain}.log
+LOG=/tmp/deploy_{domain}.log
+DEPLOY_STARTED=$(date +%s%3N)
+echo "🚀 Сборка $(git rev-parse --short HEAD), $(date)" >> "$LOG"
+
+# step <название> <команда...>: вывод команды и длительность шага — в лог
+step() {{
+    local name="$1" started code
+    shift
+    started=$(date +%s%3N)
+    echo "▶ $name..." >> "$LOG"
+    "$@" >> "$LOG" 2>&1 || {{
+        code=$?
+        echo "❌ $name: код $code за $(( $(date +%s%3N) - started )) мс" >> "$LOG"
+        exit $code
+    }}
+    echo "✅ $name: $(( $(date +%s%3N) - started )) мс" >> "$LOG"
+}}
+
+RELEASE_SHA=$(git rev-parse HEAD)
+RELEASE=$RELEASE_SHA-$(date +%s)
+RELEASES={project_dir}/releases
+
+# Релиз копируется в .tmp, переименовывается в уникальный каталог и только потом включается
+# атомарной заменой симлинка current — current никогда не смотрит на недособранный каталог.
+# step вызывает функцию из списка ||, где set -e не действует, поэтому каждая команда
+# проверяется явно: ошибка копирования не должна дойти до переключения current
+publish() {{
+    sudo mkdir -p "$RELEASES" || return $?
+    sudo cp -r {project_dir}/dist "$RELEASES/$RELEASE.tmp" || return $?
+    sudo chown -R www-data:www-data "$RELEASES/$RELEASE.tmp" || return $?
+    sudo mv -T "$RELEASES/$RELEASE.tmp" "$RELEASES/$RELEASE" || return $?
+    sudo touch "$RELEASES/$RELEASE" || return $?
+    {activate_release_script(project_dir, '$RELEASE')}
+}}
+
+# Остаются {DEPLOY_KEEP_RELEASES} последних релизов, текущий не удаляется никогда;
+# .tmp прерванных сборок старше часа и каталог html от деплоев до релизов больше не нужны
+prune() (
+    CURRENT=$(basename "$(readlink {project_dir}/current)")
+    cd "$RELEASES" || exit $?
+    ls -1t | grep -v -x -F "$CURRENT" | grep -v '\\.tmp$' | tail -n +{DEPLOY_KEEP_RELEASES} | xargs -r sudo rm -rf --
+    find . -maxdepth 1 -name '*.tmp' -mmin +60 -exec sudo rm -rf {{}} +
+    if [ "$CURRENT" != html ]; then
+        sudo rm -rf {project_dir}/html
+    fi
+)
+
+# Хэш зависимостей хранится внутри node_modules: удалили каталог — пропал и хэш
+LOCK_HASH_FILE=node_modules/.deploy-lock-hash
+LOCK_HASH=$( (echo {package_store}; node -v; cat package.json package-lock.json npm-shrinkwrap.json pnpm-lock.yaml bun.lock bun.lockb 2>/dev/null) | sha256sum | cut -d' ' -f1)
+if [ -d node_modules ] && [ "$(cat "$LOCK_HASH_FILE" 2>/dev/null)" = "$LOCK_HASH" ]; then
+    echo "⏭ Зависимости не менялись (lock ${{LOCK_HASH:0:12}}), установка пропущена" >> "$LOG"
+else
+    rm -f "$LOCK_HASH_FILE"
+    # Общий стор на том же диске, что и /var/www, — иначе жёсткие ссылки pnpm станут копиями
+    if [ ! -w {DEPLOY_STORE_DIR} ]; then
+        sudo mkdir -p {DEPLOY_STORE_DIR}
+        sudo chown "$(id -un)" {DEPLOY_STORE_DIR}
+    fi
+    echo "📦 Стор пакетов VM: {DEPLOY_STORE_DIR} ({package_store})" >> "$LOG"
+    {dependency_install_script(DEPLOY_STORE_DIR, package_store)}
+    echo "$LOCK_HASH" > "$LOCK_HASH_FILE"
+fi
+step "npm run build" npm run build
+step "Публикация релиза ${{RELEASE_SHA:0:7}}" publish
+step "Очистка старых релизов" prune
+echo "✅ Деплой завершён $(date), релиз ${{RELEASE_SHA:0:7}}, всего $(( $(date +%s%3N) - DEPLOY_STARTED )) мс" >> "$LOG"
 """
-        
-        # Загружаем скрипт на сервер через SFTP
-        sftp = ssh.open_sftp()
         script_path = f"/tmp/deploy_{domain.replace('.', '_')}.sh"
-        with sftp.file(script_path, 'w') as f:
-            f.write(deploy_script)
-        sftp.close()
-        
-        # Делаем скрипт исполняемым
-        ssh.exec_command(f"chmod +x {script_path}")
-        
-        # Запускаем в фоне (nohup)
-        logs.append("🚀 Запускаю npm install + build в фоновом режиме...")
-        ssh.exec_command(f"nohup bash {script_path} > /dev/null 2>&1 &")
-        time.sleep(1)  # Даём секунду на старт
-        
-        logs.append("✅ Деплой запущен!")
-        logs.append(f"📝 Логи: tail -f /tmp/deploy_{domain}.log")
-        logs.append("")
-        logs.append("⏳ Сборка займёт 2-3 минуты в фоне")
-        logs.append("")
-        
-        # Настраиваем nginx для поддержки нескольких доменов на одном сервере
-        logs.append("⚙️ Настраиваю nginx для домена...")
         
         # Экранируем домен для использования в имени файла
         domain_safe = domain.replace('.', '_').replace('*', '_')
         
+        # @BROTLI_STATIC@ подставляется на сервере: brotli_static есть только при установленном
+        # модуле ngx_brotli — без него nginx -t упадёт
         nginx_config = f"""server {{
     listen 80;
     server_name {domain};
-    root /var/www/{domain}/html;
+    root /var/www/{domain}/current;
     index index.html;
     
     # Логи для этого домена
@@ -295,6 +815,17 @@ echo "✅ Деплой завершён $(date)" >> /tmp/deploy_{domain}.log
         try_files $uri $uri/ /index.html =404;
     }}
     
+    # Снапшоты квизов: заранее сжатые quiz/<slug>.json(.gz|.br) без функции и БД;
+    # сама страница /quiz/<slug> остаётся за SPA в location /
+    location ~ ^/quiz/[A-Za-z0-9_-]+\\.json$ {{
+        root /var/www/{domain}/shared;
+        default_type application/json;
+        gzip_static on;
+        @BROTLI_STATIC@
+        add_header Cache-Control "public, max-age=60, stale-while-revalidate=300";
+        try_files $uri =404;
+    }}
+    
     location ~* \\.(?:css|js|jpg|jpeg|gif|png|ico|svg|woff|woff2|ttf|eot)$ {{
         expires 1y;
         access_log off;
@@ -302,37 +833,158 @@ echo "✅ Деплой завершён $(date)" >> /tmp/deploy_{domain}.log
     }}
 }}"""
         
-        # Создаём конфиг для этого домена
-        stdin, stdout, stderr = ssh.exec_command(f"echo '{nginx_config}' | sudo tee /etc/nginx/sites-available/{domain_safe}")
-        stdout.channel.recv_exit_status()
+        # Весь деплой на сервере — один скрипт и один SSH-канал
+        steps = [
+            remote_step(
+                'git',
+                "command -v git || { sudo apt-get update && sudo apt-get install -y git && command -v git; }",
+                timeout=300, fatal=True
+            ),
+            # Релиз, который сейчас отдаёт nginx, — точка отсчёта для "Изменения" и deployed_sha
+            remote_step('current', f"readlink {project_dir}/current || true", timeout=10),
+            # Исходники: если checkout уже есть — fetch --depth=1 и reset на целевой коммит,
+            # иначе репозиторий создаётся на месте (init + тот же неглубокий fetch). В обоих случаях
+            # node_modules, релизы, current, снапшоты квизов и прежний html не трогаются —
+            # сайт продолжает работать, пока идёт сборка. Последняя строка вывода: "checkout <fetch|clone> <sha>"
+            remote_step('checkout', "\n".join([
+                f"if [ -d {project_dir}/.git ]; then",
+                f"    cd {project_dir}",
+                f"    git remote set-url origin {clone_url}",
+                "    MODE=fetch",
+                "else",
+                f"    sudo mkdir -p {project_dir}",
+                f"    sudo chown {ssh_user}:{ssh_user} {project_dir}",
+                f"    cd {project_dir}",
+                "    sudo find . -mindepth 1 -maxdepth 1 ! -name node_modules ! -name releases ! -name current"
+                " ! -name shared ! -name html -exec rm -rf {} +",
+                "    git init -q",
+                f"    git remote add origin {clone_url}",
+                "    MODE=clone",
+                "fi",
+                f"git fetch --depth=1 --no-tags origin {git_ref or 'HEAD'}",
+                "git reset --hard FETCH_HEAD",
+                "git clean -fd -e /node_modules -e /releases -e /current -e /shared -e /html",
+                'echo "checkout $MODE $(git rev-parse HEAD)"',
+            ]), timeout=180, fatal=True),
+            remote_step('build_start', "\n".join([
+                f"cat > {script_path} <<'DEPLOY_SCRIPT_EOF'",
+                deploy_script.rstrip('\n'),
+                "DEPLOY_SCRIPT_EOF",
+                f"chmod +x {script_path}",
+                f"setsid nohup bash {script_path} > /dev/null 2>&1 < /dev/null &",
+            ]), timeout=30, fatal=True),
+            remote_step('nginx_config', "\n".join([
+                # Первый деплой с релизами: пока сборка не готова, current указывает на прежний html
+                f"if [ ! -e {project_dir}/current ] && [ -d {project_dir}/html ]; then",
+                f"    sudo ln -sfn html {project_dir}/current",
+                "fi",
+                "BROTLI_STATIC=''",
+                "if ls /etc/nginx/modules-enabled/ 2>/dev/null | grep -q brotli || nginx -V 2>&1 | grep -q brotli; then",
+                "    BROTLI_STATIC='brotli_static on;'",
+                "fi",
+                f"sed \"s/@BROTLI_STATIC@/$BROTLI_STATIC/\" <<'NGINX_CONFIG_EOF' | sudo tee /etc/nginx/sites-available/{domain_safe} > /dev/null",
+                nginx_config,
+                "NGINX_CONFIG_EOF",
+                f"sudo ln -sf /etc/nginx/sites-available/{domain_safe} /etc/nginx/sites-enabled/{domain_safe}",
+            ]), timeout=30),
+            remote_step('nginx_test', "sudo nginx -t", timeout=30, requires='nginx_config'),
+            remote_step('nginx_reload', "sudo systemctl reload nginx", timeout=30, requires='nginx_test'),
+            # Пробуем выпустить SSL для домена (если DNS уже настроен)
+            remote_step(
+                'certbot',
+                f"sudo certbot --nginx -d {domain} --non-interactive --agree-tos --email admin@{domain}",
+                timeout=180
+            ),
+            remote_step('sites', "ls -1 /etc/nginx/sites-enabled/ 2>/dev/null | grep -v default || true", timeout=10),
+        ]
         
-        # Активируем конфиг (создаём симлинк)
-        stdin, stdout, stderr = ssh.exec_command(f"sudo ln -sf /etc/nginx/sites-available/{domain_safe} /etc/nginx/sites-enabled/{domain_safe}")
-        stdout.channel.recv_exit_status()
+        logs.append(f"📜 Выполняю план деплоя на сервере ({len(steps)} шагов, один SSH-канал)...")
+        logs.append(f"   Репозиторий: {github_repo}")
+        results, plan_exit, plan_ms = run_remote_plan(ssh, steps)
+        logs.append(f"⏱ План выполнен за {format_duration(plan_ms)}")
+        logs.append("")
+        step_summary = [
+            {key: result[key] for key in ('step', 'exit_code', 'skipped', 'duration_ms')}
+            for result in results.values()
+        ]
         
-        # Проверяем конфигурацию nginx
-        stdin, stdout, stderr = ssh.exec_command("sudo nginx -t")
-        exit_code = stdout.channel.recv_exit_status()
+        # Фатальные шаги: без git и исходников деплой невозможен
+        fatal_errors = {
+            'git': ("Не удалось установить git", 'git installation failed'),
+            'checkout': ("Не удалось получить исходники из репозитория", None),
+            'build_start': ("Не удалось запустить сборку", None),
+        }
+        for name, (message, error) in fatal_errors.items():
+            if step_succeeded(results, name):
+                continue
+            result = results.get(name, {})
+            tail = step_tail(result)
+            if result:
+                logs.append(f"❌ {message} (код {result['exit_code']}, {format_duration(result['duration_ms'])}):")
+            else:
+                logs.append(f"❌ {message}: шаг не выполнен (код плана {plan_exit})")
+            for line in tail:
+                logs.append(f"   {line}")
+            ssh.close()
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json_dumps({
+                    'error': error or ('\n'.join(tail) or message),
+                    'logs': logs,
+                    'steps': step_summary
+                }),
+                'isBase64Encoded': False
+            }
+        
+        git_path = (step_tail(results['git'], 1) or ['git'])[0]
+        logs.append(f"✅ Git: {git_path} ({format_duration(results['git']['duration_ms'])})")
+        checkout = (step_tail(results['checkout'], 1) or [''])[0].split()
+        checkout_mode, pending_sha = (checkout[1], checkout[2]) if len(checkout) == 3 else ('clone', None)
+        checkout_ms = format_duration(results['checkout']['duration_ms'])
+        if checkout_mode == 'fetch':
+            logs.append(f"✅ Исходники обновлены: fetch --depth=1 + reset ({checkout_ms})")
+        else:
+            logs.append(f"✅ Репозиторий склонирован: shallow, одна ветка ({checkout_ms})")
         
-        if exit_code != 0:
-            error = stderr.read().decode('utf-8')
-            logs.append(f"❌ nginx config invalid: {error}")
+        # Что изменилось по сравнению с выложенным релизом: история неглубокая, поэтому
+        # сравнение — ссылкой на GitHub. deployed_sha сверяется с current (прошлая сборка могла
+        # не дойти до публикации), а новый коммит станет deployed_sha только после публикации
+        previous_sha = release_sha((step_tail(results.get('current', {}), 1) or [''])[0])
+        if previous_sha:
+            record_deployed_sha(dsn, schema, config['id'], previous_sha, logs)
+        else:
+            previous_sha = config.get('deployed_sha')
+        if pending_sha:
+            logs.append(f"   Коммит: {pending_sha[:7]}" + (f" ({git_ref})" if git_ref else ""))
+            if previous_sha == pending_sha:
+                logs.append("   Изменений с выложенного релиза нет")
+            elif previous_sha:
+                logs.append(f"   Изменения: {previous_sha[:7]} → {pending_sha[:7]}")
+                logs.append(f"   https://github.com/{github_repo}/compare/{previous_sha}...{pending_sha}")
+            record_pending_sha(dsn, schema, config['id'], pending_sha, git_ref, logs)
+        logs.append("✅ Сборка запущена в фоновом режиме (npm ci — только если изменился lock-файл)")
+        logs.append(f"   Общий стор пакетов VM: {DEPLOY_STORE_DIR} ({package_store})")
+        logs.append(f"📝 Логи: tail -f /tmp/deploy_{domain}.log")
+        logs.append("⏳ Сборка займёт 2-3 минуты в фоне")
+        logs.append("")
+        
+        # nginx для поддержки нескольких доменов на одном сервере
+        if not step_succeeded(results, 'nginx_config'):
+            logs.append("❌ Не удалось записать конфиг nginx:")
+            for line in step_tail(results.get('nginx_config', {})):
+                logs.append(f"   {line}")
+        elif not step_succeeded(results, 'nginx_test'):
+            logs.append(f"❌ nginx config invalid: {' '.join(step_tail(results.get('nginx_test', {}), 5))}")
             logs.append("⚠️ Продолжаю деплой, но nginx не перезапущен")
+        elif step_succeeded(results, 'nginx_reload'):
+            logs.append(f"✅ nginx настроен для домена {domain}")
+            logs.append(f"   Конфиг: /etc/nginx/sites-available/{domain_safe}")
         else:
-            stdin, stdout, stderr = ssh.exec_command("sudo systemctl reload nginx")
-            reload_exit = stdout.channel.recv_exit_status()
-            if reload_exit == 0:
-                logs.append(f"✅ nginx настроен для домена {domain}")
-                logs.append(f"   Конфиг: /etc/nginx/sites-available/{domain_safe}")
-            else:
-                logs.append("⚠️ Не удалось перезагрузить nginx, но конфиг создан")
+            logs.append("⚠️ Не удалось перезагрузить nginx, но конфиг создан")
         
-        # Пробуем выпустить SSL для домена (если DNS уже настроен)
+        certbot_out = results.get('certbot', {}).get('output', '')
         logs.append("")
-        logs.append("🔒 Запускаю certbot для SSL (если DNS настроен)...")
-        certbot_cmd = f"sudo certbot --nginx -d {domain} --non-interactive --agree-tos --email admin@{domain} 2>&1 || true"
-        stdin, stdout, stderr = ssh.exec_command(certbot_cmd)
-        certbot_out = stdout.read().decode('utf-8')
         if 'Successfully received certificate' in certbot_out or 'Certificate not yet due for renewal' in certbot_out:
             logs.append("✅ SSL сертификат настроен")
         elif 'DNS' in certbot_out or 'resolution' in certbot_out.lower():
@@ -340,15 +992,26 @@ echo "✅ Деплой завершён $(date)" >> /tmp/deploy_{domain}.log
         else:
             logs.append("⚠️ SSL: certbot не выполнен (настрой DNS и перезапусти деплой)")
         
-        # Показываем список всех активных доменов на этом сервере
-        logs.append("")
-        logs.append("📋 Проверяю все домены на этом сервере...")
-        stdin, stdout, stderr = ssh.exec_command("ls -1 /etc/nginx/sites-enabled/ 2>/dev/null | grep -v default || echo ''")
-        enabled_sites = stdout.read().decode('utf-8').strip()
+        # Список всех активных доменов на этом сервере
+        enabled_sites = results.get('sites', {}).get('output', '').strip()
         if enabled_sites:
-            logs.append(f"   Активные домены: {enabled_sites.replace(chr(10), ', ')}")
+            logs.append(f"📋 Активные домены на сервере: {enabled_sites.replace(chr(10), ', ')}")
         else:
-            logs.append("   Активные домены не найдены")
+            logs.append("📋 Активные домены на сервере не найдены")
+        
+        logs.append("")
+        logs.append("⏱ Шаги плана:")
+        for result in results.values():
+            status = 'пропущен' if result['skipped'] else f"код {result['exit_code']}"
+            logs.append(f"   {result['step']}: {status}, {format_duration(result['duration_ms'])}")
+        
+        # Выгружаем снапшоты квизов (при первом деплое manifest пуст — выгрузка полная)
+        logs.append("")
+        logs.append("🧩 Выгружаю снапшоты квизов...")
+        try:
+            export_quiz_snapshots(ssh, domain, dsn, schema, logs)
+        except Exception as export_error:
+            logs.append(f"⚠️ Снапшоты квизов не выгружены: {str(export_error)}")
         
         ssh.close()
         
@@ -368,11 +1031,14 @@ echo "✅ Деплой завершён $(date)" >> /tmp/deploy_{domain}.log
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
+            'body': json_dumps({
                 'success': True,
                 'logs': logs,
                 'url': f"http://{domain}",
-                'ip_url': f"http://{vm_ip}"
+                'ip_url': f"http://{vm_ip}",
+                'pending_sha': pending_sha,
+                'previous_sha': previous_sha,
+                'steps': step_summary
             }),
             'isBase64Encoded': False
         }
@@ -382,13 +1048,13 @@ echo "✅ Деплой завершён $(date)" >> /tmp/deploy_{domain}.log
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'SSH failed: {str(e)}', 'logs': logs}),
+            'body': json_dumps({'error': f'SSH failed: {str(e)}', 'logs': logs}),
             'isBase64Encoded': False
         }
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
\ No newline at end of file
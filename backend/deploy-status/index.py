@@ -1,9 +1,222 @@
 import json
+import base64
+import gzip
 import os
+import re
+import time
+import threading
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import paramiko
 from io import StringIO
+from decimal import Decimal
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# JSON-ответы: orjson, если пакет установлен, иначе стандартный json с тем же результатом.
+# Строки RealDictCursor сериализуются как обычные dict, даты — в ISO 8601, Decimal — строкой
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    """Значения вне типов JSON: Decimal строкой без потери точности, даты через isoformat()"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def json_dumps(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+# Сжатие ответов: тело от RESPONSE_COMPRESS_MIN_BYTES сжимается brotli или gzip, если клиент
+# принимает кодировку (Accept-Encoding), и отдаётся base64 с заголовком Content-Encoding.
+# RESPONSE_COMPRESSION — допустимые кодировки в порядке предпочтения, пустое значение выключает сжатие
+RESPONSE_COMPRESSION = [
+    encoding.strip() for encoding in os.environ.get('RESPONSE_COMPRESSION', 'br,gzip').split(',') if encoding.strip()
+]
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+
+
+def get_request_header(event: dict, name: str) -> str:
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return ''
+
+
+def accepted_encoding(accept_encoding: str) -> str:
+    """Первая кодировка из RESPONSE_COMPRESSION, которую клиент принимает с q > 0"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+    for encoding in RESPONSE_COMPRESSION:
+        if encoding == 'br' and brotli is None:
+            continue
+        if encoding in ('br', 'gzip') and weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return ''
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response: dict, accept_encoding: str) -> dict:
+    """Сжать тело ответа, если оно достаточно большое и клиент принимает сжатие"""
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if response.get('isBase64Encoded') or not isinstance(body, str) or 'Content-Encoding' in headers:
+        return response
+    raw = body.encode('utf-8')
+    if len(raw) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**headers, 'Vary': 'Accept-Encoding'}
+    encoding = accepted_encoding(accept_encoding)
+    if not encoding:
+        return {**response, 'headers': headers}
+    compressed = compress_body(raw, encoding)
+
+    headers['Content-Encoding'] = encoding
+    # Сжатое представление побайтно отличается от исходного — ETag становится слабым
+    if headers.get('ETag') and not headers['ETag'].startswith('W/'):
+        headers['ETag'] = 'W/' + headers['ETag']
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+
+# deployed_sha — коммит релиза, на который смотрит current. deploy-long отправляет коммит
+# в сборку (pending_sha), а публикация идёт в фоне, поэтому SHA переносится в deployed_sha
+# здесь, когда проверка статуса видит, что current уже переключён
+DEPLOYED_SHA_SQL = '''
+    UPDATE {schema}.deploy_configs
+    SET deployed_sha = %(sha)s,
+        deployed_ref = CASE WHEN pending_sha = %(sha)s THEN pending_ref ELSE deployed_ref END,
+        deployed_at = CURRENT_TIMESTAMP
+    WHERE id = %(id)s AND deployed_sha IS DISTINCT FROM %(sha)s
+'''
+
+
+# Без миграции V0018 колонки deployed_sha нет — статус всё равно отдаётся, но без сверки SHA
+CONFIG_SQL = '''
+    SELECT dc.id, dc.domain{columns}, vm.ip_address, vm.ssh_user, vm.ssh_private_key
+    FROM {schema}.deploy_configs dc
+    JOIN {schema}.vm_instances vm ON dc.vm_instance_id = vm.id
+    WHERE dc.name = %s
+'''
+
+
+def release_sha(release: str):
+    """SHA коммита из ссылки current (releases/<sha>-<время>), иначе None"""
+    sha = release.strip().rstrip('/').rsplit('/', 1)[-1].split('-', 1)[0]
+    return sha if re.match(r'^[0-9a-f]{40}$', sha) else None
 
 
 def handler(event: dict, context) -> dict:
@@ -30,33 +243,32 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Укажи config_name'}),
+                'body': json_dumps({'error': 'Укажи config_name'}),
                 'isBase64Encoded': False
             }
         
         dsn = os.environ['DATABASE_URL']
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
         
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
         # Получаем конфигурацию
-        cur.execute(
-            f"""
-            SELECT dc.domain, vm.ip_address, vm.ssh_user, vm.ssh_private_key
-            FROM {schema}.deploy_configs dc
-            JOIN {schema}.vm_instances vm ON dc.vm_instance_id = vm.id
-            WHERE dc.name = %s
-            """,
-            (config_name,)
-        )
+        conn = db_connect(dsn)
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                cur.execute(CONFIG_SQL.format(schema=schema, columns=', dc.deployed_sha'), (config_name,))
+            except psycopg2.errors.UndefinedColumn:
+                conn.rollback()
+                cur.execute(CONFIG_SQL.format(schema=schema, columns=''), (config_name,))
+            config = cur.fetchone()
+            cur.close()
+        finally:
+            db_release(conn)
         
-        config = cur.fetchone()
         if not config:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Конфигурация не найдена'}),
+                'body': json_dumps({'error': 'Конфигурация не найдена'}),
                 'isBase64Encoded': False
             }
         
@@ -94,9 +306,30 @@ def handler(event: dict, context) -> dict:
         stdin, stdout, stderr = ssh.exec_command(f"ls -la {project_dir}/dist 2>/dev/null || echo 'dist не найден'")
         result['dist_dir'] = stdout.read().decode('utf-8')
         
-        # Проверяем html
-        stdin, stdout, stderr = ssh.exec_command(f"ls -la /var/www/{domain}/html 2>/dev/null || echo 'html не найден'")
-        result['html_dir'] = stdout.read().decode('utf-8')
+        # Проверяем текущий релиз (current → releases/<sha>-<время>) и список релизов для отката
+        stdin, stdout, stderr = ssh.exec_command(
+            f"readlink {project_dir}/current && ls -la {project_dir}/current/ 2>/dev/null || echo 'current не найден'"
+        )
+        result['current_release'] = stdout.read().decode('utf-8')
+        current_sha = release_sha(result['current_release'].split('\n', 1)[0])
+        if 'deployed_sha' not in config:
+            result['deployed_sha_error'] = 'SHA деплоя не сверяется: нужны миграции V0018 и V0019'
+        else:
+            result['deployed_sha'] = config['deployed_sha']
+            if current_sha and current_sha != config['deployed_sha']:
+                conn = db_connect(dsn)
+                try:
+                    cur = conn.cursor()
+                    cur.execute(DEPLOYED_SHA_SQL.format(schema=schema), {'sha': current_sha, 'id': config['id']})
+                    conn.commit()
+                    cur.close()
+                    result['deployed_sha'] = current_sha
+                except psycopg2.Error as sha_error:
+                    result['deployed_sha_error'] = str(sha_error).strip()
+                finally:
+                    db_release(conn)
+        stdin, stdout, stderr = ssh.exec_command(f"ls -1t {project_dir}/releases 2>/dev/null || echo 'релизов нет'")
+        result['releases'] = stdout.read().decode('utf-8')
         
         # Проверяем nginx конфиг
         stdin, stdout, stderr = ssh.exec_command(f"cat /etc/nginx/sites-enabled/{domain} 2>/dev/null || echo 'Конфиг не найден'")
@@ -118,20 +351,19 @@ def handler(event: dict, context) -> dict:
         result['nginx_test'] = stderr.read().decode('utf-8')
         
         ssh.close()
-        cur.close()
-        conn.close()
         
-        return {
+        # Логи nginx и листинги директорий занимают десятки килобайт — сжимаем для страницы Deploy
+        return compress_response({
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(result),
+            'body': json_dumps(result),
             'isBase64Encoded': False
-        }
+        }, get_request_header(event, 'Accept-Encoding'))
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
+            'body': json_dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
\ No newline at end of file
@@ -4,12 +4,89 @@
 """
 import json
 import os
+import time
+import threading
 import base64
 from urllib.parse import parse_qs, urlparse
 import requests
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
@@ -128,7 +205,7 @@ def handler(event: dict, context) -> dict:
             if dsn:
                 try:
                     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-                    conn_config = psycopg2.connect(dsn)
+                    conn_config = db_connect(dsn)
                     cur_config = conn_config.cursor(cursor_factory=RealDictCursor)
                     
                     # Проверяем наличие поля database_url в таблице
@@ -156,12 +233,15 @@ def handler(event: dict, context) -> dict:
                         print(f"⚠️ Поле database_url не найдено в таблице deploy_configs, используем DATABASE_URL из переменных окружения")
                     
                     cur_config.close()
-                    conn_config.close()
+                    db_release(conn_config)
                 except Exception as e:
                     # Если не удалось получить из конфига, используем fallback
                     print(f"⚠️ Ошибка получения database_url из конфига {config_name}: {str(e)}")
                     import traceback
                     print(traceback.format_exc())
+                finally:
+                    if 'conn_config' in locals():
+                        db_release(conn_config)
         
         # Fallback на DATABASE_URL из переменных окружения
         if not database_url:
@@ -244,7 +324,7 @@ def handler(event: dict, context) -> dict:
         
         # Подключаемся к БД
         logs.append("🗄️ Подключаюсь к базе данных...")
-        conn = psycopg2.connect(database_url)
+        conn = db_connect(database_url)
         conn.autocommit = True  # с самого начала — иначе set_session внутри транзакции выдаёт ошибку
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
@@ -327,7 +407,7 @@ def handler(event: dict, context) -> dict:
                 failed_count += 1
         
         cur.close()
-        conn.close()
+        db_release(conn)
         
         logs.append("")
         logs.append("=" * 60)
@@ -372,3 +452,8 @@ def handler(event: dict, context) -> dict:
             }),
             'isBase64Encoded': False
         }
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            db_release(conn)
@@ -1,15 +1,816 @@
 import json
 import os
+import hmac
+import time
+import threading
+import hashlib
+import base64
+import gzip
+import csv
+import io
+import re
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import requests
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON-ответы: orjson, если пакет установлен, иначе стандартный json с тем же результатом.
+# Строки RealDictCursor сериализуются как обычные dict, даты — в ISO 8601, Decimal — строкой
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_default(value):
+    """Значения вне типов JSON: Decimal строкой без потери точности, даты через isoformat()"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+def json_dumps(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':'))
+
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+QUIZ_TREE_SQL = '''
+    SELECT json_build_object(
+        'id', q.id,
+        'title', q.title,
+        'slug', q.slug,
+        'description', q.description,
+        'yandex_metrika_id', q.yandex_metrika_id,
+        'is_active', q.is_active,
+        'questions', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', qs.id,
+                'question_text', qs.question_text,
+                'question_order', qs.question_order,
+                'metrika_goal_prefix', qs.metrika_goal_prefix,
+                'answers', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'id', a.id,
+                        'answer_text', a.answer_text,
+                        'answer_value', a.answer_value,
+                        'answer_order', a.answer_order
+                    ) ORDER BY a.answer_order)
+                    FROM answers a
+                    WHERE a.question_id = qs.id
+                ), '[]'::json)
+            ) ORDER BY qs.question_order)
+            FROM questions qs
+            WHERE qs.quiz_id = q.id
+        ), '[]'::json)
+    )::text AS quiz,
+    q.id,
+    q.version
+    FROM quizzes q
+    WHERE q.slug = %s AND q.is_active = true
+'''
+
+QUIZ_VERSION_SQL = '''
+    SELECT id, version
+    FROM quizzes
+    WHERE slug = %s AND is_active = true
+'''
+
+# Снапшот дерева из quiz_snapshots (V0013) — поиск по первичному ключу без сборки дерева
+QUIZ_SNAPSHOT_SQL = '''
+    SELECT payload::text AS quiz, quiz_id AS id, version
+    FROM quiz_snapshots
+    WHERE slug = %s
+'''
+
+QUIZ_SNAPSHOT_VERSION_SQL = '''
+    SELECT quiz_id AS id, version
+    FROM quiz_snapshots
+    WHERE slug = %s
+'''
+
+# Источник дерева квиза: snapshot — готовый снапшот, tree — сборка из таблиц при запросе
+QUIZ_SOURCE = os.environ.get('QUIZ_SOURCE', 'snapshot')
+if QUIZ_SOURCE == 'tree':
+    QUIZ_READ_SQL, QUIZ_READ_VERSION_SQL = QUIZ_TREE_SQL, QUIZ_VERSION_SQL
+else:
+    QUIZ_READ_SQL, QUIZ_READ_VERSION_SQL = QUIZ_SNAPSHOT_SQL, QUIZ_SNAPSHOT_VERSION_SQL
+
+# Необязательная реплика для чтений (get, list, segments, answer_stats, export_leads):
+# записи и служебные операции всегда идут в DATABASE_URL. Реплика не используется,
+# если отстаёт больше REPLICA_MAX_LAG секунд (проверка не чаще REPLICA_LAG_CHECK_INTERVAL),
+# в течение REPLICA_MAX_LAG после записи клиента (submit, create/update) в этом экземпляре и, пока не получила лид
+# из параметра lead_id. Недоступная реплика пропускается на REPLICA_RETRY_AFTER секунд
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', '5'))
+REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', '30'))
+
+# Простаивающая реплика, применившая весь полученный WAL, не отстаёт,
+# даже если последняя транзакция была давно
+REPLICA_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag
+'''
+
+REPLICA_HAS_LEAD_SQL = '''
+    SELECT EXISTS (SELECT 1 FROM leads WHERE id = %(lead_id)s)
+        OR EXISTS (SELECT 1 FROM lead_spool WHERE lead_id = %(lead_id)s) AS replicated
+'''
+
+_replica_state = {
+    'down_until': 0.0,
+    'primary_until': 0.0,
+    'lag': 0.0,
+    'lag_checked_at': None,
+    'stats': {'replica': 0, 'primary': 0, 'lagging': 0, 'read_after_write': 0, 'unavailable': 0}
+}
+
+# Кэш готовых JSON-тел квизов живёт на уровне модуля и переживает тёплые вызовы функции.
+# В пределах TTL тело отдаётся без обращения к БД, после — сверяется только версия квиза.
+QUIZ_CACHE_SIZE = int(os.environ.get('QUIZ_CACHE_SIZE', '128'))
+QUIZ_CACHE_TTL = float(os.environ.get('QUIZ_CACHE_TTL', '10'))
+
+_quiz_cache = OrderedDict()  # slug -> {'version', 'etag', 'body', 'checked_at'}
+_quiz_cache_lock = threading.Lock()
+_quiz_cache_stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0}
+
+def quiz_cache_get(slug: str):
+    with _quiz_cache_lock:
+        entry = _quiz_cache.get(slug)
+        if entry:
+            _quiz_cache.move_to_end(slug)
+        return entry
+
+def quiz_cache_put(slug: str, version: int, etag: str, body: str) -> dict:
+    entry = {'version': version, 'etag': etag, 'body': body, 'checked_at': time.monotonic()}
+    with _quiz_cache_lock:
+        _quiz_cache[slug] = entry
+        _quiz_cache.move_to_end(slug)
+        while len(_quiz_cache) > QUIZ_CACHE_SIZE:
+            _quiz_cache.popitem(last=False)
+            _quiz_cache_stats['evictions'] += 1
+    return entry
+
+def quiz_cache_drop(*slugs):
+    with _quiz_cache_lock:
+        for slug in slugs:
+            _quiz_cache.pop(slug, None)
+
+# Запись квиза целиком (action=create/update): квиз, вопросы и ответы пишутся в одной
+# транзакции фиксированным числом операторов — вопросы и ответы многострочными вставками
+# через unnest массивов, независимо от размера квиза. id новых вопросов и ответов выделяются
+# заранее из последовательностей, поэтому ответы сразу ссылаются на свои вопросы.
+# Версию квиза поднимают триггеры V0010, они же пересобирают снапшот (V0013)
+QUIZ_SLUG_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+QUIZ_MAX_QUESTIONS = int(os.environ.get('QUIZ_MAX_QUESTIONS', '1000'))
+QUIZ_MAX_ANSWERS = int(os.environ.get('QUIZ_MAX_ANSWERS', '100'))
+
+QUIZ_INSERT_SQL = '''
+    INSERT INTO quizzes (title, slug, description, yandex_metrika_id, is_active)
+    VALUES (%(title)s, %(slug)s, %(description)s, %(yandex_metrika_id)s, %(is_active)s)
+    RETURNING id, slug
+'''
+
+# Блокирует квиз на время записи и возвращает id его текущих вопросов и ответов
+QUIZ_LOCK_SQL = '''
+    SELECT q.slug,
+        ARRAY(SELECT qs.id FROM questions qs WHERE qs.quiz_id = q.id) AS question_ids,
+        ARRAY(
+            SELECT a.id FROM answers a JOIN questions qs ON qs.id = a.question_id
+            WHERE qs.quiz_id = q.id
+        ) AS answer_ids
+    FROM quizzes q
+    WHERE q.id = %(quiz_id)s
+    FOR UPDATE
+'''
+
+QUIZ_UPDATE_SQL = '''
+    UPDATE quizzes
+    SET title = %(title)s, slug = %(slug)s, description = %(description)s,
+        yandex_metrika_id = %(yandex_metrika_id)s, is_active = %(is_active)s
+    WHERE id = %(quiz_id)s
+      AND (title, slug, description, yandex_metrika_id, is_active)
+          IS DISTINCT FROM (%(title)s, %(slug)s, %(description)s, %(yandex_metrika_id)s, %(is_active)s)
+'''
+
+QUIZ_ALLOCATE_IDS_SQL = '''
+    SELECT
+        ARRAY(
+            SELECT nextval(pg_get_serial_sequence('questions', 'id'))
+            FROM generate_series(1, %(questions)s)
+        )::int[] AS question_ids,
+        ARRAY(
+            SELECT nextval(pg_get_serial_sequence('answers', 'id'))
+            FROM generate_series(1, %(answers)s)
+        )::int[] AS answer_ids
+'''
+
+# Неизменённые строки не перезаписываются: версия квиза растёт только при реальных правках
+QUESTIONS_UPSERT_SQL = '''
+    INSERT INTO questions (id, quiz_id, question_text, question_order, metrika_goal_prefix)
+    SELECT q.id, %(quiz_id)s, q.question_text, q.question_order, q.metrika_goal_prefix
+    FROM unnest(%(ids)s::int[], %(texts)s::text[], %(orders)s::int[], %(prefixes)s::text[])
+        AS q(id, question_text, question_order, metrika_goal_prefix)
+    ON CONFLICT (id) DO UPDATE
+    SET question_text = EXCLUDED.question_text,
+        question_order = EXCLUDED.question_order,
+        metrika_goal_prefix = EXCLUDED.metrika_goal_prefix
+    WHERE questions.quiz_id = EXCLUDED.quiz_id
+      AND (questions.question_text, questions.question_order, questions.metrika_goal_prefix)
+          IS DISTINCT FROM (EXCLUDED.question_text, EXCLUDED.question_order, EXCLUDED.metrika_goal_prefix)
+'''
+
+ANSWERS_UPSERT_SQL = '''
+    INSERT INTO answers (id, question_id, answer_text, answer_value, answer_order)
+    SELECT a.id, a.question_id, a.answer_text, a.answer_value, a.answer_order
+    FROM unnest(%(ids)s::int[], %(question_ids)s::int[], %(texts)s::text[], %(values)s::text[], %(orders)s::int[])
+        AS a(id, question_id, answer_text, answer_value, answer_order)
+    ON CONFLICT (id) DO UPDATE
+    SET question_id = EXCLUDED.question_id,
+        answer_text = EXCLUDED.answer_text,
+        answer_value = EXCLUDED.answer_value,
+        answer_order = EXCLUDED.answer_order
+    WHERE (answers.question_id, answers.answer_text, answers.answer_value, answers.answer_order)
+          IS DISTINCT FROM (EXCLUDED.question_id, EXCLUDED.answer_text, EXCLUDED.answer_value, EXCLUDED.answer_order)
+'''
+
+# Вопросы и ответы, которых нет в присланном дереве, удаляются после переноса ответов
+QUIZ_DELETE_ANSWERS_SQL = '''
+    DELETE FROM answers a
+    USING questions qs
+    WHERE qs.id = a.question_id AND qs.quiz_id = %(quiz_id)s AND a.id <> ALL(%(keep)s::int[])
+'''
+
+QUIZ_DELETE_QUESTIONS_SQL = '''
+    DELETE FROM questions
+    WHERE quiz_id = %(quiz_id)s AND id <> ALL(%(keep)s::int[])
+'''
+
+# Ответы лида хранятся массивом leads.answer_ids (V0015): вопрос однозначно
+# определяется ответом, отдельная строка quiz_responses на каждый ответ не пишется.
+# Вместо внешних ключей quiz_responses проверяем, что каждый ответ относится
+# к своему вопросу этого квиза — иначе строка не вставляется
+LEAD_ANSWERS_VALID_SQL = '''
+    SELECT count(*) = cardinality(%(answer_ids)s::int[]) AS valid
+    FROM unnest(%(question_ids)s::int[], %(answer_ids)s::int[]) AS r(question_id, answer_id)
+    JOIN answers a ON a.id = r.answer_id AND a.question_id = r.question_id
+    JOIN questions qs ON qs.id = a.question_id AND qs.quiz_id = %(quiz_id)s
+'''
+
+# Счётчики выбора ответов (V0017) увеличиваются тем же оператором, что пишет лиды.
+# Строка счётчика выбирается по id лида (шард), а обновления идут в порядке ключей —
+# одновременные заявки с одинаковыми ответами не ждут друг друга и не взаимоблокируются.
+# {source} — записанные лиды с колонками lead_id, created_at, answer_ids
+ANSWER_STATS_SHARDS = int(os.environ.get('ANSWER_STATS_SHARDS', '8'))
+
+ANSWER_STATS_CTE = '''
+    counted AS (
+        INSERT INTO answer_stats (answer_id, shard, responses)
+        SELECT a.answer_id, s.lead_id %% {shards}, count(*)
+        FROM {source} s, unnest(s.answer_ids) AS a(answer_id)
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (answer_id, shard) DO UPDATE
+        SET responses = answer_stats.responses + EXCLUDED.responses
+    ), counted_daily AS (
+        INSERT INTO answer_stats_daily (answer_id, day, shard, responses)
+        SELECT a.answer_id, s.created_at::date, s.lead_id %% {shards}, count(*)
+        FROM {source} s, unnest(s.answer_ids) AS a(answer_id)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (answer_id, day, shard) DO UPDATE
+        SET responses = answer_stats_daily.responses + EXCLUDED.responses
+    )
+'''
+
+LEAD_INSERT_SQL = f'''
+    WITH answered AS ({LEAD_ANSWERS_VALID_SQL}),
+    new_lead AS (
+        INSERT INTO leads (quiz_id, name, phone, email, segment_key, answer_ids)
+        SELECT %(quiz_id)s, %(name)s, %(phone)s, %(email)s, %(segment_key)s, %(answer_ids)s
+        FROM answered
+        WHERE valid
+        RETURNING id AS lead_id, created_at, answer_ids
+    ), {ANSWER_STATS_CTE.format(source='new_lead', shards=ANSWER_STATS_SHARDS)}
+    SELECT lead_id AS id FROM new_lead
+'''
+
+# В режиме spool заявка только дописывается в lead_spool, а в leads
+# её переносит flush (таймер-триггер или action=flush с X-Admin-Secret) пачками по LEAD_FLUSH_BATCH
+LEAD_INGEST_MODE = os.environ.get('LEAD_INGEST_MODE', 'direct')
+LEAD_FLUSH_BATCH = int(os.environ.get('LEAD_FLUSH_BATCH', '1000'))
+LEAD_FLUSH_MAX_BATCHES = int(os.environ.get('LEAD_FLUSH_MAX_BATCHES', '20'))
+
+LEAD_SPOOL_INSERT_SQL = f'''
+    WITH answered AS ({LEAD_ANSWERS_VALID_SQL})
+    INSERT INTO lead_spool (lead_id, quiz_id, name, phone, email, segment_key, question_ids, answer_ids)
+    SELECT nextval(pg_get_serial_sequence('leads', 'id')), %(quiz_id)s, %(name)s, %(phone)s,
+        %(email)s, %(segment_key)s, %(question_ids)s, %(answer_ids)s
+    FROM answered
+    WHERE valid
+    RETURNING lead_id AS id
+'''
+
+# Горячие запросы готовятся (PREPARE) один раз на соединение и дальше выполняются
+# по имени (EXECUTE): разбор и планирование не повторяются на каждом вызове тёплой функции.
+# Подготовленные операторы живут в сессии, поэтому за пулером в режиме транзакций
+# (PgBouncer transaction pooling) их нужно выключить: DB_PREPARED_STATEMENTS=0
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') not in ('0', 'false', 'off')
+
+LEAD_INSERT_PARAMS = [
+    ('quiz_id', 'integer'), ('name', 'text'), ('phone', 'text'), ('email', 'text'),
+    ('segment_key', 'text'), ('question_ids', 'integer[]'), ('answer_ids', 'integer[]')
+]
+
+# имя -> (SQL, [(параметр, тип)]); позиционные %s нумеруются по порядку параметров
+PREPARED_SQL = {
+    'quiz_read': (QUIZ_READ_SQL, [('slug', 'text')]),
+    'quiz_read_version': (QUIZ_READ_VERSION_SQL, [('slug', 'text')]),
+    'lead_insert': (LEAD_INSERT_SQL, LEAD_INSERT_PARAMS),
+    'lead_spool_insert': (LEAD_SPOOL_INSERT_SQL, LEAD_INSERT_PARAMS),
+}
+
+def prepared_statement_sql(name: str) -> str:
+    """Текст PREPARE: параметры psycopg2 (%(x)s и %s) заменяются на $1, $2..."""
+    sql, params = PREPARED_SQL[name]
+    for number, (param, _) in enumerate(params, start=1):
+        sql = sql.replace(f'%({param})s', f'${number}')
+    for number in range(1, len(params) + 1):
+        sql = sql.replace('%s', f'${number}', 1)
+    types = ', '.join(param_type for _, param_type in params)
+    return f"PREPARE {name} ({types}) AS {sql.replace('%%', '%')}"
+
+def execute_prepared(cur, name: str, params: dict):
+    """Выполнить горячий запрос по имени, подготовив его на этом соединении при первом вызове"""
+    sql, param_types = PREPARED_SQL[name]
+    if not DB_PREPARED_STATEMENTS:
+        cur.execute(sql, params if '%(' in sql else [params[param] for param, _ in param_types])
+        return
+    meta = _db_conn_meta.get(id(cur.connection))
+    prepared = meta.setdefault('prepared', set()) if meta else set()
+    if name not in prepared:
+        cur.execute(prepared_statement_sql(name))
+        prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(param_types))
+    cur.execute(f'EXECUTE {name} ({placeholders})', [params[param] for param, _ in param_types])
+
+LEAD_FLUSH_SQL = '''
+    WITH batch AS (
+        DELETE FROM lead_spool
+        WHERE id IN (
+            SELECT id FROM lead_spool
+            WHERE failed_at IS NULL {extra_condition}
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING lead_id, quiz_id, name, phone, email, segment_key, answer_ids, created_at
+    ), new_leads AS (
+        INSERT INTO leads (id, quiz_id, name, phone, email, segment_key, answer_ids, created_at)
+        SELECT lead_id, quiz_id, name, phone, email, segment_key, answer_ids, created_at
+        FROM batch
+    ), ''' + ANSWER_STATS_CTE.format(source='batch', shards=ANSWER_STATS_SHARDS) + '''
+    SELECT count(*) AS flushed FROM batch
+'''
+
+# Агрегат lead_segment_daily догоняет leads пачками от отметки в rollup_watermarks.
+# Лиды начиная с первого «неустоявшегося» ждут следующего обновления: id выдаётся
+# из последовательности до коммита (а в режиме spool — до переноса в leads),
+# поэтому лид с меньшим id может появиться в таблице позже лида с большим
+LEAD_ROLLUP_BATCH = int(os.environ.get('LEAD_ROLLUP_BATCH', '5000'))
+LEAD_ROLLUP_MAX_BATCHES = int(os.environ.get('LEAD_ROLLUP_MAX_BATCHES', '20'))
+LEAD_ROLLUP_SETTLE_SECONDS = int(os.environ.get('LEAD_ROLLUP_SETTLE_SECONDS', '60'))
+
+LEAD_ROLLUP_LOCK_SQL = '''
+    SELECT last_lead_id
+    FROM rollup_watermarks
+    WHERE name = 'lead_segment_daily'
+    FOR UPDATE SKIP LOCKED
+'''
+
+LEAD_ROLLUP_SQL = '''
+    WITH candidates AS (
+        SELECT id, quiz_id, segment_key, created_at
+        FROM leads
+        WHERE id > %(last_lead_id)s
+        ORDER BY id
+        LIMIT %(batch)s
+    ),
+    cutoff AS (
+        SELECT LEAST(
+            (SELECT min(id) FROM candidates
+             WHERE created_at > CURRENT_TIMESTAMP - make_interval(secs => %(settle)s)),
+            (SELECT min(lead_id) FROM lead_spool WHERE failed_at IS NULL)
+        ) AS first_unsettled_id
+    ),
+    batch AS (
+        SELECT c.*
+        FROM candidates c, cutoff
+        WHERE cutoff.first_unsettled_id IS NULL OR c.id < cutoff.first_unsettled_id
+    ),
+    counted AS (
+        INSERT INTO lead_segment_daily (quiz_id, day, segment_key, leads_count)
+        SELECT quiz_id, created_at::date, COALESCE(segment_key, ''), count(*)
+        FROM batch
+        WHERE quiz_id IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (quiz_id, day, segment_key) DO UPDATE
+        SET leads_count = lead_segment_daily.leads_count + EXCLUDED.leads_count
+    ),
+    advanced AS (
+        UPDATE rollup_watermarks
+        SET last_lead_id = (SELECT max(id) FROM batch), updated_at = CURRENT_TIMESTAMP
+        WHERE name = 'lead_segment_daily' AND EXISTS (SELECT 1 FROM batch)
+    )
+    SELECT count(*) AS rolled_up FROM batch
+'''
+
+# leads и quiz_responses секционированы по месяцам (V0016). Секции на будущие месяцы
+# создаются заранее (строки месяца, успевшие попасть в DEFAULT-секцию, переносятся в новую — V0020),
+# секции старше LEAD_RETENTION_MONTHS (0 — хранить всё) отсоединяются
+# и переносятся в схему LEAD_ARCHIVE_SCHEMA, а при пустом значении удаляются
+LEAD_PARTITIONED_TABLES = ['leads', 'quiz_responses']
+LEAD_PARTITION_MONTHS_AHEAD = int(os.environ.get('LEAD_PARTITION_MONTHS_AHEAD', '3'))
+LEAD_PARTITION_CHECK_INTERVAL = float(os.environ.get('LEAD_PARTITION_CHECK_INTERVAL', '3600'))
+LEAD_RETENTION_MONTHS = int(os.environ.get('LEAD_RETENTION_MONTHS', '0'))
+LEAD_ARCHIVE_SCHEMA = os.environ.get('LEAD_ARCHIVE_SCHEMA', 'archive')
+
+_partitions_state = {'checked_at': None}
+
+ANSWER_STATS_SQL = '''
+    SELECT qs.id AS question_id, qs.question_text, a.id AS answer_id, a.answer_text, a.answer_value,
+        COALESCE((
+            SELECT sum(st.responses) FROM answer_stats st WHERE st.answer_id = a.id
+        ), 0)::bigint AS responses
+    FROM questions qs
+    JOIN answers a ON a.question_id = qs.id
+    WHERE qs.quiz_id = %s
+    ORDER BY qs.question_order, qs.id, a.answer_order
+'''
+
+ANSWER_STATS_DAILY_SQL = '''
+    SELECT qs.id AS question_id, qs.question_text, a.id AS answer_id, a.answer_text, a.answer_value,
+        COALESCE((
+            SELECT sum(st.responses) FROM answer_stats_daily st
+            WHERE st.answer_id = a.id AND st.day BETWEEN %s AND %s
+        ), 0)::bigint AS responses
+    FROM questions qs
+    JOIN answers a ON a.question_id = qs.id
+    WHERE qs.quiz_id = %s
+    ORDER BY qs.question_order, qs.id, a.answer_order
+'''
+
+SEGMENTS_DEFAULT_DAYS = 30
+SEGMENTS_MAX_DAYS = 366
+
+# Выгрузка лидов с ответами, развёрнутыми в колонки по вопросам квиза. Строки читаются
+# именованным (серверным) курсором порциями по LEAD_EXPORT_CHUNK, поэтому память
+# не зависит от объёма выгрузки. HTTP (только с X-Admin-Secret — в лидах персональные данные)
+# отдаёт страницу до LEAD_EXPORT_MAX_LIMIT лидов с курсором в X-Next-Cursor,
+# полная выгрузка — scripts/export_leads.py
+LEAD_EXPORT_CHUNK = int(os.environ.get('LEAD_EXPORT_CHUNK', '1000'))
+LEAD_EXPORT_DEFAULT_LIMIT = 5000
+LEAD_EXPORT_MAX_LIMIT = 10000
+LEAD_EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8'
+}
+LEAD_EXPORT_COLUMNS = ['lead_id', 'created_at', 'name', 'phone', 'email', 'segment_key']
+
+LEAD_EXPORT_SQL = '''
+    SELECT l.id AS lead_id, l.created_at, l.name, l.phone, l.email, l.segment_key, l.answer_ids
+    FROM leads l
+    WHERE l.quiz_id = %s AND l.id > %s
+    ORDER BY l.id
+'''
+
+# Статические снапшоты квизов (quiz/<slug>.json) выгружает deploy-long (action=export_quizzes)
+# в /var/www/<domain>/shared/quiz; quiz-api сообщает ему об изменениях квизов
+QUIZ_EXPORT_URL = os.environ.get('QUIZ_EXPORT_URL', '')
+QUIZ_EXPORT_CONFIGS = [name.strip() for name in os.environ.get('QUIZ_EXPORT_CONFIGS', '').split(',') if name.strip()]
+QUIZ_EXPORT_TIMEOUT = float(os.environ.get('QUIZ_EXPORT_TIMEOUT', '120'))
+
+QUIZ_EXPORT_FINGERPRINT_SQL = '''
+    SELECT md5(COALESCE(string_agg(slug || ':' || version, ',' ORDER BY slug), '')) AS fingerprint
+    FROM quizzes
+    WHERE is_active = true
+'''
+
+_quiz_export_state = {'fingerprint': None}
+
+# Браузеры и nginx кэшируют квиз на QUIZ_MAX_AGE секунд, затем перепроверяют по ETag
+QUIZ_MAX_AGE = int(os.environ.get('QUIZ_MAX_AGE', '60'))
+QUIZ_CACHE_CONTROL = f'public, max-age={QUIZ_MAX_AGE}, stale-while-revalidate={QUIZ_MAX_AGE * 5}'
+LIST_CACHE_CONTROL = 'no-cache'
+# Статистика по лидам отдаётся только с X-Admin-Secret — общие кэши не должны её хранить
+STATS_CACHE_CONTROL = 'private, no-cache'
+
+# Список квизов отдаётся страницами по курсору (created_at, id): курсор следующей
+# страницы передаётся в заголовке X-Next-Cursor, тело остаётся массивом
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 200
+LIST_DEFAULT_FIELDS = ['id', 'title', 'slug', 'description', 'is_active', 'created_at']
+LIST_ALLOWED_FIELDS = LIST_DEFAULT_FIELDS + ['yandex_metrika_id', 'updated_at', 'version']
+
+def quiz_etag(quiz_id: int, version: int) -> str:
+    # Версия меняется при любой правке квиза, вопросов или ответов,
+    # поэтому id + version однозначно определяют содержимое квиза
+    return f'"q{quiz_id}.v{version}"'
+
+def content_etag(body: str) -> str:
+    return '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+
+def get_request_header(event: dict, name: str) -> str:
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return ''
+
+# Служебные действия и всё, что отдаёт данные лидов (выгрузка и аналитика по сегментам и ответам),
+# доступны только с заголовком X-Admin-Secret, совпадающим с QUIZ_ADMIN_SECRET.
+# Без переменной окружения они закрыты для HTTP и выполняются только таймер-триггером
+QUIZ_ADMIN_SECRET = os.environ.get('QUIZ_ADMIN_SECRET', '')
+ADMIN_ACTIONS = {
+    'create', 'update', 'flush', 'rollup', 'partitions', 'export',
+    'export_leads', 'segments', 'answer_stats'
+}
+
+def is_admin_request(event: dict) -> bool:
+    if not QUIZ_ADMIN_SECRET:
+        return False
+    secret = get_request_header(event, 'X-Admin-Secret')
+    return hmac.compare_digest(secret.encode('utf-8'), QUIZ_ADMIN_SECRET.encode('utf-8'))
+
+# Сжатие ответов: тело от RESPONSE_COMPRESS_MIN_BYTES сжимается brotli или gzip, если клиент
+# принимает кодировку (Accept-Encoding), и отдаётся base64 с заголовком Content-Encoding.
+# RESPONSE_COMPRESSION — допустимые кодировки в порядке предпочтения, пустое значение выключает сжатие
+RESPONSE_COMPRESSION = [
+    encoding.strip() for encoding in os.environ.get('RESPONSE_COMPRESSION', 'br,gzip').split(',') if encoding.strip()
+]
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+
+# Сжатые тела ответов с ETag (дерево квиза, списки) запоминаются, чтобы тёплые
+# вызовы не сжимали один и тот же документ заново
+RESPONSE_COMPRESS_CACHE_SIZE = int(os.environ.get('RESPONSE_COMPRESS_CACHE_SIZE', '64'))
+
+_compressed_cache = OrderedDict()  # (etag, encoding) -> bytes
+_compressed_cache_lock = threading.Lock()
+
+def accepted_encoding(accept_encoding: str) -> str:
+    """Первая кодировка из RESPONSE_COMPRESSION, которую клиент принимает с q > 0"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+    for encoding in RESPONSE_COMPRESSION:
+        if encoding == 'br' and brotli is None:
+            continue
+        if encoding in ('br', 'gzip') and weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return ''
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+def compress_response(response: dict, accept_encoding: str) -> dict:
+    """Сжать тело ответа, если оно достаточно большое и клиент принимает сжатие"""
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if response.get('isBase64Encoded') or not isinstance(body, str) or 'Content-Encoding' in headers:
+        return response
+    raw = body.encode('utf-8')
+    if len(raw) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**headers, 'Vary': 'Accept-Encoding'}
+    encoding = accepted_encoding(accept_encoding)
+    if not encoding:
+        return {**response, 'headers': headers}
+    etag = headers.get('ETag')
+    key = (etag, encoding)
+    with _compressed_cache_lock:
+        compressed = _compressed_cache.get(key) if etag else None
+        if compressed is not None:
+            _compressed_cache.move_to_end(key)
+    if compressed is None:
+        compressed = compress_body(raw, encoding)
+        if etag and RESPONSE_COMPRESS_CACHE_SIZE > 0:
+            with _compressed_cache_lock:
+                _compressed_cache[key] = compressed
+                while len(_compressed_cache) > RESPONSE_COMPRESS_CACHE_SIZE:
+                    _compressed_cache.popitem(last=False)
+
+    headers['Content-Encoding'] = encoding
+    # Сжатое представление побайтно отличается от исходного — ETag становится слабым
+    if headers.get('ETag') and not headers['ETag'].startswith('W/'):
+        headers['ETag'] = 'W/' + headers['ETag']
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Для If-None-Match используется слабое сравнение: W/"x" совпадает с "x"
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag[2:] == etag if tag.startswith('W/') else tag == etag for tag in candidates)
+
+def get_db_connection(read_only: bool = False, lead_id=None, client_write: bool = False):
+    """Соединение с основной БД, а для чтения — с репликой, если она доступна и не отстаёт.
+    
+    lead_id — лид, который клиент уже записал: пока реплика его не получила, читаем с основной.
+    client_write — запись по запросу клиента (submit, create/update), после которой чтения
+    экземпляра REPLICA_MAX_LAG секунд идут в основную БД; служебные записи таймера реплику не отключают
+    """
+    if read_only and replica_usable():
+        conn = None
+        try:
+            conn = db_connect(DATABASE_REPLICA_URL)
+            conn.cursor_factory = RealDictCursor
+            if replica_fresh(conn, lead_id):
+                _replica_state['stats']['replica'] += 1
+                return conn
+            db_release(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Оборванное соединение не возвращается в пул, а закрывается
+            if conn is not None:
+                db_discard(conn)
+            mark_replica_down()
+    
+    if client_write:
+        # Чтения этого экземпляра сразу после записи клиента не должны увидеть реплику без неё
+        _replica_state['primary_until'] = time.monotonic() + REPLICA_MAX_LAG
+    _replica_state['stats']['primary'] += 1
+    conn = db_connect(os.environ.get('DATABASE_URL'))
+    conn.cursor_factory = RealDictCursor
+    return conn
+
+def replica_usable() -> bool:
+    now = time.monotonic()
+    return bool(DATABASE_REPLICA_URL) and now >= _replica_state['down_until'] and now >= _replica_state['primary_until']
+
+def replica_fresh(conn, lead_id=None) -> bool:
+    """Отставание реплики в пределах REPLICA_MAX_LAG и записанный клиентом лид уже на ней"""
+    cur = conn.cursor()
+    try:
+        checked_at = _replica_state['lag_checked_at']
+        if checked_at is None or time.monotonic() - checked_at > REPLICA_LAG_CHECK_INTERVAL:
+            cur.execute(REPLICA_LAG_SQL)
+            _replica_state['lag'] = float(cur.fetchone()['lag'])
+            _replica_state['lag_checked_at'] = time.monotonic()
+        if _replica_state['lag'] > REPLICA_MAX_LAG:
+            _replica_state['stats']['lagging'] += 1
+            return False
+        
+        try:
+            lead_id = int(lead_id) if lead_id else None
+        except (TypeError, ValueError):
+            lead_id = None
+        if lead_id:
+            cur.execute(REPLICA_HAS_LEAD_SQL, {'lead_id': lead_id})
+            if not cur.fetchone()['replicated']:
+                _replica_state['stats']['read_after_write'] += 1
+                return False
+        return True
+    finally:
+        cur.close()
+        conn.rollback()
+
+def mark_replica_down():
+    if DATABASE_REPLICA_URL:
+        _replica_state['down_until'] = time.monotonic() + REPLICA_RETRY_AFTER
+        _replica_state['stats']['unavailable'] += 1
 
 def handler(event: dict, context) -> dict:
     '''API для работы с квизами: загрузка данных, сохранение ответов и лидов'''
     
+    # Таймер-триггер переносит накопленные заявки из lead_spool, догоняет агрегаты
+    # по сегментам, раз в LEAD_PARTITION_CHECK_INTERVAL обслуживает месячные секции
+    # и обновляет статические снапшоты, если квизы изменились
+    if is_timer_event(event):
+        tasks = [flush_lead_spool, refresh_lead_rollups]
+        if (_partitions_state['checked_at'] is None
+                or time.monotonic() - _partitions_state['checked_at'] > LEAD_PARTITION_CHECK_INTERVAL):
+            tasks.append(maintain_lead_partitions)
+        tasks.append(export_quiz_snapshots_if_changed)
+        
+        # Задачи независимы: ошибка одной не должна каждый раз пропускать остальные
+        response = None
+        errors = []
+        for task in tasks:
+            try:
+                result = task()
+            except Exception as e:
+                print(f"⚠️ {task.__name__}: {e}")
+                errors.append(f'{task.__name__}: {e}')
+                continue
+            if task is flush_lead_spool:
+                response = result
+        if errors:
+            return error_response(500, '; '.join(errors))
+        return response
+    
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -18,7 +819,7 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Admin-Secret'
             },
             'body': '',
             'isBase64Encoded': False
@@ -28,67 +829,164 @@ def handler(event: dict, context) -> dict:
     action = params.get('action', 'list')
     
     try:
-        if method == 'GET' and action == 'get':
-            slug = params.get('slug')
-            if not slug:
-                return error_response(400, 'Slug required')
-            return get_quiz_by_slug(slug)
-        
-        elif method == 'POST' and action == 'submit':
-            body = json.loads(event.get('body', '{}'))
-            return submit_quiz_response(body)
-        
-        elif method == 'GET' and action == 'list':
-            return get_all_quizzes()
-        
-        else:
-            return error_response(404, 'Endpoint not found')
+        try:
+            response = route(event, method, action, params)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Соединение из пула могло оборваться на стороне сервера —
+            # чтение безопасно повторить один раз на новом соединении,
+            # а реплику на это время пропустить и читать с основной БД
+            if method != 'GET':
+                raise
+            mark_replica_down()
+            response = route(event, method, action, params)
             
     except Exception as e:
         return error_response(500, str(e))
+    
+    return compress_response(response, get_request_header(event, 'Accept-Encoding'))
 
-def get_quiz_by_slug(slug: str) -> dict:
-    conn = get_db_connection()
-    cur = conn.cursor()
+def route(event: dict, method: str, action: str, params: dict) -> dict:
+    if action in ADMIN_ACTIONS and not is_admin_request(event):
+        return error_response(401, 'Admin secret required')
     
-    cur.execute('''
-        SELECT id, title, slug, description, yandex_metrika_id, is_active
-        FROM quizzes 
-        WHERE slug = %s AND is_active = true
-    ''', (slug,))
+    if method == 'GET' and action == 'get':
+        slug = params.get('slug')
+        if not slug:
+            return error_response(400, 'Slug required')
+        return get_quiz_by_slug(slug, get_request_header(event, 'If-None-Match'))
     
-    quiz = cur.fetchone()
+    elif method == 'POST' and action == 'submit':
+        body = json.loads(event.get('body', '{}'))
+        return submit_quiz_response(body)
     
-    if not quiz:
-        cur.close()
-        conn.close()
-        return error_response(404, 'Quiz not found')
+    elif method == 'POST' and action in ('create', 'update'):
+        body = json.loads(event.get('body') or '{}')
+        quiz_id = (params.get('id') or body.get('id')) if action == 'update' else None
+        if action == 'update' and not quiz_id:
+            return error_response(400, 'Quiz id required')
+        return save_quiz_tree(body, quiz_id)
     
-    quiz_id = quiz['id']
+    elif method == 'POST' and action == 'flush':
+        return flush_lead_spool()
     
-    cur.execute('''
-        SELECT id, question_text, question_order, metrika_goal_prefix
-        FROM questions 
-        WHERE quiz_id = %s
-        ORDER BY question_order
-    ''', (quiz_id,))
+    elif method == 'POST' and action == 'rollup':
+        return refresh_lead_rollups()
     
-    questions = cur.fetchall()
+    elif method == 'POST' and action == 'partitions':
+        return maintain_lead_partitions()
     
-    for question in questions:
-        cur.execute('''
-            SELECT id, answer_text, answer_value, answer_order
-            FROM answers 
-            WHERE question_id = %s
-            ORDER BY answer_order
-        ''', (question['id'],))
+    elif method == 'GET' and action == 'answer_stats':
+        return get_answer_stats(params, get_request_header(event, 'If-None-Match'))
+    
+    elif method == 'GET' and action == 'segments':
+        return get_segment_stats(params, get_request_header(event, 'If-None-Match'))
+    
+    elif method == 'GET' and action == 'export_leads':
+        return export_leads(params)
+    
+    elif method == 'POST' and action == 'export':
+        body = json.loads(event.get('body') or '{}')
+        return export_quiz_snapshots(force=bool(body.get('force')))
+    
+    elif method == 'GET' and action == 'list':
+        return get_all_quizzes(params, get_request_header(event, 'If-None-Match'))
+    
+    elif method == 'GET' and action == 'cache_stats':
+        return get_quiz_cache_stats()
+    
+    else:
+        return error_response(404, 'Endpoint not found')
+
+def get_quiz_by_slug(slug: str, if_none_match: str = '') -> dict:
+    entry = quiz_cache_get(slug)
+    
+    if entry and time.monotonic() - entry['checked_at'] < QUIZ_CACHE_TTL:
+        _quiz_cache_stats['hits'] += 1
+        return quiz_response(entry, if_none_match, 'HIT')
+    
+    conn = get_db_connection(read_only=True)
+    cur = conn.cursor()
+    
+    try:
+        if entry or if_none_match:
+            # Сверяем только версию квиза — дерево пересобираем лишь если она изменилась
+            execute_prepared(cur, 'quiz_read_version', {'slug': slug})
+            row = cur.fetchone()
+            
+            # Отстающая реплика может вернуть версию старше закэшированной — кэш не откатываем
+            if row and entry and row['version'] <= entry['version']:
+                entry['checked_at'] = time.monotonic()
+                _quiz_cache_stats['revalidated'] += 1
+                return quiz_response(entry, if_none_match, 'REVALIDATED')
+            
+            if row and etag_matches(if_none_match, quiz_etag(row['id'], row['version'])):
+                # У клиента актуальная копия — 304 без сборки дерева
+                _quiz_cache_stats['revalidated'] += 1
+                return not_modified_response(quiz_etag(row['id'], row['version']), QUIZ_CACHE_CONTROL)
+        
+        _quiz_cache_stats['misses'] += 1
         
-        question['answers'] = cur.fetchall()
+        # Всё дерево квиз → вопросы → ответы читается одним запросом,
+        # число обращений к БД не зависит от количества вопросов
+        execute_prepared(cur, 'quiz_read', {'slug': slug})
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    if not row:
+        quiz_cache_drop(slug)
+        return error_response(404, 'Quiz not found')
     
-    quiz['questions'] = questions
+    entry = quiz_cache_put(slug, row['version'], quiz_etag(row['id'], row['version']), row['quiz'])
     
-    cur.close()
-    conn.close()
+    return quiz_response(entry, if_none_match, 'MISS')
+
+def quiz_response(entry: dict, if_none_match: str, cache_status: str) -> dict:
+    if etag_matches(if_none_match, entry['etag']):
+        response = not_modified_response(entry['etag'], QUIZ_CACHE_CONTROL)
+        response['headers']['X-Cache'] = cache_status
+        return response
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': QUIZ_CACHE_CONTROL,
+            'ETag': entry['etag'],
+            'X-Cache': cache_status
+        },
+        'body': entry['body'],
+        'isBase64Encoded': False
+    }
+
+def not_modified_response(etag: str, cache_control: str) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': cache_control,
+            'ETag': etag
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def get_quiz_cache_stats() -> dict:
+    lookups = _quiz_cache_stats['hits'] + _quiz_cache_stats['revalidated'] + _quiz_cache_stats['misses']
+    stats = {
+        **_quiz_cache_stats,
+        'size': len(_quiz_cache),
+        'max_size': QUIZ_CACHE_SIZE,
+        'ttl_seconds': QUIZ_CACHE_TTL,
+        'hit_ratio': round((lookups - _quiz_cache_stats['misses']) / lookups, 4) if lookups else 0.0,
+        'db_reads': {
+            'replica_configured': bool(DATABASE_REPLICA_URL),
+            'replica_lag_seconds': _replica_state['lag'],
+            **_replica_state['stats']
+        }
+    }
     
     return {
         'statusCode': 200,
@@ -96,7 +994,7 @@ def get_quiz_by_slug(slug: str) -> dict:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps(dict(quiz)),
+        'body': json_dumps(stats),
         'isBase64Encoded': False
     }
 
@@ -109,32 +1007,313 @@ def submit_quiz_response(data: dict) -> dict:
     if not quiz_id or not answers or not contact_info.get('name') or not contact_info.get('phone'):
         return error_response(400, 'Missing required fields')
     
+    try:
+        question_ids = [int(question_id) for question_id in answers.keys()]
+        answer_ids = [int(answer_id) for answer_id in answers.values()]
+    except (TypeError, ValueError):
+        return error_response(400, 'Invalid answers')
+    
+    spool = LEAD_INGEST_MODE == 'spool'
+    
+    conn = get_db_connection(client_write=True)
+    # Запись — один оператор, отдельная транзакция с COMMIT не нужна
+    conn.autocommit = True
+    cur = conn.cursor()
+    
+    try:
+        # Лид вместе с ответами — одна строка leads, записанная одним оператором.
+        # В режиме spool это одна строка в lead_spool без обращения к leads
+        execute_prepared(cur, 'lead_spool_insert' if spool else 'lead_insert', {
+            'quiz_id': quiz_id,
+            'name': contact_info.get('name'),
+            'phone': contact_info.get('phone'),
+            'email': contact_info.get('email', ''),
+            'segment_key': segment_key,
+            'question_ids': question_ids,
+            'answer_ids': answer_ids
+        })
+        
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    if not row:
+        return error_response(400, 'Invalid answers')
+    lead_id = row['id']
+    
+    result = {'success': True, 'lead_id': lead_id}
+    if spool:
+        result['queued'] = True
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json_dumps(result),
+        'isBase64Encoded': False
+    }
+
+def parse_quiz_tree(data: dict) -> tuple:
+    """Проверить дерево квиза из запроса; вернуть (квиз, None) или (None, ошибка)"""
+    title = (data.get('title') or '').strip()
+    slug = (data.get('slug') or '').strip()
+    questions = data.get('questions')
+    if not title or not slug or not isinstance(questions, list) or not questions:
+        return None, 'title, slug and non-empty questions are required'
+    if not QUIZ_SLUG_RE.match(slug):
+        return None, 'slug may contain only latin letters, digits, "-" and "_"'
+    if len(questions) > QUIZ_MAX_QUESTIONS:
+        return None, f'At most {QUIZ_MAX_QUESTIONS} questions per quiz'
+    
+    quiz = {
+        'title': title,
+        'slug': slug,
+        'description': data.get('description') or '',
+        'yandex_metrika_id': data.get('yandex_metrika_id') or None,
+        'is_active': bool(data.get('is_active', True)),
+        'questions': []
+    }
+    question_ids = set()
+    answer_ids = set()
+    try:
+        for question_index, question in enumerate(questions, start=1):
+            answers = question.get('answers')
+            if not (question.get('question_text') or '').strip() or not isinstance(answers, list) or not answers:
+                return None, f'Question {question_index}: question_text and non-empty answers are required'
+            if len(answers) > QUIZ_MAX_ANSWERS:
+                return None, f'Question {question_index}: at most {QUIZ_MAX_ANSWERS} answers'
+            question_id = int(question['id']) if question.get('id') else None
+            if question_id is not None:
+                if question_id in question_ids:
+                    return None, f'Question id {question_id} is repeated'
+                question_ids.add(question_id)
+            parsed_answers = []
+            for answer_index, answer in enumerate(answers, start=1):
+                if not (answer.get('answer_text') or '').strip():
+                    return None, f'Question {question_index}, answer {answer_index}: answer_text is required'
+                answer_id = int(answer['id']) if answer.get('id') else None
+                if answer_id is not None:
+                    if answer_id in answer_ids:
+                        return None, f'Answer id {answer_id} is repeated'
+                    answer_ids.add(answer_id)
+                parsed_answers.append({
+                    'id': answer_id,
+                    'answer_text': answer['answer_text'].strip(),
+                    'answer_value': str(answer.get('answer_value') or answer_index),
+                    'answer_order': int(answer.get('answer_order') or answer_index)
+                })
+            quiz['questions'].append({
+                'id': question_id,
+                'question_text': question['question_text'].strip(),
+                'question_order': int(question.get('question_order') or question_index),
+                'metrika_goal_prefix': question.get('metrika_goal_prefix') or None,
+                'answers': parsed_answers
+            })
+    except (AttributeError, TypeError, ValueError):
+        return None, 'Invalid quiz tree'
+    
+    return quiz, None
+
+def save_quiz_tree(data: dict, quiz_id=None) -> dict:
+    """Создать (quiz_id=None) или целиком заменить квиз с вопросами и ответами одной транзакцией"""
+    quiz, error = parse_quiz_tree(data)
+    if error:
+        return error_response(400, error)
+    try:
+        quiz_id = int(quiz_id) if quiz_id is not None else None
+    except (TypeError, ValueError):
+        return error_response(400, 'Quiz id must be a number')
+    
+    questions = quiz['questions']
+    answers = [answer for question in questions for answer in question['answers']]
+    
+    conn = get_db_connection(client_write=True)
+    cur = conn.cursor()
+    old_slug = None
+    
+    try:
+        if quiz_id is None:
+            cur.execute(QUIZ_INSERT_SQL, quiz)
+            quiz_id = cur.fetchone()['id']
+            existing_questions, existing_answers = set(), set()
+            # Новый квиз (например, копия существующего) получает свои id
+            for question in questions:
+                question['id'] = None
+                for answer in question['answers']:
+                    answer['id'] = None
+        else:
+            cur.execute(QUIZ_LOCK_SQL, {'quiz_id': quiz_id})
+            row = cur.fetchone()
+            if not row:
+                return error_response(404, 'Quiz not found')
+            old_slug = row['slug']
+            existing_questions, existing_answers = set(row['question_ids']), set(row['answer_ids'])
+            # Чужие или несуществующие id вопросов и ответов не принимаем
+            if any(q['id'] and q['id'] not in existing_questions for q in questions):
+                return error_response(400, 'Question id does not belong to this quiz')
+            if any(a['id'] and a['id'] not in existing_answers for a in answers):
+                return error_response(400, 'Answer id does not belong to this quiz')
+            cur.execute(QUIZ_UPDATE_SQL, {**quiz, 'quiz_id': quiz_id})
+        
+        cur.execute(QUIZ_ALLOCATE_IDS_SQL, {
+            'questions': sum(1 for q in questions if not q['id']),
+            'answers': sum(1 for a in answers if not a['id'])
+        })
+        allocated = cur.fetchone()
+        new_question_ids = iter(allocated['question_ids'])
+        new_answer_ids = iter(allocated['answer_ids'])
+        for question in questions:
+            question['id'] = question['id'] or next(new_question_ids)
+            for answer in question['answers']:
+                answer['id'] = answer['id'] or next(new_answer_ids)
+        
+        cur.execute(QUESTIONS_UPSERT_SQL, {
+            'quiz_id': quiz_id,
+            'ids': [q['id'] for q in questions],
+            'texts': [q['question_text'] for q in questions],
+            'orders': [q['question_order'] for q in questions],
+            'prefixes': [q['metrika_goal_prefix'] for q in questions]
+        })
+        cur.execute(ANSWERS_UPSERT_SQL, {
+            'ids': [a['id'] for q in questions for a in q['answers']],
+            'question_ids': [q['id'] for q in questions for _ in q['answers']],
+            'texts': [a['answer_text'] for a in answers],
+            'values': [a['answer_value'] for a in answers],
+            'orders': [a['answer_order'] for a in answers]
+        })
+        if existing_answers:
+            cur.execute(QUIZ_DELETE_ANSWERS_SQL, {'quiz_id': quiz_id, 'keep': [a['id'] for a in answers]})
+        if existing_questions:
+            cur.execute(QUIZ_DELETE_QUESTIONS_SQL, {'quiz_id': quiz_id, 'keep': [q['id'] for q in questions]})
+        
+        cur.execute('SELECT version FROM quizzes WHERE id = %s', (quiz_id,))
+        version = cur.fetchone()['version']
+        conn.commit()
+    except psycopg2.IntegrityError as e:
+        conn.rollback()
+        # Занятый slug или удаляемые ответы, на которые ссылаются старые quiz_responses
+        return error_response(409, str(e).split('\n')[0])
+    except psycopg2.DataError as e:
+        conn.rollback()
+        return error_response(400, str(e).split('\n')[0])
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    # Кэш этого экземпляра сбрасываем сразу, остальные сверят версию по истечении TTL
+    quiz_cache_drop(quiz['slug'], *([old_slug] if old_slug else []))
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json_dumps({'success': True, 'id': quiz_id, 'version': version, **quiz}),
+        'isBase64Encoded': False
+    }
+
+def flush_lead_spool() -> dict:
     conn = get_db_connection()
     cur = conn.cursor()
+    flushed = 0
+    failed = 0
     
-    cur.execute('''
-        INSERT INTO leads (quiz_id, name, phone, email, segment_key)
-        VALUES (%s, %s, %s, %s, %s)
-        RETURNING id
-    ''', (
-        quiz_id,
-        contact_info.get('name'),
-        contact_info.get('phone'),
-        contact_info.get('email', ''),
-        segment_key
-    ))
-    
-    lead_id = cur.fetchone()['id']
-    
-    for question_id, answer_id in answers.items():
-        cur.execute('''
-            INSERT INTO quiz_responses (lead_id, question_id, answer_id)
-            VALUES (%s, %s, %s)
-        ''', (lead_id, int(question_id), int(answer_id)))
+    try:
+        for _ in range(LEAD_FLUSH_MAX_BATCHES):
+            batch_failed = 0
+            try:
+                cur.execute(LEAD_FLUSH_SQL.format(extra_condition=''), (LEAD_FLUSH_BATCH,))
+                batch_flushed = cur.fetchone()['flushed']
+                conn.commit()
+            except psycopg2.IntegrityError:
+                # В пачке есть битая заявка (например, несуществующий вопрос) —
+                # переносим по одной и помечаем строки, которые не проходят
+                conn.rollback()
+                batch_flushed, batch_failed = flush_lead_spool_one_by_one(conn, cur)
+                failed += batch_failed
+            
+            flushed += batch_flushed
+            if batch_flushed + batch_failed < LEAD_FLUSH_BATCH:
+                break
+        
+        cur.execute('SELECT count(*) AS pending FROM lead_spool WHERE failed_at IS NULL')
+        pending = cur.fetchone()['pending']
+        conn.commit()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json_dumps({'success': True, 'flushed': flushed, 'failed': failed, 'pending': pending}),
+        'isBase64Encoded': False
+    }
+
+def flush_lead_spool_one_by_one(conn, cur) -> tuple:
+    cur.execute(
+        'SELECT id FROM lead_spool WHERE failed_at IS NULL ORDER BY id LIMIT %s',
+        (LEAD_FLUSH_BATCH,)
+    )
+    spool_ids = [row['id'] for row in cur.fetchall()]
+    flushed = 0
+    failed = 0
+    
+    for spool_id in spool_ids:
+        try:
+            cur.execute(LEAD_FLUSH_SQL.format(extra_condition='AND id = %s'), (spool_id, 1))
+            flushed += cur.fetchone()['flushed']
+            conn.commit()
+        except psycopg2.IntegrityError as e:
+            conn.rollback()
+            cur.execute(
+                'UPDATE lead_spool SET failed_at = CURRENT_TIMESTAMP, error = %s WHERE id = %s',
+                (str(e)[:500], spool_id)
+            )
+            conn.commit()
+            failed += 1
+    
+    return flushed, failed
+
+def refresh_lead_rollups() -> dict:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    rolled_up = 0
     
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        for _ in range(LEAD_ROLLUP_MAX_BATCHES):
+            # Отметка заблокирована — агрегат уже обновляет другой вызов
+            cur.execute(LEAD_ROLLUP_LOCK_SQL)
+            mark = cur.fetchone()
+            if not mark:
+                conn.rollback()
+                break
+            
+            cur.execute(LEAD_ROLLUP_SQL, {
+                'last_lead_id': mark['last_lead_id'],
+                'batch': LEAD_ROLLUP_BATCH,
+                'settle': LEAD_ROLLUP_SETTLE_SECONDS
+            })
+            batch_rolled_up = cur.fetchone()['rolled_up']
+            conn.commit()
+            
+            rolled_up += batch_rolled_up
+            if batch_rolled_up < LEAD_ROLLUP_BATCH:
+                break
+        
+        cur.execute("SELECT last_lead_id FROM rollup_watermarks WHERE name = 'lead_segment_daily'")
+        row = cur.fetchone()
+        conn.commit()
+    finally:
+        cur.close()
+        db_release(conn)
     
     return {
         'statusCode': 200,
@@ -142,32 +1321,508 @@ def submit_quiz_response(data: dict) -> dict:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({'success': True, 'lead_id': lead_id}),
+        'body': json_dumps({
+            'success': True,
+            'rolled_up': rolled_up,
+            'last_lead_id': row['last_lead_id'] if row else None
+        }),
         'isBase64Encoded': False
     }
 
-def get_all_quizzes() -> dict:
+def maintain_lead_partitions() -> dict:
     conn = get_db_connection()
     cur = conn.cursor()
+    created = {}
+    detached = {}
+    errors = {}
+    
+    try:
+        for table in LEAD_PARTITIONED_TABLES:
+            # Ошибка одной таблицы откатывается и логируется, остальные таблицы обслуживаются
+            try:
+                cur.execute(
+                    'SELECT ensure_monthly_partitions(%s, CURRENT_DATE, %s) AS created',
+                    (table, LEAD_PARTITION_MONTHS_AHEAD)
+                )
+                created[table] = cur.fetchone()['created']
+                
+                detached[table] = []
+                if LEAD_RETENTION_MONTHS > 0:
+                    cur.execute(
+                        'SELECT detach_monthly_partitions(%s, %s, %s) AS name',
+                        (table, LEAD_RETENTION_MONTHS, LEAD_ARCHIVE_SCHEMA or None)
+                    )
+                    detached[table] = [row['name'] for row in cur.fetchall()]
+                conn.commit()
+            except psycopg2.Error as e:
+                if conn.closed:
+                    raise
+                conn.rollback()
+                errors[table] = str(e).strip()
+                print(f"⚠️ Секции {table} не обслужены: {errors[table]}")
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    _partitions_state['checked_at'] = time.monotonic()
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json_dumps({
+            'success': not errors,
+            'created': created,
+            'detached': detached,
+            'errors': errors,
+            'archive_schema': LEAD_ARCHIVE_SCHEMA or None
+        }),
+        'isBase64Encoded': False
+    }
+
+def get_answer_stats(params: dict, if_none_match: str = '') -> dict:
+    try:
+        quiz_id = int(params.get('quiz_id') or '')
+        date_from = date.fromisoformat(params['from']) if params.get('from') else None
+        date_to = date.fromisoformat(params['to']) if params.get('to') else None
+    except ValueError:
+        return error_response(400, 'quiz_id must be a number, from and to dates in YYYY-MM-DD format')
+    
+    conn = get_db_connection(read_only=True, lead_id=params.get('lead_id'))
+    cur = conn.cursor()
+    
+    try:
+        # Без периода — счётчики за всё время, с периодом — сумма дневных счётчиков
+        if date_from or date_to:
+            cur.execute(ANSWER_STATS_DAILY_SQL, (date_from or date.min, date_to or date.max, quiz_id))
+        else:
+            cur.execute(ANSWER_STATS_SQL, (quiz_id,))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    questions = OrderedDict()
+    for row in rows:
+        question = questions.setdefault(row['question_id'], {
+            'question_id': row['question_id'],
+            'question_text': row['question_text'],
+            'total': 0,
+            'answers': []
+        })
+        question['total'] += row['responses']
+        question['answers'].append({
+            'answer_id': row['answer_id'],
+            'answer_text': row['answer_text'],
+            'answer_value': row['answer_value'],
+            'responses': row['responses']
+        })
+    for question in questions.values():
+        for answer in question['answers']:
+            answer['share'] = round(answer['responses'] / question['total'], 4) if question['total'] else 0.0
+    
+    body = json_dumps({
+        'quiz_id': quiz_id,
+        'from': date_from.isoformat() if date_from else None,
+        'to': date_to.isoformat() if date_to else None,
+        'questions': list(questions.values())
+    })
+    etag = content_etag(body)
+    
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag, STATS_CACHE_CONTROL)
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': STATS_CACHE_CONTROL,
+            'ETag': etag
+        },
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+def parse_segments_params(params: dict) -> dict:
+    try:
+        quiz_id = int(params.get('quiz_id') or '')
+    except ValueError:
+        raise ValueError('quiz_id must be a number')
+    
+    try:
+        date_to = date.fromisoformat(params['to']) if params.get('to') else date.today()
+        date_from = (
+            date.fromisoformat(params['from']) if params.get('from')
+            else date_to - timedelta(days=SEGMENTS_DEFAULT_DAYS - 1)
+        )
+    except ValueError:
+        raise ValueError('from and to must be dates in YYYY-MM-DD format')
+    
+    if date_from > date_to:
+        raise ValueError('from must not be later than to')
+    if (date_to - date_from).days >= SEGMENTS_MAX_DAYS:
+        raise ValueError(f'Date range must not exceed {SEGMENTS_MAX_DAYS} days')
+    
+    return {'quiz_id': quiz_id, 'from': date_from, 'to': date_to}
+
+def get_segment_stats(params: dict, if_none_match: str = '') -> dict:
+    try:
+        options = parse_segments_params(params)
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    conn = get_db_connection(read_only=True, lead_id=params.get('lead_id'))
+    cur = conn.cursor()
+    
+    try:
+        cur.execute('''
+            SELECT day, segment_key, leads_count
+            FROM lead_segment_daily
+            WHERE quiz_id = %s AND day BETWEEN %s AND %s
+            ORDER BY day, segment_key
+        ''', (options['quiz_id'], options['from'], options['to']))
+        rows = cur.fetchall()
+        
+        cur.execute('''
+            SELECT last_lead_id, updated_at
+            FROM rollup_watermarks
+            WHERE name = 'lead_segment_daily'
+        ''')
+        mark = cur.fetchone()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    segments = {}
+    for row in rows:
+        segments[row['segment_key']] = segments.get(row['segment_key'], 0) + row['leads_count']
     
-    cur.execute('''
-        SELECT id, title, slug, description, is_active, created_at
-        FROM quizzes 
-        ORDER BY created_at DESC
-    ''')
+    body = json_dumps({
+        'quiz_id': options['quiz_id'],
+        'from': options['from'].isoformat(),
+        'to': options['to'].isoformat(),
+        'total': sum(segments.values()),
+        'segments': [
+            {'segment_key': key, 'leads': count}
+            for key, count in sorted(segments.items(), key=lambda item: -item[1])
+        ],
+        'days': [
+            {'day': row['day'].isoformat(), 'segment_key': row['segment_key'], 'leads': row['leads_count']}
+            for row in rows
+        ],
+        'last_lead_id': mark['last_lead_id'] if mark else None,
+        'refreshed_at': mark['updated_at'].isoformat() if mark and mark['updated_at'] else None
+    })
+    etag = content_etag(body)
     
-    quizzes = cur.fetchall()
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag, STATS_CACHE_CONTROL)
     
-    cur.close()
-    conn.close()
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': STATS_CACHE_CONTROL,
+            'ETag': etag
+        },
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+def load_export_questions(conn, quiz_id: int) -> tuple:
+    """Вопросы квиза по порядку и ответы {answer_id: (question_id, answer_text)} для колонок выгрузки"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute('''
+            SELECT qs.id AS question_id, qs.question_text, a.id AS answer_id, a.answer_text
+            FROM questions qs
+            LEFT JOIN answers a ON a.question_id = qs.id
+            WHERE qs.quiz_id = %s
+            ORDER BY qs.question_order, qs.id
+        ''', (quiz_id,))
+        questions = {}
+        answers_by_id = {}
+        for row in cur.fetchall():
+            questions.setdefault(row['question_id'], row['question_text'])
+            if row['answer_id'] is not None:
+                answers_by_id[row['answer_id']] = (row['question_id'], row['answer_text'])
+    finally:
+        cur.close()
+    return list(questions.items()), answers_by_id
+
+def write_leads_export(conn, quiz_id: int, out, fmt: str, after_id: int = 0,
+                       limit: int = None, header: bool = True) -> dict:
+    """Записать лиды квиза в out построчно (CSV или NDJSON); вернуть число лидов,
+    id последнего и есть ли лиды дальше limit"""
+    questions, answers_by_id = load_export_questions(conn, quiz_id)
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer and header:
+        writer.writerow(LEAD_EXPORT_COLUMNS + [text for _, text in questions])
+    
+    sql = LEAD_EXPORT_SQL
+    query_params = [quiz_id, after_id]
+    if limit is not None:
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        sql += ' LIMIT %s'
+        query_params.append(limit + 1)
+    
+    cur = conn.cursor(name='lead_export', cursor_factory=RealDictCursor)
+    cur.itersize = LEAD_EXPORT_CHUNK
+    count = 0
+    last_id = None
+    has_more = False
+    
+    try:
+        cur.execute(sql, query_params)
+        for row in cur:
+            if limit is not None and count == limit:
+                has_more = True
+                break
+            answers = dict(answers_by_id[a] for a in row['answer_ids'] if a in answers_by_id)
+            created_at = row['created_at'].isoformat() if row['created_at'] else None
+            if writer:
+                writer.writerow(
+                    [row['lead_id'], created_at, row['name'], row['phone'], row['email'], row['segment_key']]
+                    + [answers.get(question_id, '') for question_id, _ in questions]
+                )
+            else:
+                out.write(json_dumps({
+                    'lead_id': row['lead_id'],
+                    'created_at': created_at,
+                    'name': row['name'],
+                    'phone': row['phone'],
+                    'email': row['email'],
+                    'segment_key': row['segment_key'],
+                    'answers': {
+                        str(question_id): answers[question_id]
+                        for question_id, _ in questions if question_id in answers
+                    }
+                }) + '\n')
+            count += 1
+            last_id = row['lead_id']
+    finally:
+        cur.close()
+        conn.commit()
+    
+    return {'count': count, 'last_id': last_id, 'has_more': has_more}
+
+def export_leads(params: dict) -> dict:
+    fmt = params.get('format') or 'csv'
+    if fmt not in LEAD_EXPORT_FORMATS:
+        return error_response(400, f'format must be one of: {", ".join(LEAD_EXPORT_FORMATS)}')
+    try:
+        quiz_id = int(params.get('quiz_id') or '')
+        after_id = int(params.get('after') or 0)
+        limit = int(params.get('limit') or LEAD_EXPORT_DEFAULT_LIMIT)
+    except ValueError:
+        return error_response(400, 'quiz_id, after and limit must be numbers')
+    limit = max(1, min(limit, LEAD_EXPORT_MAX_LIMIT))
+    
+    out = io.StringIO()
+    conn = get_db_connection(read_only=True, lead_id=params.get('lead_id'))
+    try:
+        # Заголовок CSV только на первой странице — страницы можно склеивать подряд
+        result = write_leads_export(conn, quiz_id, out, fmt, after_id, limit, header=not after_id)
+    finally:
+        db_release(conn)
+    
+    headers = {
+        'Content-Type': LEAD_EXPORT_FORMATS[fmt],
+        'Content-Disposition': f'attachment; filename="leads-{quiz_id}.{fmt}"',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Exported-Count',
+        'Cache-Control': 'no-store',
+        'X-Exported-Count': str(result['count'])
+    }
+    if result['has_more']:
+        headers['X-Next-Cursor'] = str(result['last_id'])
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': out.getvalue(),
+        'isBase64Encoded': False
+    }
+
+def request_quiz_export(force: bool = False) -> list:
+    """Попросить deploy-long выгрузить снапшоты квизов для каждого конфига из QUIZ_EXPORT_CONFIGS"""
+    results = []
+    for config_name in QUIZ_EXPORT_CONFIGS:
+        try:
+            resp = requests.post(
+                QUIZ_EXPORT_URL,
+                json={'config_name': config_name, 'action': 'export_quizzes', 'force': force},
+                timeout=QUIZ_EXPORT_TIMEOUT
+            )
+            data = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            results.append({'config_name': config_name, 'success': False, 'error': str(e)})
+            continue
+        results.append({
+            'config_name': config_name,
+            'success': resp.status_code == 200,
+            'exported': data.get('exported'),
+            'removed': data.get('removed'),
+            'error': data.get('error')
+        })
+    return results
+
+def export_quiz_snapshots(force: bool = False) -> dict:
+    if not QUIZ_EXPORT_URL or not QUIZ_EXPORT_CONFIGS:
+        return error_response(501, 'Quiz export is not configured')
     
+    results = request_quiz_export(force)
     return {
         'statusCode': 200,
         'headers': {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps([dict(q) for q in quizzes], default=str),
+        'body': json_dumps({'success': all(r['success'] for r in results), 'exports': results}),
+        'isBase64Encoded': False
+    }
+
+def export_quiz_snapshots_if_changed():
+    """Запустить выгрузку, если набор (slug, version) активных квизов изменился с прошлого раза.
+    Отпечаток хранится в памяти инстанса: после холодного старта выгрузка запускается один раз,
+    а deploy-long сам пропускает квизы, версия которых уже выгружена"""
+    if not QUIZ_EXPORT_URL or not QUIZ_EXPORT_CONFIGS:
+        return
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(QUIZ_EXPORT_FINGERPRINT_SQL)
+        fingerprint = cur.fetchone()['fingerprint']
+        conn.commit()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    if fingerprint == _quiz_export_state['fingerprint']:
+        return
+    if all(r['success'] for r in request_quiz_export()):
+        _quiz_export_state['fingerprint'] = fingerprint
+
+def is_timer_event(event: dict) -> bool:
+    messages = event.get('messages') or []
+    return any(
+        'TimerMessage' in ((m.get('event_metadata') or {}).get('event_type') or '')
+        for m in messages if isinstance(m, dict)
+    )
+
+def parse_list_params(params: dict) -> dict:
+    try:
+        limit = int(params.get('limit') or LIST_DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError('limit must be a number')
+    
+    fields = [f.strip() for f in (params.get('fields') or '').split(',') if f.strip()] or LIST_DEFAULT_FIELDS
+    unknown = [f for f in fields if f not in LIST_ALLOWED_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    
+    is_active = params.get('is_active')
+    if is_active is not None:
+        if is_active.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('is_active must be true or false')
+        is_active = is_active.lower() in ('true', '1')
+    
+    # Курсор — base64("<created_at ISO>|<id>"); пустой created_at — строка с NULL,
+    # такие строки в ORDER BY created_at DESC идут первыми
+    after = None
+    if params.get('after'):
+        try:
+            created_at, quiz_id = base64.urlsafe_b64decode(params['after'].encode()).decode().rsplit('|', 1)
+            after = (datetime.fromisoformat(created_at) if created_at else None, int(quiz_id))
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError('Invalid cursor')
+    
+    return {
+        'limit': max(1, min(limit, LIST_MAX_LIMIT)),
+        'fields': fields,
+        'is_active': is_active,
+        'after': after
+    }
+
+def encode_list_cursor(created_at, quiz_id: int) -> str:
+    created_at = created_at.isoformat() if created_at is not None else ''
+    return base64.urlsafe_b64encode(f'{created_at}|{quiz_id}'.encode()).decode()
+
+def get_all_quizzes(params: dict, if_none_match: str = '') -> dict:
+    try:
+        options = parse_list_params(params)
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    # id и created_at нужны для курсора, даже если их нет в fields
+    columns = list(dict.fromkeys(['id', 'created_at'] + options['fields']))
+    conditions = []
+    query_params = []
+    
+    if options['is_active'] is not None:
+        conditions.append('is_active = %s')
+        query_params.append(options['is_active'])
+    
+    if options['after']:
+        created_at, quiz_id = options['after']
+        if created_at is None:
+            conditions.append('(created_at IS NOT NULL OR id < %s)')
+            query_params.append(quiz_id)
+        else:
+            conditions.append('(created_at, id) < (%s, %s)')
+            query_params.extend([created_at, quiz_id])
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+    query_params.append(options['limit'] + 1)
+    
+    conn = get_db_connection(read_only=True)
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(f'''
+            SELECT {', '.join(columns)}
+            FROM quizzes 
+            {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        ''', query_params)
+        
+        quizzes = cur.fetchall()
+    finally:
+        cur.close()
+        db_release(conn)
+    
+    next_cursor = None
+    if len(quizzes) > options['limit']:
+        quizzes = quizzes[:options['limit']]
+        next_cursor = encode_list_cursor(quizzes[-1]['created_at'], quizzes[-1]['id'])
+    
+    body = json_dumps([{f: q[f] for f in options['fields']} for q in quizzes])
+    etag = content_etag(body + (next_cursor or ''))
+    
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag, LIST_CACHE_CONTROL)
+    
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor',
+        'Cache-Control': LIST_CACHE_CONTROL,
+        'ETag': etag
+    }
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': body,
         'isBase64Encoded': False
     }
 
@@ -178,6 +1833,6 @@ def error_response(status_code: int, message: str) -> dict:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({'error': message}),
+        'body': json_dumps({'error': message}),
         'isBase64Encoded': False
     }
\ No newline at end of file
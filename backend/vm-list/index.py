@@ -1,8 +1,108 @@
 import json
 import os
+import time
+import threading
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
+from decimal import Decimal
+
+
+# JSON-ответы: orjson, если пакет установлен, иначе стандартный json с тем же результатом.
+# Строки RealDictCursor сериализуются как обычные dict, даты — в ISO 8601, Decimal — строкой
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    """Значения вне типов JSON: Decimal строкой без потери точности, даты через isoformat()"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def json_dumps(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
 
 
 def handler(event: dict, context) -> dict:
@@ -25,7 +125,7 @@ def handler(event: dict, context) -> dict:
         dsn = os.environ['DATABASE_URL']
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
         
-        conn = psycopg2.connect(dsn)
+        conn = db_connect(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
@@ -48,14 +148,14 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'VM не найдена'}),
+                        'body': json_dumps({'error': 'VM не найдена'}),
                         'isBase64Encoded': False
                     }
                 
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(dict(vm), default=str),
+                    'body': json_dumps(dict(vm)),
                     'isBase64Encoded': False
                 }
             else:
@@ -73,7 +173,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps([dict(vm) for vm in vms], default=str),
+                    'body': json_dumps([dict(vm) for vm in vms]),
                     'isBase64Encoded': False
                 }
         
@@ -85,11 +185,11 @@ def handler(event: dict, context) -> dict:
                 
                 if not vm_id:
                     cur.close()
-                    conn.close()
+                    db_release(conn)
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Укажи id VM'}),
+                        'body': json_dumps({'error': 'Укажи id VM'}),
                         'isBase64Encoded': False
                     }
                 
@@ -106,11 +206,11 @@ def handler(event: dict, context) -> dict:
                 
                 if not vm:
                     cur.close()
-                    conn.close()
+                    db_release(conn)
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'VM не найдена'}),
+                        'body': json_dumps({'error': 'VM не найдена'}),
                         'isBase64Encoded': False
                     }
                 
@@ -185,13 +285,13 @@ def handler(event: dict, context) -> dict:
                 deleted = cur.fetchone()
                 conn.commit()
                 cur.close()
-                conn.close()
+                db_release(conn)
                 
                 if not deleted:
                     return {
                         'statusCode': 404,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'VM не найдена в БД', 'logs': logs}),
+                        'body': json_dumps({'error': 'VM не найдена в БД', 'logs': logs}),
                         'isBase64Encoded': False
                     }
                 
@@ -200,7 +300,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
+                    'body': json_dumps({
                         'success': True,
                         'message': f'VM {vm_name} удалена',
                         'logs': logs,
@@ -218,7 +318,7 @@ def handler(event: dict, context) -> dict:
                         pass
                 if 'conn' in locals():
                     try:
-                        conn.close()
+                        db_release(conn)
                     except:
                         pass
                 
@@ -230,7 +330,7 @@ def handler(event: dict, context) -> dict:
                 return {
                     'statusCode': 500,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
+                    'body': json_dumps({
                         'error': str(delete_error),
                         'details': error_details
                     }),
@@ -241,7 +341,7 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Метод не поддерживается'}),
+                'body': json_dumps({'error': 'Метод не поддерживается'}),
                 'isBase64Encoded': False
             }
         
@@ -249,7 +349,7 @@ def handler(event: dict, context) -> dict:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Секрет не найден: {str(e)}'}),
+            'body': json_dumps({'error': f'Секрет не найден: {str(e)}'}),
             'isBase64Encoded': False
         }
     except Exception as e:
@@ -260,7 +360,7 @@ def handler(event: dict, context) -> dict:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
+            'body': json_dumps({
                 'error': str(e),
                 'details': error_details if 'error_details' in locals() else None
             }),
@@ -270,4 +370,4 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            db_release(conn)
\ No newline at end of file
@@ -1,11 +1,87 @@
 import json
 import os
+import time
+import threading
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
 import base64
 
 
+# Пул соединений с БД живёт на уровне модуля и переживает тёплые вызовы функции:
+# соединение проверяется, если долго простаивало, и пересоздаётся по возрасту
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', '300'))
+DB_CONN_CHECK_AFTER = float(os.environ.get('DB_CONN_CHECK_AFTER', '10'))
+
+_db_pool = {}  # dsn -> [(conn, released_at)]
+_db_conn_meta = {}  # id(conn) -> {'dsn', 'created_at', 'in_use'}
+_db_pool_lock = threading.Lock()
+
+
+def db_connect(dsn: str):
+    """Взять живое соединение из пула или открыть новое"""
+    while True:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(dsn, [])
+            if not idle:
+                break
+            conn, released_at = idle.pop()
+        meta = _db_conn_meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or not meta or now - meta['created_at'] > DB_CONN_MAX_AGE:
+            db_discard(conn)
+            continue
+        if now - released_at > DB_CONN_CHECK_AFTER:
+            try:
+                check = conn.cursor()
+                check.execute('SELECT 1')
+                check.close()
+                conn.rollback()
+            except psycopg2.Error:
+                db_discard(conn)
+                continue
+        meta['in_use'] = True
+        return conn
+
+    conn = psycopg2.connect(dsn)
+    _db_conn_meta[id(conn)] = {'dsn': dsn, 'created_at': time.monotonic(), 'in_use': True}
+    return conn
+
+
+def db_release(conn):
+    """Вернуть соединение в пул; повторный вызов для того же соединения ничего не делает"""
+    with _db_pool_lock:
+        meta = _db_conn_meta.get(id(conn))
+        if not meta or not meta['in_use']:
+            return
+        meta['in_use'] = False
+    try:
+        if conn.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        db_discard(conn)
+        return
+    if time.monotonic() - meta['created_at'] <= DB_CONN_MAX_AGE:
+        with _db_pool_lock:
+            idle = _db_pool.setdefault(meta['dsn'], [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+    db_discard(conn)
+
+
+def db_discard(conn):
+    _db_conn_meta.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
 def handler(event, context):
     """Автоматическое создание и настройка VM с генерацией SSH ключей"""
     method = event.get('httpMethod', 'POST')
@@ -39,7 +115,7 @@ def handler(event, context):
         
         dsn = os.environ['DATABASE_URL']
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-        conn = psycopg2.connect(dsn)
+        conn = db_connect(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # Проверяем существует ли VM с таким именем
@@ -50,7 +126,7 @@ def handler(event, context):
         existing = cur.fetchone()
         if existing:
             cur.close()
-            conn.close()
+            db_release(conn)
             return {
                 'statusCode': 400,
                 'headers': {
@@ -257,7 +333,7 @@ runcmd:
         conn.commit()
         
         cur.close()
-        conn.close()
+        db_release(conn)
         
         message = f'Сервер создан! IP: {ip_address}'
         if not ssh_ready:
@@ -291,6 +367,13 @@ runcmd:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    finally:
+        # Соединение возвращается в пул и при ошибке (например, API облака или SSH);
+        # повторный db_release после явного возврата ничего не делает
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            db_release(conn)
 
 
 def get_folder_id(iam_token):
@@ -0,0 +1,101 @@
+-- Версия квиза: растёт при любом изменении квиза, его вопросов или ответов.
+-- quiz-api сверяет её с закэшированной, чтобы не пересобирать дерево квиза.
+ALTER TABLE quizzes
+ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+-- Прямое изменение квиза поднимает версию (если её не подняли явно)
+CREATE OR REPLACE FUNCTION quizzes_bump_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.version = OLD.version THEN
+        NEW.version := OLD.version + 1;
+        NEW.updated_at := CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_quizzes_bump_version ON quizzes;
+CREATE TRIGGER trg_quizzes_bump_version
+    BEFORE UPDATE ON quizzes
+    FOR EACH ROW EXECUTE FUNCTION quizzes_bump_version();
+
+-- Изменения вопросов: одна правка квиза на оператор, а не на каждую строку
+CREATE OR REPLACE FUNCTION questions_bump_quiz_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE quizzes SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (SELECT quiz_id FROM new_rows);
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE quizzes SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (SELECT quiz_id FROM new_rows UNION SELECT quiz_id FROM old_rows);
+    ELSE
+        UPDATE quizzes SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (SELECT quiz_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_questions_insert_bump_version ON questions;
+CREATE TRIGGER trg_questions_insert_bump_version
+    AFTER INSERT ON questions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION questions_bump_quiz_version();
+
+DROP TRIGGER IF EXISTS trg_questions_update_bump_version ON questions;
+CREATE TRIGGER trg_questions_update_bump_version
+    AFTER UPDATE ON questions
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION questions_bump_quiz_version();
+
+DROP TRIGGER IF EXISTS trg_questions_delete_bump_version ON questions;
+CREATE TRIGGER trg_questions_delete_bump_version
+    AFTER DELETE ON questions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION questions_bump_quiz_version();
+
+-- Изменения ответов: квиз находим через вопросы
+CREATE OR REPLACE FUNCTION answers_bump_quiz_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE quizzes SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT qs.quiz_id FROM questions qs
+            WHERE qs.id IN (SELECT question_id FROM new_rows)
+        );
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE quizzes SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT qs.quiz_id FROM questions qs
+            WHERE qs.id IN (SELECT question_id FROM new_rows UNION SELECT question_id FROM old_rows)
+        );
+    ELSE
+        UPDATE quizzes SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT qs.quiz_id FROM questions qs
+            WHERE qs.id IN (SELECT question_id FROM old_rows)
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_answers_insert_bump_version ON answers;
+CREATE TRIGGER trg_answers_insert_bump_version
+    AFTER INSERT ON answers
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION answers_bump_quiz_version();
+
+DROP TRIGGER IF EXISTS trg_answers_update_bump_version ON answers;
+CREATE TRIGGER trg_answers_update_bump_version
+    AFTER UPDATE ON answers
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION answers_bump_quiz_version();
+
+DROP TRIGGER IF EXISTS trg_answers_delete_bump_version ON answers;
+CREATE TRIGGER trg_answers_delete_bump_version
+    AFTER DELETE ON answers
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION answers_bump_quiz_version();
+
+COMMENT ON COLUMN quizzes.version IS 'Версия квиза: увеличивается триггерами при изменении квиза, вопросов или ответов';
@@ -0,0 +1,8 @@
+-- Индексы под постраничный список квизов: ORDER BY created_at DESC, id DESC
+-- с курсором (created_at, id) и необязательным фильтром is_active
+CREATE INDEX IF NOT EXISTS idx_quizzes_created_at_id
+ON quizzes (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_quizzes_active_created_at_id
+ON quizzes (created_at DESC, id DESC)
+WHERE is_active = true;
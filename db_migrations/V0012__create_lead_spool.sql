@@ -0,0 +1,25 @@
+-- Буфер входящих заявок: в режиме LEAD_INGEST_MODE=spool quiz-api только дописывает
+-- сюда строку и сразу отвечает, а flush переносит заявки в leads/quiz_responses пачками.
+-- id лида выдаётся из последовательности leads сразу, чтобы вернуть его клиенту.
+CREATE TABLE IF NOT EXISTS lead_spool (
+    id BIGSERIAL PRIMARY KEY,
+    lead_id INTEGER NOT NULL UNIQUE,
+    quiz_id INTEGER NOT NULL,
+    name VARCHAR(255),
+    phone VARCHAR(50),
+    email VARCHAR(255),
+    segment_key VARCHAR(255),
+    question_ids INTEGER[] NOT NULL,
+    answer_ids INTEGER[] NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    failed_at TIMESTAMP,
+    error TEXT
+);
+
+-- flush выбирает только необработанные строки по порядку поступления
+CREATE INDEX IF NOT EXISTS idx_lead_spool_pending
+ON lead_spool (id)
+WHERE failed_at IS NULL;
+
+COMMENT ON TABLE lead_spool IS 'Буфер заявок квизов для пакетной записи в leads/quiz_responses';
+COMMENT ON COLUMN lead_spool.error IS 'Ошибка переноса: строка исключается из flush до ручного разбора';
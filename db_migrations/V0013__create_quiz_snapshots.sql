@@ -0,0 +1,78 @@
+-- Готовое дерево активного квиза (вопросы и ответы) для чтения одним запросом по slug.
+-- Изменения вопросов и ответов поднимают quizzes.version (V0010), поэтому снапшот
+-- достаточно пересобирать триггером на quizzes: правка из одного оператора —
+-- одна пересборка, а не по строке на каждый ответ.
+CREATE TABLE IF NOT EXISTS quiz_snapshots (
+    slug VARCHAR(100) PRIMARY KEY,
+    quiz_id INTEGER NOT NULL UNIQUE REFERENCES quizzes(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    payload JSONB NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION quiz_snapshot_payload(p_quiz_id INTEGER) RETURNS jsonb AS $$
+    SELECT jsonb_build_object(
+        'id', q.id,
+        'title', q.title,
+        'slug', q.slug,
+        'description', q.description,
+        'yandex_metrika_id', q.yandex_metrika_id,
+        'is_active', q.is_active,
+        'questions', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', qs.id,
+                'question_text', qs.question_text,
+                'question_order', qs.question_order,
+                'metrika_goal_prefix', qs.metrika_goal_prefix,
+                'answers', COALESCE((
+                    SELECT jsonb_agg(jsonb_build_object(
+                        'id', a.id,
+                        'answer_text', a.answer_text,
+                        'answer_value', a.answer_value,
+                        'answer_order', a.answer_order
+                    ) ORDER BY a.answer_order)
+                    FROM answers a
+                    WHERE a.question_id = qs.id
+                ), '[]'::jsonb)
+            ) ORDER BY qs.question_order)
+            FROM questions qs
+            WHERE qs.quiz_id = q.id
+        ), '[]'::jsonb)
+    )
+    FROM quizzes q
+    WHERE q.id = p_quiz_id;
+$$ LANGUAGE sql STABLE;
+
+-- Снапшот есть только у активных квизов; при смене slug старая запись удаляется
+CREATE OR REPLACE FUNCTION quizzes_refresh_snapshot() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM quiz_snapshots
+    WHERE quiz_id = NEW.id AND (slug <> NEW.slug OR NOT COALESCE(NEW.is_active, false));
+
+    IF COALESCE(NEW.is_active, false) THEN
+        INSERT INTO quiz_snapshots (slug, quiz_id, version, payload, updated_at)
+        VALUES (NEW.slug, NEW.id, NEW.version, quiz_snapshot_payload(NEW.id), CURRENT_TIMESTAMP)
+        ON CONFLICT (slug) DO UPDATE
+        SET quiz_id = EXCLUDED.quiz_id,
+            version = EXCLUDED.version,
+            payload = EXCLUDED.payload,
+            updated_at = EXCLUDED.updated_at;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_quizzes_refresh_snapshot ON quizzes;
+CREATE TRIGGER trg_quizzes_refresh_snapshot
+    AFTER INSERT OR UPDATE ON quizzes
+    FOR EACH ROW EXECUTE FUNCTION quizzes_refresh_snapshot();
+
+-- Заполняем снапшоты для уже существующих квизов
+INSERT INTO quiz_snapshots (slug, quiz_id, version, payload)
+SELECT slug, id, version, quiz_snapshot_payload(id)
+FROM quizzes
+WHERE is_active = true
+ON CONFLICT (slug) DO NOTHING;
+
+COMMENT ON TABLE quiz_snapshots IS 'Дерево активного квиза для quiz-api (action=get); пересобирается триггером при изменении версии квиза';
+COMMENT ON COLUMN quiz_snapshots.version IS 'Версия квиза (quizzes.version), из которой собран снапшот';
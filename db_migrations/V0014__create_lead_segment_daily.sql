@@ -0,0 +1,25 @@
+-- Число лидов по квизу, сегменту и дню. Дашборды читают агрегат вместо скана leads.
+-- Таблица пополняется инкрементально: quiz-api (action=rollup и таймер) добавляет лиды
+-- с id больше отметки в rollup_watermarks и сдвигает отметку.
+CREATE TABLE IF NOT EXISTS lead_segment_daily (
+    quiz_id INTEGER NOT NULL REFERENCES quizzes(id),
+    day DATE NOT NULL,
+    segment_key VARCHAR(255) NOT NULL DEFAULT '',
+    leads_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (quiz_id, day, segment_key)
+);
+
+-- Отметки инкрементальных агрегатов: последний учтённый leads.id
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR(100) PRIMARY KEY,
+    last_lead_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Отметка с нуля: уже накопленные лиды попадут в агрегат при первых обновлениях
+INSERT INTO rollup_watermarks (name, last_lead_id)
+VALUES ('lead_segment_daily', 0)
+ON CONFLICT (name) DO NOTHING;
+
+COMMENT ON TABLE lead_segment_daily IS 'Лиды по квизу, дню и сегменту; обновляется инкрементально по rollup_watermarks';
+COMMENT ON COLUMN rollup_watermarks.last_lead_id IS 'Лиды с id не больше отметки уже учтены в агрегате';
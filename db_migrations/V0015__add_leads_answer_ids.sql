@@ -0,0 +1,21 @@
+-- Ответы лида одним массивом id ответов вместо строки quiz_responses на каждый ответ:
+-- вопрос однозначно определяется ответом (answers.question_id), а отдельные строки
+-- со своим id, временем и тремя внешними ключами умножали размер таблиц и индексов
+-- на число вопросов. quiz-api пишет и читает только leads.answer_ids.
+ALTER TABLE leads
+ADD COLUMN IF NOT EXISTS answer_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+-- Переносим ответы уже записанных лидов
+UPDATE leads l
+SET answer_ids = r.answer_ids
+FROM (
+    SELECT lead_id, array_agg(answer_id ORDER BY question_id) AS answer_ids
+    FROM quiz_responses
+    WHERE answer_id IS NOT NULL
+    GROUP BY lead_id
+) r
+WHERE l.id = r.lead_id AND l.answer_ids = '{}';
+
+COMMENT ON COLUMN leads.answer_ids IS 'id выбранных ответов лида; вопрос определяется через answers.question_id';
+COMMENT ON TABLE quiz_responses IS 'Устарела: ответы лидов хранятся в leads.answer_ids (V0015), новые строки не пишутся';
+COMMENT ON TABLE lead_spool IS 'Буфер заявок квизов для пакетной записи в leads';
@@ -0,0 +1,137 @@
+-- leads и quiz_responses становятся секционированными по месяцам (created_at).
+-- Вакуум и индексы работают с небольшими месячными секциями, запросы за период
+-- читают только нужные месяцы, а старые месяцы можно отсоединить целиком.
+-- Ключ секционирования входит в первичный ключ, поэтому id уникален в паре с created_at,
+-- а внешний ключ quiz_responses.lead_id → leads(id) больше невозможен.
+-- Секции на будущие месяцы создаёт quiz-api (таймер или action=partitions)
+-- через ensure_monthly_partitions(), старые отсоединяет detach_monthly_partitions().
+
+-- Секции <table>_pYYYYMM с начала месяца p_from до p_months_ahead месяцев вперёд
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(
+    p_table TEXT, p_from DATE, p_months_ahead INTEGER
+) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_from)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead))::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('%s_p%s', p_table, to_char(month_start, 'YYYYMM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, p_table, month_start, (month_start + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Отсоединить секции старше p_keep_months месяцев: перенести в схему p_archive_schema
+-- или удалить, если схема не указана. Возвращает имена обработанных секций
+CREATE OR REPLACE FUNCTION detach_monthly_partitions(
+    p_table TEXT, p_keep_months INTEGER, p_archive_schema TEXT
+) RETURNS SETOF TEXT AS $$
+DECLARE
+    cutoff TEXT := to_char(date_trunc('month', CURRENT_DATE) - make_interval(months => p_keep_months), 'YYYYMM');
+    partition_name TEXT;
+BEGIN
+    IF p_archive_schema IS NOT NULL AND p_archive_schema <> '' THEN
+        EXECUTE format('CREATE SCHEMA IF NOT EXISTS %I', p_archive_schema);
+    END IF;
+
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = p_table::regclass
+          AND c.relname ~ ('^' || p_table || '_p[0-9]{6}$')
+          AND right(c.relname, 6) < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', p_table, partition_name);
+        IF p_archive_schema IS NOT NULL AND p_archive_schema <> '' THEN
+            EXECUTE format('ALTER TABLE %I SET SCHEMA %I', partition_name, p_archive_schema);
+        ELSE
+            EXECUTE format('DROP TABLE %I', partition_name);
+        END IF;
+        RETURN NEXT partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- leads
+ALTER TABLE quiz_responses DROP CONSTRAINT IF EXISTS quiz_responses_lead_id_fkey;
+ALTER TABLE leads RENAME TO leads_unpartitioned;
+ALTER INDEX IF EXISTS idx_leads_quiz_id RENAME TO idx_leads_unpartitioned_quiz_id;
+ALTER INDEX IF EXISTS idx_leads_segment_key RENAME TO idx_leads_unpartitioned_segment_key;
+
+CREATE TABLE leads (
+    id INTEGER NOT NULL DEFAULT nextval('leads_id_seq'),
+    quiz_id INTEGER REFERENCES quizzes(id),
+    name VARCHAR(255),
+    phone VARCHAR(50),
+    email VARCHAR(255),
+    segment_key VARCHAR(255),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    answer_ids INTEGER[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE leads_id_seq OWNED BY leads.id;
+
+CREATE INDEX IF NOT EXISTS idx_leads_quiz_id ON leads(quiz_id);
+CREATE INDEX IF NOT EXISTS idx_leads_segment_key ON leads(segment_key);
+
+-- Строки вне созданных месяцев не теряются, а попадают сюда
+CREATE TABLE IF NOT EXISTS leads_default PARTITION OF leads DEFAULT;
+
+SELECT ensure_monthly_partitions(
+    'leads',
+    COALESCE((SELECT min(created_at)::date FROM leads_unpartitioned), CURRENT_DATE),
+    3
+);
+
+INSERT INTO leads (id, quiz_id, name, phone, email, segment_key, created_at, answer_ids)
+SELECT id, quiz_id, name, phone, email, segment_key, COALESCE(created_at, CURRENT_TIMESTAMP), answer_ids
+FROM leads_unpartitioned;
+
+-- quiz_responses
+ALTER TABLE quiz_responses RENAME TO quiz_responses_unpartitioned;
+ALTER INDEX IF EXISTS idx_quiz_responses_lead_id RENAME TO idx_quiz_responses_unpartitioned_lead_id;
+
+CREATE TABLE quiz_responses (
+    id INTEGER NOT NULL DEFAULT nextval('quiz_responses_id_seq'),
+    lead_id INTEGER,
+    question_id INTEGER REFERENCES questions(id),
+    answer_id INTEGER REFERENCES answers(id),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE quiz_responses_id_seq OWNED BY quiz_responses.id;
+
+CREATE INDEX IF NOT EXISTS idx_quiz_responses_lead_id ON quiz_responses(lead_id);
+
+CREATE TABLE IF NOT EXISTS quiz_responses_default PARTITION OF quiz_responses DEFAULT;
+
+SELECT ensure_monthly_partitions(
+    'quiz_responses',
+    COALESCE((SELECT min(created_at)::date FROM quiz_responses_unpartitioned), CURRENT_DATE),
+    3
+);
+
+INSERT INTO quiz_responses (id, lead_id, question_id, answer_id, created_at)
+SELECT id, lead_id, question_id, answer_id, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM quiz_responses_unpartitioned;
+
+DROP TABLE quiz_responses_unpartitioned;
+DROP TABLE leads_unpartitioned;
+
+COMMENT ON TABLE leads IS 'Лиды квизов, секции по месяцам created_at (<table>_pYYYYMM)';
+COMMENT ON COLUMN leads.answer_ids IS 'id выбранных ответов лида; вопрос определяется через answers.question_id';
+COMMENT ON TABLE quiz_responses IS 'Устарела: ответы лидов хранятся в leads.answer_ids (V0015), новые строки не пишутся';
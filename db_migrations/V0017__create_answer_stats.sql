@@ -0,0 +1,37 @@
+-- Счётчики выбора ответов: распределение по вопросам квиза читается за O(ответов),
+-- без скана лидов. quiz-api увеличивает счётчики тем же оператором, что пишет лид.
+-- Счётчик ответа разбит на шарды (shard = id лида по модулю ANSWER_STATS_SHARDS),
+-- чтобы одновременные заявки с популярным ответом не ждали блокировку одной строки;
+-- при чтении шарды суммируются, поэтому число шардов можно менять без миграции.
+CREATE TABLE IF NOT EXISTS answer_stats (
+    answer_id INTEGER NOT NULL REFERENCES answers(id) ON DELETE CASCADE,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    responses BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (answer_id, shard)
+);
+
+CREATE TABLE IF NOT EXISTS answer_stats_daily (
+    answer_id INTEGER NOT NULL REFERENCES answers(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    responses BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (answer_id, day, shard)
+);
+
+-- Счётчики для уже записанных лидов
+INSERT INTO answer_stats (answer_id, shard, responses)
+SELECT a.answer_id, 0, count(*)
+FROM leads l, unnest(l.answer_ids) AS a(answer_id)
+WHERE EXISTS (SELECT 1 FROM answers WHERE id = a.answer_id)
+GROUP BY a.answer_id
+ON CONFLICT (answer_id, shard) DO NOTHING;
+
+INSERT INTO answer_stats_daily (answer_id, day, shard, responses)
+SELECT a.answer_id, l.created_at::date, 0, count(*)
+FROM leads l, unnest(l.answer_ids) AS a(answer_id)
+WHERE EXISTS (SELECT 1 FROM answers WHERE id = a.answer_id)
+GROUP BY a.answer_id, l.created_at::date
+ON CONFLICT (answer_id, day, shard) DO NOTHING;
+
+COMMENT ON TABLE answer_stats IS 'Сколько раз выбран ответ; сумма по шардам';
+COMMENT ON TABLE answer_stats_daily IS 'Сколько раз выбран ответ по дням создания лида; сумма по шардам';
@@ -0,0 +1,10 @@
+-- Коммит последнего деплоя: deploy-long обновляет исходники на VM через
+-- git fetch --depth=1 + reset вместо полного клонирования и по прошлому SHA
+-- показывает, изменилось ли что-то с предыдущего деплоя
+ALTER TABLE deploy_configs
+ADD COLUMN IF NOT EXISTS deployed_sha VARCHAR(40),
+ADD COLUMN IF NOT EXISTS deployed_ref VARCHAR(255),
+ADD COLUMN IF NOT EXISTS deployed_at TIMESTAMP;
+
+COMMENT ON COLUMN deploy_configs.deployed_sha IS 'SHA коммита, выложенного последним деплоем';
+COMMENT ON COLUMN deploy_configs.deployed_ref IS 'Ветка или тег последнего деплоя, NULL — ветка репозитория по умолчанию';
@@ -0,0 +1,10 @@
+-- deployed_sha должен указывать на коммит, который реально отдаёт nginx (симлинк current).
+-- deploy-long пишет сюда коммит, отправленный в сборку, а в deployed_sha/deployed_ref он
+-- переносится только когда current уже смотрит на собранный из него релиз
+ALTER TABLE deploy_configs
+ADD COLUMN IF NOT EXISTS pending_sha VARCHAR(40),
+ADD COLUMN IF NOT EXISTS pending_ref VARCHAR(255);
+
+COMMENT ON COLUMN deploy_configs.pending_sha IS 'SHA коммита, отправленного в сборку последним деплоем (может быть ещё не опубликован)';
+COMMENT ON COLUMN deploy_configs.pending_ref IS 'Ветка или тег для pending_sha, NULL — ветка репозитория по умолчанию';
+COMMENT ON COLUMN deploy_configs.deployed_sha IS 'SHA коммита опубликованного релиза, на который смотрит current';
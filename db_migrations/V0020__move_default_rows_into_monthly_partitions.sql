@@ -0,0 +1,62 @@
+-- Строки месяца без секции (например, created_at из будущего при сбитых часах) попадают
+-- в DEFAULT-секцию, после чего CREATE TABLE ... PARTITION OF на этот месяц падает:
+-- DEFAULT уже содержит строки из диапазона новой секции. Теперь такие строки переносятся:
+-- секция создаётся отдельной таблицей, строки месяца переезжают в неё из DEFAULT
+-- и только потом она присоединяется к родительской таблице.
+-- Секционирование leads и quiz_responses — по created_at (V0016)
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(
+    p_table TEXT, p_from DATE, p_months_ahead INTEGER
+) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_from)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead))::date;
+    month_end DATE;
+    partition_name TEXT;
+    default_name TEXT;
+    has_default_rows BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    SELECT c.relname INTO default_name
+    FROM pg_partitioned_table p
+    JOIN pg_class c ON c.oid = p.partdefid
+    WHERE p.partrelid = p_table::regclass;
+
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + interval '1 month')::date;
+        partition_name := format('%s_p%s', p_table, to_char(month_start, 'YYYYMM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            has_default_rows := false;
+            IF default_name IS NOT NULL THEN
+                EXECUTE format(
+                    'SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= %L AND created_at < %L)',
+                    default_name, month_start, month_end
+                ) INTO has_default_rows;
+            END IF;
+
+            IF has_default_rows THEN
+                EXECUTE format(
+                    'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                    partition_name, p_table
+                );
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM moved',
+                    default_name, month_start, month_end, partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    p_table, partition_name, month_start, month_end
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, p_table, month_start, month_end
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,327 @@
+"""
+Общие утилиты для бенчмарков backend-функций.
+Поднимают схему из db_migrations/ (при необходимости — во временном
+локальном PostgreSQL), сидят синтетические квизы и лиды,
+загружают handler() функции и считают обращения к БД.
+
+ВНИМАНИЕ: prepare_database() удаляет схему public целиком —
+используй только отдельную базу для бенчмарков (BENCH_DATABASE_URL).
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import statistics
+import importlib.util
+from pathlib import Path
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+BACKEND_DIR = ROOT_DIR / 'backend'
+MIGRATIONS_DIR = ROOT_DIR / 'db_migrations'
+
+
+def get_dsn(cli_dsn: str = None) -> str:
+    """DSN базы для бенчмарков: аргумент --dsn или BENCH_DATABASE_URL"""
+    dsn = cli_dsn or os.environ.get('BENCH_DATABASE_URL')
+    if not dsn:
+        print("❌ Укажи --dsn или BENCH_DATABASE_URL (база будет очищена!)")
+        sys.exit(1)
+    return dsn
+
+
+def find_pg_bin(cli_pg_bin: str = None) -> Path:
+    """Каталог с initdb и pg_ctl: аргумент --pg-bin, PG_BIN, PATH или pg_config --bindir"""
+    candidates = [cli_pg_bin, os.environ.get('PG_BIN')]
+    initdb = shutil.which('initdb')
+    if initdb:
+        candidates.append(str(Path(initdb).parent))
+    if shutil.which('pg_config'):
+        candidates.append(subprocess.run(
+            ['pg_config', '--bindir'], capture_output=True, text=True
+        ).stdout.strip())
+    for candidate in candidates:
+        if candidate and (Path(candidate) / 'initdb').exists():
+            return Path(candidate)
+    print("❌ initdb не найден: укажи --pg-bin или PG_BIN с бинарниками PostgreSQL")
+    sys.exit(1)
+
+
+class LocalPostgres:
+    """Временный кластер PostgreSQL в каталоге во /tmp: initdb, pg_ctl start/stop.
+
+    Слушает только unix-сокет в своём каталоге на свободном порту, поэтому не мешает
+    уже запущенным серверам. initdb не запускается от root — используй обычного пользователя.
+    """
+
+    def __init__(self, pg_bin: Path, settings: dict = None):
+        self.pg_bin = Path(pg_bin)
+        self.settings = settings or {}
+        self.data_dir = Path(tempfile.mkdtemp(prefix='bench-pg-'))
+        self.port = None
+
+    def start(self, database: str = 'bench') -> str:
+        """Создать кластер, запустить сервер и базу database, вернуть DSN"""
+        subprocess.run(
+            [str(self.pg_bin / 'initdb'), '-D', str(self.data_dir / 'data'), '-U', 'postgres',
+             '--auth=trust', '--encoding=UTF8', '--no-sync'],
+            check=True, capture_output=True
+        )
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        options = [f"-p {self.port}", f"-k {self.data_dir}", "-c listen_addresses=''"]
+        options += [f"-c {key}={value}" for key, value in self.settings.items()]
+        subprocess.run(
+            [str(self.pg_bin / 'pg_ctl'), '-D', str(self.data_dir / 'data'), '-w',
+             '-l', str(self.data_dir / 'postgres.log'), '-o', ' '.join(options), 'start'],
+            check=True, capture_output=True
+        )
+        conn = psycopg2.connect(self.dsn('postgres'))
+        conn.autocommit = True
+        conn.cursor().execute(f'CREATE DATABASE {database}')
+        conn.close()
+        return self.dsn(database)
+
+    def dsn(self, database: str) -> str:
+        return f"postgresql://postgres@/{database}?host={self.data_dir}&port={self.port}"
+
+    def stop(self):
+        """Остановить сервер и удалить каталог кластера"""
+        if self.port:
+            subprocess.run(
+                [str(self.pg_bin / 'pg_ctl'), '-D', str(self.data_dir / 'data'), '-m', 'fast', 'stop'],
+                capture_output=True
+            )
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+def prepare_database(dsn: str):
+    """Пересоздать схему public и применить все миграции по порядку"""
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS public CASCADE")
+    cur.execute("CREATE SCHEMA public")
+    for migration in sorted(MIGRATIONS_DIR.glob('V*.sql')):
+        cur.execute(migration.read_text(encoding='utf-8'))
+    cur.close()
+    conn.close()
+
+
+def seed_quiz(conn, slug: str, questions: int, answers: int) -> int:
+    """Создать квиз с questions вопросами по answers ответов, вернуть id"""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO quizzes (title, slug, description, is_active)
+        VALUES (%s, %s, %s, true)
+        RETURNING id
+        """,
+        (f'Бенчмарк {slug}', slug, f'{questions} вопросов × {answers} ответов')
+    )
+    quiz_id = cur.fetchone()[0]
+    question_ids = execute_values(
+        cur,
+        "INSERT INTO questions (quiz_id, question_text, question_order, metrika_goal_prefix) VALUES %s RETURNING id",
+        [(quiz_id, f'Вопрос {i}', i, f'q{i}') for i in range(1, questions + 1)],
+        fetch=True
+    )
+    execute_values(
+        cur,
+        "INSERT INTO answers (question_id, answer_text, answer_value, answer_order) VALUES %s",
+        [
+            (question_id, f'Ответ {j}', f'a{j}', j)
+            for (question_id,) in question_ids
+            for j in range(1, answers + 1)
+        ]
+    )
+    conn.commit()
+    cur.close()
+    return quiz_id
+
+
+def seed_leads(conn, quiz_id: int, leads: int, days: int = 90, batch: int = 100000) -> int:
+    """Записать leads лидов квиза с ответами в leads.answer_ids и счётчиками answer_stats.
+
+    Ответы выбираются детерминированно по id лида, даты создания равномерно
+    распределены по последним days дням. Пишет пачками по batch строк.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT ensure_monthly_partitions('leads', (CURRENT_DATE - %s)::date, 3)", (days,))
+    cur.execute(
+        """
+        SELECT array_agg(answer_ids ORDER BY question_order)
+        FROM (
+            SELECT qs.question_order, array_agg(a.id ORDER BY a.answer_order) AS answer_ids
+            FROM questions qs
+            JOIN answers a ON a.question_id = qs.id
+            WHERE qs.quiz_id = %s
+            GROUP BY qs.id, qs.question_order
+        ) per_question
+        """,
+        (quiz_id,)
+    )
+    answers_by_question = cur.fetchone()[0]
+    # Варианты ответов квиза: i-й вариант отвечает на вопрос q ответом (i + q) % answers
+    patterns = [
+        [answer_ids[(i + q) % len(answer_ids)] for q, answer_ids in enumerate(answers_by_question)]
+        for i in range(max(len(a) for a in answers_by_question))
+    ]
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS seed_patterns (idx INTEGER PRIMARY KEY, answer_ids INTEGER[])")
+    cur.execute("TRUNCATE seed_patterns")
+    execute_values(cur, "INSERT INTO seed_patterns (idx, answer_ids) VALUES %s", list(enumerate(patterns)))
+
+    written = 0
+    while written < leads:
+        size = min(batch, leads - written)
+        cur.execute(
+            """
+            INSERT INTO leads (quiz_id, name, phone, email, segment_key, answer_ids, created_at)
+            SELECT %(quiz_id)s, 'Бенчмарк ' || g, '+7000' || lpad(g::text, 7, '0'), 'bench@example.com',
+                'segment-' || g %% 10, p.answer_ids,
+                now() - make_interval(secs => (g::bigint * 7919) %% (%(days)s * 86400))
+            FROM generate_series(%(start)s, %(stop)s) AS g
+            JOIN seed_patterns p ON p.idx = g %% %(patterns)s
+            """,
+            {'quiz_id': quiz_id, 'days': days, 'start': written + 1, 'stop': written + size,
+             'patterns': len(patterns)}
+        )
+        conn.commit()
+        written += size
+
+    cur.execute(
+        """
+        INSERT INTO answer_stats (answer_id, shard, responses)
+        SELECT a.answer_id, 0, count(*)
+        FROM leads l, unnest(l.answer_ids) AS a(answer_id)
+        WHERE l.quiz_id = %s
+        GROUP BY a.answer_id
+        ON CONFLICT (answer_id, shard) DO UPDATE
+        SET responses = answer_stats.responses + EXCLUDED.responses
+        """,
+        (quiz_id,)
+    )
+    cur.execute(
+        """
+        INSERT INTO answer_stats_daily (answer_id, day, shard, responses)
+        SELECT a.answer_id, l.created_at::date, 0, count(*)
+        FROM leads l, unnest(l.answer_ids) AS a(answer_id)
+        WHERE l.quiz_id = %s
+        GROUP BY a.answer_id, l.created_at::date
+        ON CONFLICT (answer_id, day, shard) DO UPDATE
+        SET responses = answer_stats_daily.responses + EXCLUDED.responses
+        """,
+        (quiz_id,)
+    )
+    cur.execute("ANALYZE leads")
+    conn.commit()
+    cur.close()
+    return written
+
+
+def load_handler(function_name: str, env: dict = None):
+    """Импортировать backend/<function_name>/index.py как отдельный модуль"""
+    for key, value in (env or {}).items():
+        os.environ[key] = value
+    path = BACKEND_DIR / function_name / 'index.py'
+    module_name = 'bench_' + function_name.replace('-', '_')
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _CountingCursor:
+    """Прокси над курсором, считающий execute() у соединения"""
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+
+    def execute(self, *args, **kwargs):
+        self._connection.queries += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._connection.queries += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """Соединение, считающее запросы, отправленные через его курсоры"""
+
+    queries = 0
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(super().cursor(*args, **kwargs), self)
+
+
+class QueryCounter:
+    """Подменяет psycopg2.connect, чтобы считать запросы всех соединений"""
+
+    def __init__(self):
+        self.connections = []
+        self._original_connect = psycopg2.connect
+
+    def install(self):
+        def counting_connect(*args, **kwargs):
+            kwargs.setdefault('connection_factory', CountingConnection)
+            conn = self._original_connect(*args, **kwargs)
+            self.connections.append(conn)
+            return conn
+        psycopg2.connect = counting_connect
+        return self
+
+    def uninstall(self):
+        psycopg2.connect = self._original_connect
+
+    @property
+    def total(self) -> int:
+        return sum(getattr(c, 'queries', 0) for c in self.connections)
+
+
+def measure(fn, iterations: int) -> list:
+    """Вызвать fn iterations раз и вернуть длительности в миллисекундах"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings: list) -> dict:
+    return {
+        'count': len(timings),
+        'mean_ms': round(statistics.fmean(timings), 3) if timings else 0.0,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+    }
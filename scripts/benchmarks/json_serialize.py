@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк сериализации ответов backend-функций.
+
+Сравнивает прежний json.dumps(..., default=str) с json_dumps() из quiz-api
+в двух режимах: orjson и стандартный json (как без установленного orjson).
+Полезные нагрузки — дерево квиза, список VM из строк RealDictCursor с датами
+и Decimal, логи деплоя. База данных не нужна.
+
+Запуск:
+    python3 scripts/benchmarks/json_serialize.py --questions 300 --vms 500 --log-lines 5000
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from psycopg2.extras import RealDictRow
+
+from common import load_handler, measure, summarize
+
+
+def quiz_tree(questions: int, answers: int) -> dict:
+    return {
+        'id': 1,
+        'title': 'Бенчмарк',
+        'slug': 'bench',
+        'description': f'{questions} вопросов × {answers} ответов',
+        'yandex_metrika_id': '12345678',
+        'is_active': True,
+        'version': 7,
+        'questions': [
+            {
+                'id': q,
+                'question_text': f'Вопрос номер {q}: какой вариант вам ближе?',
+                'question_order': q,
+                'metrika_goal_prefix': f'q{q}',
+                'answers': [
+                    {
+                        'id': q * answers + a,
+                        'answer_text': f'Вариант ответа {a}',
+                        'answer_value': f'v{a}',
+                        'answer_order': a
+                    }
+                    for a in range(answers)
+                ]
+            }
+            for q in range(questions)
+        ]
+    }
+
+
+def vm_rows(count: int) -> list:
+    """Строки в том виде, в каком их отдаёт RealDictCursor"""
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(count):
+        row = RealDictRow()
+        row.update({
+            'id': i,
+            'name': f'vm-{i}',
+            'yandex_vm_id': f'fhm{i:017d}',
+            'ip_address': f'10.0.{i // 256}.{i % 256}',
+            'status': 'running',
+            'cpu_cores': 2,
+            'memory_gb': Decimal('4.0'),
+            'disk_gb': Decimal('20.5'),
+            'ssh_user': 'ubuntu',
+            'created_at': created + timedelta(minutes=i),
+            'updated_at': created + timedelta(minutes=i, seconds=30),
+        })
+        rows.append(row)
+    return rows
+
+
+def deploy_logs(lines: int) -> dict:
+    return {
+        'success': True,
+        'url': 'https://example.com',
+        'logs': [f'✅ Шаг {i}: npm run build — готово за {i % 97} мс' for i in range(lines)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сериализации JSON-ответов')
+    parser.add_argument('--questions', type=int, default=300)
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--vms', type=int, default=500)
+    parser.add_argument('--log-lines', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    quiz_api = load_handler('quiz-api')
+    if quiz_api.orjson is None:
+        print('⚠️ orjson не установлен — вариант orjson совпадёт со stdlib (pip3 install orjson)')
+
+    def stdlib_dumps(data):
+        orjson, quiz_api.orjson = quiz_api.orjson, None
+        try:
+            return quiz_api.json_dumps(data)
+        finally:
+            quiz_api.orjson = orjson
+
+    payloads = [
+        ('quiz_tree', quiz_tree(args.questions, args.answers)),
+        ('vm_list', vm_rows(args.vms)),
+        ('deploy_logs', deploy_logs(args.log_lines)),
+    ]
+    variants = [
+        ('default=str', lambda data: json.dumps(data, default=str)),
+        ('stdlib', stdlib_dumps),
+        ('orjson', quiz_api.json_dumps),
+    ]
+
+    results = []
+    print(f"{'нагрузка':>11} | {'вариант':>11} | {'КБ':>7} | {'p50, мс':>8} | {'p99, мс':>8} | {'ускорение':>9}")
+    print('-' * 70)
+    for payload_name, data in payloads:
+        # Оба режима json_dumps обязаны давать одинаковый документ
+        assert json.loads(stdlib_dumps(data)) == json.loads(quiz_api.json_dumps(data))
+        baseline = None
+        for variant, dumps in variants:
+            size_kb = round(len(dumps(data).encode('utf-8')) / 1024, 1)
+            stats = summarize(measure(lambda: dumps(data), args.iterations))
+            baseline = baseline or stats['p50_ms']
+            speedup = round(baseline / stats['p50_ms'], 2) if stats['p50_ms'] else 0.0
+            results.append({'payload': payload_name, 'variant': variant, 'size_kb': size_kb,
+                            'speedup': speedup, **stats})
+            print(f"{payload_name:>11} | {variant:>11} | {size_kb:>7} | {stats['p50_ms']:>8} | "
+                  f"{stats['p99_ms']:>8} | ×{speedup:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📝 Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
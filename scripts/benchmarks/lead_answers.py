@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранения ответов лидов: строки quiz_responses против массива leads.answer_ids.
+
+Сидит лиды со строкой quiz_responses на каждый ответ (прежняя схема), замеряет размер
+таблиц с индексами и чтение ответов, затем переносит ответы в leads.answer_ids
+миграцией V0015 и повторяет замеры для компактного представления.
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/bench \\
+        python3 scripts/benchmarks/lead_answers.py --leads 200000 --questions 10
+"""
+import argparse
+import json
+import random
+
+import psycopg2
+
+from common import get_dsn, prepare_database, seed_quiz, measure, summarize, MIGRATIONS_DIR
+
+READS = {
+    'responses': {
+        'one_lead': '''
+            SELECT question_id, answer_id
+            FROM quiz_responses
+            WHERE lead_id = %s
+        ''',
+        'page': '''
+            SELECT l.id, array_agg(r.answer_id ORDER BY r.question_id)
+            FROM leads l
+            JOIN quiz_responses r ON r.lead_id = l.id
+            WHERE l.quiz_id = %s AND l.id > %s
+            GROUP BY l.id
+            ORDER BY l.id
+            LIMIT 1000
+        ''',
+    },
+    'answer_ids': {
+        'one_lead': '''
+            SELECT answer_ids
+            FROM leads
+            WHERE id = %s
+        ''',
+        'page': '''
+            SELECT id, answer_ids
+            FROM leads
+            WHERE quiz_id = %s AND id > %s
+            ORDER BY id
+            LIMIT 1000
+        ''',
+    },
+}
+
+
+def relation_sizes(cur) -> dict:
+    """Размер leads и quiz_responses вместе с индексами, МБ"""
+    cur.execute('''
+        SELECT relname, pg_total_relation_size(oid)
+        FROM pg_class
+        WHERE relname IN ('leads', 'quiz_responses')
+    ''')
+    return {name: round(size / 1024 / 1024, 1) for name, size in cur.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк хранения ответов лидов')
+    parser.add_argument('--dsn', help='DSN отдельной базы для бенчмарка (будет очищена)')
+    parser.add_argument('--leads', type=int, default=200000)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    dsn = get_dsn(args.dsn)
+    prepare_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    quiz_id = seed_quiz(conn, 'bench-answers', args.questions, args.answers)
+
+    print(f"📦 {args.leads} лидов × {args.questions} ответов")
+    cur.execute('''
+        INSERT INTO leads (quiz_id, name, phone, segment_key)
+        SELECT %s, 'Бенчмарк', '+70000000000', 'bench'
+        FROM generate_series(1, %s)
+    ''', (quiz_id, args.leads))
+    cur.execute('''
+        INSERT INTO quiz_responses (lead_id, question_id, answer_id)
+        SELECT l.id, a.question_id, a.id
+        FROM leads l
+        JOIN questions qs ON qs.quiz_id = l.quiz_id
+        JOIN answers a ON a.question_id = qs.id AND a.answer_order = 1 + (l.id + qs.id) %% %s
+    ''', (args.answers,))
+    cur.execute('VACUUM ANALYZE leads')
+    cur.execute('VACUUM ANALYZE quiz_responses')
+    cur.execute('SELECT min(id), max(id) FROM leads')
+    min_id, max_id = cur.fetchone()
+
+    def run_reads(variant: str) -> dict:
+        stats = {}
+        for name, sql in READS[variant].items():
+            if name == 'one_lead':
+                call = lambda: (cur.execute(sql, (random.randint(min_id, max_id),)), cur.fetchall())
+            else:
+                call = lambda: (cur.execute(sql, (quiz_id, random.randint(min_id, max_id - 1000))), cur.fetchall())
+            stats[name] = summarize(measure(call, args.iterations))
+        return stats
+
+    results = {'responses': {'sizes_mb': relation_sizes(cur), 'reads': run_reads('responses')}}
+
+    # Перенос ответов той же миграцией, что и в проде, затем освобождаем место
+    cur.execute((MIGRATIONS_DIR / 'V0015__add_leads_answer_ids.sql').read_text(encoding='utf-8'))
+    cur.execute('TRUNCATE quiz_responses')
+    cur.execute('VACUUM FULL ANALYZE leads')
+    results['answer_ids'] = {'sizes_mb': relation_sizes(cur), 'reads': run_reads('answer_ids')}
+
+    cur.close()
+    conn.close()
+
+    print(f"\n{'схема':>11} | {'leads, МБ':>9} | {'responses, МБ':>13} | {'лид p50, мс':>11} | {'1000 лидов p50, мс':>18}")
+    print('-' * 75)
+    for variant, data in results.items():
+        sizes = data['sizes_mb']
+        print(f"{variant:>11} | {sizes['leads']:>9} | {sizes['quiz_responses']:>13} | "
+              f"{data['reads']['one_lead']['p50_ms']:>11} | {data['reads']['page']['p50_ms']:>18}")
+
+    before = sum(results['responses']['sizes_mb'].values())
+    after = sum(results['answer_ids']['sizes_mb'].values())
+    print(f"\n💾 Размер: {before} МБ → {after} МБ (×{round(before / after, 1)} меньше)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📝 Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
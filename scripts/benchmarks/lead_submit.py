@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк записи лидов (quiz-api, action=submit).
+
+Сравнивает прежнюю схему (INSERT лида + INSERT на каждый ответ в цикле)
+с текущим handler() в режимах direct и spool (LEAD_INGEST_MODE):
+лидов в секунду, запросов на лид и задержки при заданной конкурентности.
+Для spool отдельно измеряется перенос буфера в leads через flush_lead_spool (как таймер-триггер).
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/bench \\
+        python3 scripts/benchmarks/lead_submit.py --leads 2000 --concurrency 8 --questions 15
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import (
+    get_dsn, prepare_database, seed_quiz, load_handler,
+    QueryCounter, summarize
+)
+
+
+def legacy_submit(dsn: str, data: dict) -> dict:
+    """Прежняя реализация submit_quiz_response с INSERT на каждый ответ — для сравнения"""
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    contact_info = data['contactInfo']
+    cur.execute('''
+        INSERT INTO leads (quiz_id, name, phone, email, segment_key)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+    ''', (
+        data['quiz_id'],
+        contact_info.get('name'),
+        contact_info.get('phone'),
+        contact_info.get('email', ''),
+        data.get('segment_key', '')
+    ))
+    lead_id = cur.fetchone()['id']
+    for question_id, answer_id in data['answers'].items():
+        cur.execute('''
+            INSERT INTO quiz_responses (lead_id, question_id, answer_id)
+            VALUES (%s, %s, %s)
+        ''', (lead_id, int(question_id), int(answer_id)))
+    conn.commit()
+    cur.close()
+    conn.close()
+    return {'statusCode': 200, 'body': json.dumps({'success': True, 'lead_id': lead_id})}
+
+
+def load_quiz_answers(dsn: str, quiz_id: int) -> dict:
+    """Первый вариант ответа на каждый вопрос квиза: {question_id: answer_id}"""
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT DISTINCT ON (qs.id) qs.id, a.id
+        FROM questions qs
+        JOIN answers a ON a.question_id = qs.id
+        WHERE qs.quiz_id = %s
+        ORDER BY qs.id, a.answer_order
+    ''', (quiz_id,))
+    answers = {str(question_id): answer_id for question_id, answer_id in cur.fetchall()}
+    conn.close()
+    return answers
+
+
+def run_load(call, leads: int, concurrency: int) -> dict:
+    """Отправить leads заявок в concurrency потоков, вернуть пропускную способность"""
+    timings = []
+
+    def submit_one(_):
+        started = time.perf_counter()
+        response = call()
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(submit_one, range(leads)))
+    elapsed = time.perf_counter() - started
+    return {'leads_per_sec': round(leads / elapsed, 1), 'elapsed_s': round(elapsed, 3), **summarize(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк записи лидов')
+    parser.add_argument('--dsn', help='DSN отдельной базы для бенчмарка (будет очищена)')
+    parser.add_argument('--leads', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--questions', type=int, default=15)
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    dsn = get_dsn(args.dsn)
+    prepare_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    quiz_id = seed_quiz(conn, 'bench-submit', args.questions, args.answers)
+    conn.close()
+
+    payload = {
+        'quiz_id': quiz_id,
+        'answers': load_quiz_answers(dsn, quiz_id),
+        'contactInfo': {'name': 'Бенчмарк', 'phone': '+70000000000', 'email': 'bench@example.com'},
+        'segment_key': 'bench'
+    }
+    event = {'httpMethod': 'POST', 'queryStringParameters': {'action': 'submit'}, 'body': json.dumps(payload)}
+
+    quiz_api = load_handler('quiz-api', {'DATABASE_URL': dsn, 'LEAD_INGEST_MODE': 'direct'})
+    spool_quiz_api = load_handler('quiz-api', {'DATABASE_URL': dsn, 'LEAD_INGEST_MODE': 'spool'})
+    variants = [
+        ('legacy', lambda: legacy_submit(dsn, payload)),
+        ('handler', lambda: quiz_api.handler(event, None)),
+        ('spool', lambda: spool_quiz_api.handler(event, None)),
+    ]
+
+    results = []
+    print(f"📦 {args.leads} лидов × {args.questions} ответов, {args.concurrency} потоков\n")
+    print(f"{'вариант':>8} | {'запросов/лид':>12} | {'лидов/с':>8} | {'p50, мс':>8} | {'p99, мс':>8}")
+    print('-' * 58)
+    for variant, call in variants:
+        counter = QueryCounter().install()
+        call()
+        queries = counter.total
+        counter.uninstall()
+
+        stats = run_load(call, args.leads, args.concurrency)
+        results.append({'variant': variant, 'queries_per_lead': queries, **stats})
+        print(f"{variant:>8} | {queries:>12} | {stats['leads_per_sec']:>8} | {stats['p50_ms']:>8} | {stats['p99_ms']:>8}")
+
+    legacy, current, spool = results
+    print(f"\n🚀 Ускорение handler: ×{round(current['leads_per_sec'] / legacy['leads_per_sec'], 2)}, "
+          f"spool: ×{round(spool['leads_per_sec'] / legacy['leads_per_sec'], 2)}")
+
+    started = time.perf_counter()
+    flush = json.loads(spool_quiz_api.flush_lead_spool()['body'])
+    elapsed = time.perf_counter() - started
+    print(f"📥 flush: перенесено {flush['flushed']} лидов за {round(elapsed, 3)} с "
+          f"({round(flush['flushed'] / elapsed, 1)} лидов/с), в буфере осталось {flush['pending']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📝 Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк подготовленных операторов quiz-api (PREPARE/EXECUTE на соединение).
+
+Для квизов разного размера показывает время планирования горячих запросов
+(EXPLAIN SUMMARY) и задержку обычного cur.execute() против execute_prepared()
+на одном тёплом соединении: чтение квиза по slug (снапшот и сборка дерева)
+и запись лида с ответами.
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/bench \\
+        python3 scripts/benchmarks/prepared_statements.py --questions 3 15 50 100 300 --answers 4
+"""
+import argparse
+import json
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import get_dsn, prepare_database, seed_quiz, load_handler, measure, summarize
+
+
+def planning_ms(cur, sql: str, params) -> float:
+    cur.execute('EXPLAIN (SUMMARY, FORMAT JSON) ' + sql, params)
+    return round(cur.fetchone()['QUERY PLAN'][0]['Planning Time'], 3)
+
+
+def load_answers(cur, quiz_id: int) -> tuple:
+    cur.execute('''
+        SELECT DISTINCT ON (qs.id) qs.id AS question_id, a.id AS answer_id
+        FROM questions qs
+        JOIN answers a ON a.question_id = qs.id
+        WHERE qs.quiz_id = %s
+        ORDER BY qs.id, a.answer_order
+    ''', (quiz_id,))
+    rows = cur.fetchall()
+    return [r['question_id'] for r in rows], [r['answer_id'] for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк подготовленных операторов quiz-api')
+    parser.add_argument('--dsn', help='DSN отдельной базы для бенчмарка (будет очищена)')
+    parser.add_argument('--questions', type=int, nargs='+', default=[3, 15, 50, 100, 300])
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    dsn = get_dsn(args.dsn)
+    prepare_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    quizzes = [(size, f'bench-prepared-{size}', seed_quiz(conn, f'bench-prepared-{size}', size, args.answers))
+               for size in args.questions]
+    conn.close()
+
+    # Снапшот и сборка дерева — разные QUIZ_READ_SQL, поэтому два экземпляра модуля
+    modules = {
+        'snapshot': load_handler('quiz-api', {'DATABASE_URL': dsn, 'QUIZ_SOURCE': 'snapshot'}),
+        'tree': load_handler('quiz-api', {'DATABASE_URL': dsn, 'QUIZ_SOURCE': 'tree'}),
+    }
+
+    results = []
+    print(f"{'вопросов':>8} | {'запрос':>18} | {'план, мс':>8} | {'execute p50':>11} | "
+          f"{'prepared p50':>12} | {'экономия':>8}")
+    print('-' * 81)
+    for size, slug, quiz_id in quizzes:
+        cases = []
+        for source, module in modules.items():
+            cases.append((f'quiz_read:{source}', module, 'quiz_read', {'slug': slug}))
+        module = modules['snapshot']
+        module_conn = module.db_connect(dsn)
+        module_conn.cursor_factory = RealDictCursor
+        question_ids, answer_ids = load_answers(module_conn.cursor(), quiz_id)
+        module.db_release(module_conn)
+        cases.append(('lead_insert', module, 'lead_insert', {
+            'quiz_id': quiz_id, 'name': 'Бенчмарк', 'phone': '+70000000000', 'email': '',
+            'segment_key': 'bench', 'question_ids': question_ids, 'answer_ids': answer_ids
+        }))
+
+        for label, module, name, params in cases:
+            sql, param_types = module.PREPARED_SQL[name]
+            positional = [params[param] for param, _ in param_types]
+            sql_params = params if '%(' in sql else positional
+
+            conn = module.db_connect(dsn)
+            conn.cursor_factory = RealDictCursor
+            conn.autocommit = True
+            cur = conn.cursor()
+            plan = planning_ms(cur, sql, sql_params)
+
+            def plain():
+                cur.execute(sql, sql_params)
+                cur.fetchall()
+
+            def prepared():
+                module.execute_prepared(cur, name, params)
+                cur.fetchall()
+
+            plain_stats = summarize(measure(plain, args.iterations))
+            prepared_stats = summarize(measure(prepared, args.iterations))
+            cur.close()
+            module.db_release(conn)
+
+            saved = round(plain_stats['p50_ms'] - prepared_stats['p50_ms'], 3)
+            results.append({
+                'questions': size, 'statement': label, 'planning_ms': plan,
+                'execute': plain_stats, 'prepared': prepared_stats, 'saved_p50_ms': saved
+            })
+            print(f"{size:>8} | {label:>18} | {plan:>8} | {plain_stats['p50_ms']:>11} | "
+                  f"{prepared_stats['p50_ms']:>12} | {saved:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📝 Результаты сохранены: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
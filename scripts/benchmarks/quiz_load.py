@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк quiz-api: get, list и submit против локального PostgreSQL.
+
+Сидит синтетические квизы (вопросы × ответы) и лиды (вплоть до миллионов),
+затем вызывает handler() в нескольких потоках для каждого сценария и уровня
+конкурентности: пропускная способность, p50/p95/p99 и число ошибок.
+Результаты сохраняются в JSON; с --baseline прогон сравнивается с прошлым
+и завершается с кодом 1 при регрессии — удобно запускать перед деплоем.
+
+База: --dsn / BENCH_DATABASE_URL (будет очищена) или --start-postgres —
+временный кластер через initdb/pg_ctl, который удаляется после прогона.
+
+Запуск:
+    python3 scripts/benchmarks/quiz_load.py --start-postgres \\
+        --quizzes 20 --questions 15 --answers 4 --leads 1000000 \\
+        --concurrency 1 8 32 --requests 2000 --output quiz_load.json
+"""
+import argparse
+import json
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psycopg2
+
+from common import (
+    ROOT_DIR, get_dsn, find_pg_bin, LocalPostgres, prepare_database,
+    seed_quiz, seed_leads, load_handler, summarize
+)
+
+SCENARIOS = ('get', 'list', 'submit')
+
+# Сравнение с --baseline: какие метрики и в какую сторону считаются ухудшением
+REGRESSION_METRICS = {'rps': 'lower', 'p95_ms': 'higher', 'p99_ms': 'higher'}
+
+
+def load_quizzes(dsn: str) -> list:
+    """Квизы бенчмарка с ответами: [{'id', 'slug', 'answers': {question_id: [answer_id]}}]"""
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT q.id, q.slug, qs.id, array_agg(a.id ORDER BY a.answer_order)
+        FROM quizzes q
+        JOIN questions qs ON qs.quiz_id = q.id
+        JOIN answers a ON a.question_id = qs.id
+        WHERE q.slug LIKE 'bench-load-%%'
+        GROUP BY q.id, q.slug, qs.id
+        ORDER BY q.id, qs.id
+    ''')
+    quizzes = {}
+    for quiz_id, slug, question_id, answer_ids in cur.fetchall():
+        quiz = quizzes.setdefault(quiz_id, {'id': quiz_id, 'slug': slug, 'answers': {}})
+        quiz['answers'][str(question_id)] = answer_ids
+    conn.close()
+    return list(quizzes.values())
+
+
+def make_events(quizzes: list, list_limit: int) -> dict:
+    """Генераторы событий handler() для каждого сценария"""
+    def get_event():
+        quiz = random.choice(quizzes)
+        return {'httpMethod': 'GET', 'queryStringParameters': {'action': 'get', 'slug': quiz['slug']}}
+
+    def list_event():
+        return {'httpMethod': 'GET', 'queryStringParameters': {'action': 'list', 'limit': str(list_limit)}}
+
+    def submit_event():
+        quiz = random.choice(quizzes)
+        return {
+            'httpMethod': 'POST',
+            'queryStringParameters': {'action': 'submit'},
+            'body': json.dumps({
+                'quiz_id': quiz['id'],
+                'answers': {question_id: random.choice(ids) for question_id, ids in quiz['answers'].items()},
+                'contactInfo': {'name': 'Нагрузка', 'phone': '+70000000000', 'email': 'load@example.com'},
+                'segment_key': f'load-{random.randint(0, 9)}'
+            })
+        }
+
+    return {'get': get_event, 'list': list_event, 'submit': submit_event}
+
+
+def run_scenario(handler, make_event, requests_total: int, concurrency: int, warmup: int) -> dict:
+    """Выполнить requests_total вызовов в concurrency потоков, вернуть метрики"""
+    for _ in range(warmup):
+        handler(make_event(), None)
+
+    timings = []
+    errors = []
+    lock = threading.Lock()
+
+    def call(_):
+        event = make_event()
+        started = time.perf_counter()
+        response = handler(event, None)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            timings.append(elapsed)
+            if response['statusCode'] not in (200, 304):
+                errors.append(response['statusCode'])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests_total)))
+    wall = time.perf_counter() - started
+    return {
+        'rps': round(requests_total / wall, 1),
+        'elapsed_s': round(wall, 3),
+        'errors': len(errors),
+        **summarize(timings)
+    }
+
+
+def compare_with_baseline(results: list, baseline_path: str, max_regression: float) -> list:
+    """Ухудшения относительно baseline больше max_regression (доля)"""
+    with open(baseline_path) as f:
+        baseline = {
+            (r['scenario'], r['concurrency']): r for r in json.load(f)['results']
+        }
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['scenario'], result['concurrency']))
+        if not previous:
+            continue
+        for metric, worse in REGRESSION_METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (old - new) / old if worse == 'lower' else (new - old) / old
+            if change > max_regression:
+                regressions.append({
+                    'scenario': result['scenario'], 'concurrency': result['concurrency'],
+                    'metric': metric, 'baseline': old, 'current': new, 'change': round(change, 3)
+                })
+    return regressions
+
+
+def git_revision() -> str:
+    return subprocess.run(
+        ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный бенчмарк quiz-api')
+    parser.add_argument('--dsn', help='DSN отдельной базы для бенчмарка (будет очищена)')
+    parser.add_argument('--start-postgres', action='store_true',
+                        help='Поднять временный PostgreSQL через initdb/pg_ctl')
+    parser.add_argument('--pg-bin', help='Каталог с initdb и pg_ctl для --start-postgres')
+    parser.add_argument('--quizzes', type=int, default=10)
+    parser.add_argument('--questions', type=int, default=15)
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--leads', type=int, default=100000, help='Лидов на все квизы суммарно')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=2000, help='Вызовов на сценарий и уровень конкурентности')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--list-limit', type=int, default=50)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Переменные окружения quiz-api, например LEAD_INGEST_MODE=spool')
+    parser.add_argument('--output', default='quiz_load.json', help='JSON файл с результатами')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для поиска регрессий')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Допустимое ухудшение rps/p95/p99 относительно baseline (доля)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    local_pg = None
+    if args.start_postgres:
+        local_pg = LocalPostgres(find_pg_bin(args.pg_bin), {'max_connections': max(100, max(args.concurrency) * 2 + 10)})
+        dsn = local_pg.start()
+        print(f"🐘 Временный PostgreSQL: {local_pg.data_dir}")
+    else:
+        dsn = get_dsn(args.dsn)
+
+    try:
+        prepare_database(dsn)
+        conn = psycopg2.connect(dsn)
+        started = time.perf_counter()
+        per_quiz = args.leads // args.quizzes if args.quizzes else 0
+        for i in range(args.quizzes):
+            quiz_id = seed_quiz(conn, f'bench-load-{i}', args.questions, args.answers)
+            # Остаток от деления достаётся последнему квизу
+            count = per_quiz + (args.leads - per_quiz * args.quizzes if i == args.quizzes - 1 else 0)
+            if count:
+                seed_leads(conn, quiz_id, count)
+        conn.close()
+        print(f"📦 {args.quizzes} квизов × {args.questions} вопросов × {args.answers} ответов, "
+              f"{args.leads} лидов — сид за {round(time.perf_counter() - started, 1)} с\n")
+
+        env = {'DATABASE_URL': dsn, 'DB_POOL_SIZE': str(max(args.concurrency))}
+        env.update(dict(item.split('=', 1) for item in args.env))
+        quiz_api = load_handler('quiz-api', env)
+        events = make_events(load_quizzes(dsn), args.list_limit)
+
+        results = []
+        print(f"{'сценарий':>8} | {'потоков':>7} | {'запр/с':>8} | {'p50, мс':>8} | {'p95, мс':>8} | "
+              f"{'p99, мс':>8} | {'ошибок':>6}")
+        print('-' * 72)
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                stats = run_scenario(quiz_api.handler, events[scenario], args.requests, concurrency, args.warmup)
+                results.append({'scenario': scenario, 'concurrency': concurrency, **stats})
+                print(f"{scenario:>8} | {concurrency:>7} | {stats['rps']:>8} | {stats['p50_ms']:>8} | "
+                      f"{stats['p95_ms']:>8} | {stats['p99_ms']:>8} | {stats['errors']:>6}")
+    finally:
+        if local_pg:
+            local_pg.stop()
+
+    report = {
+        'benchmark': 'quiz_load',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'params': {
+            'quizzes': args.quizzes, 'questions': args.questions, 'answers': args.answers,
+            'leads': args.leads, 'requests': args.requests, 'warmup': args.warmup,
+            'list_limit': args.list_limit, 'env': args.env,
+            'postgres': 'local' if local_pg else 'dsn'
+        },
+        'results': results
+    }
+
+    exit_code = 0
+    if any(r['errors'] for r in results):
+        print("\n❌ Есть ответы с ошибками — см. колонку «ошибок»")
+        exit_code = 1
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.max_regression)
+        report['baseline'] = {'path': args.baseline, 'max_regression': args.max_regression,
+                              'regressions': regressions}
+        for r in regressions:
+            print(f"📉 {r['scenario']} × {r['concurrency']}: {r['metric']} {r['baseline']} → {r['current']} "
+                  f"({round(r['change'] * 100, 1)}% хуже)")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"\n✅ Регрессий относительно {args.baseline} нет (порог {round(args.max_regression * 100)}%)")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📝 Результаты сохранены: {args.output}")
+    raise SystemExit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
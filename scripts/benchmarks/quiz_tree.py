@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Регрессионный бенчмарк загрузки дерева квиза (quiz-api, action=get).
+
+Для квизов с растущим числом вопросов сравнивает старую схему N+1
+(запрос на квиз, на вопросы и по запросу на ответы каждого вопроса)
+с текущим handler(): число запросов к БД и задержку на вызов.
+tree собирает дерево из таблиц при запросе (QUIZ_SOURCE=tree), snapshot читает
+готовый payload из quiz_snapshots по первичному ключу; оба — с выключенным
+кэшем квизов, cached — snapshot с тёплым кэшем.
+
+Запуск:
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/bench \\
+        python3 scripts/benchmarks/quiz_tree.py --questions 3 15 50 100 300
+"""
+import argparse
+import json
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import (
+    get_dsn, prepare_database, seed_quiz, load_handler,
+    QueryCounter, measure, summarize
+)
+
+
+def legacy_get_quiz(dsn: str, slug: str) -> dict:
+    """Прежняя реализация get_quiz_by_slug с N+1 запросами — для сравнения"""
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT id, title, slug, description, yandex_metrika_id, is_active
+        FROM quizzes
+        WHERE slug = %s AND is_active = true
+    ''', (slug,))
+    quiz = cur.fetchone()
+    cur.execute('''
+        SELECT id, question_text, question_order, metrika_goal_prefix
+        FROM questions
+        WHERE quiz_id = %s
+        ORDER BY question_order
+    ''', (quiz['id'],))
+    questions = cur.fetchall()
+    for question in questions:
+        cur.execute('''
+            SELECT id, answer_text, answer_value, answer_order
+            FROM answers
+            WHERE question_id = %s
+            ORDER BY answer_order
+        ''', (question['id'],))
+        question['answers'] = cur.fetchall()
+    quiz['questions'] = questions
+    cur.close()
+    conn.close()
+    return {'statusCode': 200, 'body': json.dumps(dict(quiz))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк загрузки дерева квиза')
+    parser.add_argument('--dsn', help='DSN отдельной базы для бенчмарка (будет очищена)')
+    parser.add_argument('--questions', type=int, nargs='+', default=[3, 15, 50, 100, 300])
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    dsn = get_dsn(args.dsn)
+    prepare_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    for count in args.questions:
+        seed_quiz(conn, f'bench-{count}', count, args.answers)
+    conn.close()
+
+    tree_quiz_api = load_handler('quiz-api', {'DATABASE_URL': dsn, 'QUIZ_CACHE_SIZE': '0', 'QUIZ_SOURCE': 'tree'})
+    quiz_api = load_handler('quiz-api', {'DATABASE_URL': dsn, 'QUIZ_CACHE_SIZE': '0', 'QUIZ_SOURCE': 'snapshot'})
+    cached_quiz_api = load_handler('quiz-api', {'DATABASE_URL': dsn, 'QUIZ_CACHE_SIZE': '128'})
+    counter = QueryCounter().install()
+
+    results = []
+    print(f"{'вопросов':>9} | {'вариант':>8} | {'запросов':>8} | {'p50, мс':>8} | {'p95, мс':>8}")
+    print('-' * 54)
+    for count in args.questions:
+        slug = f'bench-{count}'
+        event = {
+            'httpMethod': 'GET',
+            'queryStringParameters': {'action': 'get', 'slug': slug}
+        }
+        variants = [
+            ('legacy', lambda: legacy_get_quiz(dsn, slug)),
+            ('tree', lambda: tree_quiz_api.handler(event, None)),
+            ('snapshot', lambda: quiz_api.handler(event, None)),
+            ('cached', lambda: cached_quiz_api.handler(event, None)),
+        ]
+        for variant, call in variants:
+            response = call()
+            assert response['statusCode'] == 200, response
+            assert len(json.loads(response['body'])['questions']) == count
+
+            before = counter.total
+            call()
+            queries = counter.total - before
+
+            stats = summarize(measure(call, args.iterations))
+            results.append({'questions': count, 'variant': variant, 'queries': queries, **stats})
+            print(f"{count:>9} | {variant:>8} | {queries:>8} | {stats['p50_ms']:>8} | {stats['p95_ms']:>8}")
+
+    counter.uninstall()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 Результаты сохранены: {args.output}")
+
+    handler_queries = {r['queries'] for r in results if r['variant'] in ('tree', 'snapshot')}
+    if len(handler_queries) > 1:
+        print(f"\n❌ Число запросов handler() зависит от размера квиза: {sorted(handler_queries)}")
+        raise SystemExit(1)
+    print(f"\n✅ handler() делает {handler_queries.pop()} запрос(ов) независимо от числа вопросов")
+
+
+if __name__ == '__main__':
+    main()
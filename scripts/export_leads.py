@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Полная выгрузка лидов квиза с ответами в CSV или NDJSON.
+
+Использует ту же выгрузку, что и quiz-api (action=export_leads с X-Admin-Secret),
+но без лимита страницы: строки читаются серверным курсором порциями и сразу
+пишутся в файл, поэтому память не растёт даже на миллионах лидов.
+
+Запуск:
+    DATABASE_URL=postgresql://... python3 scripts/export_leads.py --quiz-id 1 --format csv > leads.csv
+    python3 scripts/export_leads.py --dsn postgresql://... --quiz-id 1 --format ndjson --output leads.ndjson
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+from pathlib import Path
+
+QUIZ_API_PATH = Path(__file__).resolve().parents[1] / 'backend' / 'quiz-api' / 'index.py'
+
+
+def load_quiz_api():
+    """Импортировать backend/quiz-api/index.py как модуль"""
+    spec = importlib.util.spec_from_file_location('quiz_api', QUIZ_API_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Выгрузка лидов квиза')
+    parser.add_argument('--dsn', help='DSN базы (по умолчанию DATABASE_URL)')
+    parser.add_argument('--quiz-id', type=int, required=True)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--after', type=int, default=0, help='Выгружать лиды с id больше указанного')
+    parser.add_argument('--output', help='Файл для выгрузки (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    dsn = args.dsn or os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("❌ Укажи --dsn или DATABASE_URL", file=sys.stderr)
+        sys.exit(1)
+
+    quiz_api = load_quiz_api()
+    conn = quiz_api.db_connect(dsn)
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+
+    started = time.perf_counter()
+    try:
+        result = quiz_api.write_leads_export(conn, args.quiz_id, out, args.format, args.after)
+    finally:
+        if args.output:
+            out.close()
+        quiz_api.db_release(conn)
+
+    print(
+        f"✅ Выгружено лидов: {result['count']} за {round(time.perf_counter() - started, 1)} с "
+        f"(последний id: {result['last_id']})",
+        file=sys.stderr
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -27,8 +27,90 @@ export interface Quiz {
   questions: Question[];
 }
 
+// Дерево квиза для action=create/update: новые вопросы и ответы приходят без id
+export interface QuizDraft extends Omit<Partial<Quiz>, 'questions'> {
+  title: string;
+  slug: string;
+  questions: (Omit<Question, 'id' | 'answers'> & {
+    id?: number;
+    answers: (Omit<Answer, 'id'> & { id?: number })[];
+  })[];
+}
+
+export interface SegmentStats {
+  quiz_id: number;
+  from: string;
+  to: string;
+  total: number;
+  segments: { segment_key: string; leads: number }[];
+  days: { day: string; segment_key: string; leads: number }[];
+  last_lead_id: number | null;
+  refreshed_at: string | null;
+}
+
+export interface AnswerStats {
+  quiz_id: number;
+  from: string | null;
+  to: string | null;
+  questions: {
+    question_id: number;
+    question_text: string;
+    total: number;
+    answers: {
+      answer_id: number;
+      answer_text: string;
+      answer_value: string;
+      responses: number;
+      share: number;
+    }[];
+  }[];
+}
+
+// Сохранение квиза и статистика по лидам — служебные действия quiz-api: нужен заголовок
+// X-Admin-Secret со значением QUIZ_ADMIN_SECRET. Секрет спрашивается один раз и хранится в браузере
+const ADMIN_SECRET_KEY = 'quiz_admin_secret';
+
+function getAdminSecret(): string {
+  let secret = '';
+  try { secret = localStorage.getItem(ADMIN_SECRET_KEY) || ''; } catch {}
+  if (!secret) {
+    secret = window.prompt('Секрет администратора квизов (QUIZ_ADMIN_SECRET)')?.trim() || '';
+    if (secret) {
+      try { localStorage.setItem(ADMIN_SECRET_KEY, secret); } catch {}
+    }
+  }
+  return secret;
+}
+
+async function adminFetch(url: string, init: RequestInit = {}): Promise<Response> {
+  const secret = getAdminSecret();
+  if (!secret) {
+    throw new Error('Нужен секрет администратора');
+  }
+  const response = await fetch(url, {
+    ...init,
+    headers: { ...(init.headers as Record<string, string>), 'X-Admin-Secret': secret },
+  });
+  if (response.status === 401) {
+    // Неверный секрет не запоминаем — при следующем запросе он будет запрошен снова
+    try { localStorage.removeItem(ADMIN_SECRET_KEY); } catch {}
+    throw new Error('Неверный секрет администратора');
+  }
+  return response;
+}
+
 export const quizApi = {
   async getQuiz(slug: string): Promise<Quiz> {
+    // Снапшот квиза, выгруженный deploy-long, nginx отдаёт как статический файл
+    try {
+      const snapshot = await fetch(`/quiz/${encodeURIComponent(slug)}.json`);
+      if (snapshot.ok && snapshot.headers.get('Content-Type')?.includes('application/json')) {
+        return await snapshot.json();
+      }
+    } catch {
+      // Снапшота нет или он недоступен — загружаем из API
+    }
+
     const response = await fetch(`${API_URL}/?action=get&slug=${slug}`);
     if (!response.ok) {
       throw new Error('Quiz not found');
@@ -36,11 +118,66 @@ export const quizApi = {
     return response.json();
   },
 
-  async getAllQuizzes(): Promise<Omit<Quiz, 'questions'>[]> {
-    const response = await fetch(`${API_URL}/?action=list`);
+  async getQuizzesPage(params: {
+    after?: string;
+    limit?: number;
+    fields?: string[];
+    is_active?: boolean;
+  } = {}): Promise<{ items: Omit<Quiz, 'questions'>[]; nextCursor: string | null }> {
+    const query = new URLSearchParams({ action: 'list' });
+    if (params.after) query.set('after', params.after);
+    if (params.limit) query.set('limit', String(params.limit));
+    if (params.fields?.length) query.set('fields', params.fields.join(','));
+    if (params.is_active !== undefined) query.set('is_active', String(params.is_active));
+
+    const response = await fetch(`${API_URL}/?${query.toString()}`);
     if (!response.ok) {
       throw new Error('Failed to load quizzes');
     }
+    return {
+      items: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+    };
+  },
+
+  async getAllQuizzes(): Promise<Omit<Quiz, 'questions'>[]> {
+    const quizzes: Omit<Quiz, 'questions'>[] = [];
+    let after: string | undefined;
+    do {
+      const page = await quizApi.getQuizzesPage({ after, limit: 200 });
+      quizzes.push(...page.items);
+      after = page.nextCursor ?? undefined;
+    } while (after);
+    return quizzes;
+  },
+
+  async getSegmentStats(
+    quizId: number,
+    range: { from?: string; to?: string } = {}
+  ): Promise<SegmentStats> {
+    const query = new URLSearchParams({ action: 'segments', quiz_id: String(quizId) });
+    if (range.from) query.set('from', range.from);
+    if (range.to) query.set('to', range.to);
+
+    const response = await adminFetch(`${API_URL}/?${query.toString()}`);
+    if (!response.ok) {
+      throw new Error('Failed to load segment stats');
+    }
+    return response.json();
+  },
+
+  async getAnswerStats(
+    quizId: number,
+    range: { from?: string; to?: string } = {}
+  ): Promise<AnswerStats> {
+    const query = new URLSearchParams({ action: 'answer_stats', quiz_id: String(quizId) });
+    if (range.from) query.set('from', range.from);
+    if (range.to) query.set('to', range.to);
+
+    const response = await adminFetch(`${API_URL}/?${query.toString()}`);
+    if (!response.ok) {
+      throw new Error('Failed to load answer stats');
+    }
     return response.json();
   },
 
@@ -63,6 +200,23 @@ export const quizApi = {
     return response.json();
   },
 
+  async saveQuiz(quiz: QuizDraft): Promise<Quiz & { success: boolean; version: number }> {
+    // Без id — новый квиз, с id — квиз целиком заменяется присланным деревом
+    const action = quiz.id ? `update&id=${quiz.id}` : 'create';
+    const response = await adminFetch(`${API_URL}/?action=${action}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(quiz),
+    });
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.error || 'Failed to save quiz');
+    }
+    return response.json();
+  },
+
   async createMetrikaGoalsAndSegments(quiz: Quiz): Promise<{
     success: boolean;
     created_goals: Array<{ name: string; id?: number; status: string }>;
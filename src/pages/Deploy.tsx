@@ -63,6 +63,7 @@ export default function Deploy() {
   const [deployedFunctions, setDeployedFunctions] = useState<{ name: string; url: string }[]>([]);
   const [isMigrating, setIsMigrating] = useState<string | null>(null);
   const [isSettingUpSsl, setIsSettingUpSsl] = useState<string | null>(null);
+  const [isRollingBack, setIsRollingBack] = useState<string | null>(null);
   const [sshKeyDialog, setSshKeyDialog] = useState<{ open: boolean; vm: VMInstance | null; sshKey: string | null }>({ open: false, vm: null, sshKey: null });
   const [isLoadingSshKey, setIsLoadingSshKey] = useState(false);
   const [deleteVmDialog, setDeleteVmDialog] = useState<{ open: boolean; vm: VMInstance | null }>({ open: false, vm: null });
@@ -181,6 +182,33 @@ export default function Deploy() {
     }
   };
 
+  const handleRollback = async (configName: string) => {
+    if (!confirm(`Откатить ${configName} на предыдущий релиз?`)) return;
+    setIsRollingBack(configName);
+    try {
+      const resp = await fetch(API_ENDPOINTS.deployLong, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ config_name: configName, action: 'rollback' })
+      });
+      const data = await resp.json();
+      if (data.logs && Array.isArray(data.logs)) {
+        setDeployLogs(data.logs);
+        setDeployLogsTitle(`Откат: ${configName}`);
+        setIsDeployLogsOpen(true);
+      }
+      if (resp.ok) {
+        toast({ title: "✅ Откат выполнен", description: `Текущий релиз: ${String(data.release).slice(0, 7)}` });
+      } else {
+        toast({ title: "Ошибка отката", description: data.error || "Проверь логи", variant: "destructive" });
+      }
+    } catch (error: any) {
+      toast({ title: "Ошибка", description: error.message, variant: "destructive" });
+    } finally {
+      setIsRollingBack(null);
+    }
+  };
+
   const handleSetupSsl = async (configName: string) => {
     const sslUrl = API_ENDPOINTS.setupSsl;
     if (!sslUrl) {
@@ -1568,6 +1596,18 @@ export default function Deploy() {
                             )}
                             {isMigrating === config.name ? 'Миграции...' : 'Миграции'}
                           </Button>
+                          <Button
+                            onClick={() => handleRollback(config.name)}
+                            disabled={isRollingBack === config.name}
+                            className="bg-slate-700 hover:bg-slate-600 text-white font-semibold"
+                          >
+                            {isRollingBack === config.name ? (
+                              <Icon name="Loader2" className="mr-2 h-4 w-4 animate-spin" />
+                            ) : (
+                              <Icon name="RotateCcw" className="mr-2 h-4 w-4" />
+                            )}
+                            {isRollingBack === config.name ? 'Откат...' : 'Откат'}
+                          </Button>
                         </div>
                       </>
                     )}
@@ -119,6 +119,9 @@ export default function QuizBuilder() {
     createMetrikaButton.className = 'bg-blue-600 hover:bg-blue-700 text-white px-4 py-2 rounded mt-2';
     
     try {
+      const saved = await quizApi.saveQuiz(quiz);
+      // id вопросов и ответов нужны, чтобы следующее сохранение обновило их, а не создало заново
+      setQuiz({ ...quiz, id: saved.id, questions: saved.questions });
       toast.success('Квиз сохранен!', {
         description: 'Хотите автоматически создать цели и сегменты в Яндекс.Метрике?',
         action: {
@@ -126,7 +129,7 @@ export default function QuizBuilder() {
           onClick: async () => {
             try {
               toast.loading('Создаю цели и сегменты в Метрике...');
-              const result = await quizApi.createMetrikaGoalsAndSegments(quiz as any);
+              const result = await quizApi.createMetrikaGoalsAndSegments(saved);
               toast.success(`Готово! Создано ${result.created_goals.length} целей и ${result.created_segments.length} сегментов`, {
                 duration: 5000,
               });
@@ -136,9 +139,8 @@ export default function QuizBuilder() {
           }
         }
       });
-      console.log('Quiz data:', quiz);
-    } catch (error) {
-      toast.error('Ошибка сохранения квиза');
+    } catch (error: any) {
+      toast.error(error.message || 'Ошибка сохранения квиза');
       console.error(error);
     }
   };